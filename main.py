@@ -2,6 +2,7 @@ from src.tracker import (
     add_expense,
     list_expenses,
     get_total_expense,
+    get_total_in_currency,
     get_expense_by_category,
     edit_expense,
     delete_expense,
@@ -10,20 +11,19 @@ from src.tracker import (
     export_to_csv,
 )
 from src.validator import validate_amount, validate_date
-from src.report import (
-    get_average_daily_expense,
-    get_average_monthly_expense,
-    get_most_expensive_category,
-    get_days_without_expense,
-)
+from src.report import build_report
 from src.currency import convert_amount
 from src.budget import set_monthly_budget, check_budget_status
 from src.analytics import get_basic_statistics
 from src.notifications import system_alerts
+from src import logger
 from src.logger import log_action, log_error
 from src.users import create_user, login, logout, get_current_user
 from src.charts import chart_by_category, chart_by_month
-from src.backup import create_backup
+from src.backup import create_incremental_backup, load_manifest, restore_backup, write_zip_backup
+from src.aggregates import rebuild_aggregates
+from src.storage import compact_journal, recover
+from src.batch import run_batch, SUMMARY_FILE
 from src.api import start_api_server, stop_api_server
 
 def _require_user():
@@ -52,13 +52,14 @@ def menu():
         print("14. Alertas del sistema")
         print("15. Gráfico por categoría (ASCII)")
         print("16. Gráfico por mes (ASCII)")
-        print("17. Backup (ZIP)")
+        print("17. Backup")
         print("18. API local: iniciar")
         print("19. API local: detener")
         print("20. Usuarios: registrar")
         print("21. Usuarios: login")
         print("22. Usuarios: logout")
-        print("23. Salir")
+        print("23. Mantenimiento")
+        print("24. Salir")
 
         op = input("Seleccione una opción: ")
 
@@ -72,8 +73,9 @@ def menu():
                 fecha = input("Fecha (YYYY-MM-DD, vacío = hoy): ") or None
                 if fecha:
                     validate_date(fecha)
-                add_expense(desc, cat, amt, fecha)
-                log_action("Nuevo gasto", f"{desc} - {cat} - ${amt}")
+                moneda = input("Moneda (COP/USD/EUR, vacío = COP): ").strip() or None
+                exp = add_expense(desc, cat, amt, fecha, moneda)
+                log_action("Nuevo gasto", f"{desc} - {cat} - ${amt} {exp['currency']}")
                 print("✅ Gasto agregado.")
 
             elif op == "2":
@@ -82,8 +84,9 @@ def menu():
                 if not items:
                     print("No hay gastos.")
                 else:
-                    for i, e in enumerate(items):
-                        print(f"{i}. {e['description']} ({e['category']}) - {e['date']}: ${e['amount']}")
+                    for e in items:
+                        moneda = e.get("currency", "COP")
+                        print(f"{e['id']}. {e['description']} ({e['category']}) - {e['date']}: ${e['amount']} {moneda}")
 
             elif op == "3":
                 _require_user()
@@ -96,7 +99,7 @@ def menu():
 
             elif op == "5":
                 _require_user()
-                idx = int(input("Índice a editar: "))
+                expense_id = int(input("ID a editar: "))
                 new_desc = input("Nueva descripción (vacío = igual): ") or None
                 new_cat = input("Nueva categoría (vacío = igual): ") or None
                 new_amt_str = input("Nuevo monto (vacío = igual): ")
@@ -106,14 +109,15 @@ def menu():
                 new_date = input("Nueva fecha (YYYY-MM-DD, vacío = igual): ") or None
                 if new_date:
                     validate_date(new_date)
-                updated = edit_expense(idx, new_desc, new_cat, new_amt, new_date)
+                new_currency = input("Nueva moneda (vacío = igual): ").strip() or None
+                updated = edit_expense(expense_id, new_desc, new_cat, new_amt, new_date, new_currency)
                 log_action("Editar gasto", f"{updated}")
                 print("✅ Actualizado.")
 
             elif op == "6":
                 _require_user()
-                idx = int(input("Índice a eliminar: "))
-                deleted = delete_expense(idx)
+                expense_id = int(input("ID a eliminar: "))
+                deleted = delete_expense(expense_id)
                 log_action("Eliminar gasto", f"{deleted}")
                 print("🗑️ Eliminado.")
 
@@ -138,29 +142,36 @@ def menu():
             elif op == "10":
                 _require_user()
                 print("\n📊 === REPORTES ===")
-                print(f"Promedio diario: ${get_average_daily_expense()}")
-                print(f"Promedio mensual: ${get_average_monthly_expense()}")
-                cat, val = get_most_expensive_category()
-                print(f"Categoría con más gasto: {cat} (${val})")
-                missing = get_days_without_expense()
-                print(f"Días sin gasto (entre min y max): {len(missing)}")
+                rep = build_report()
+                print(f"Promedio diario: ${rep['daily_avg']}")
+                print(f"Promedio mensual: ${rep['monthly_avg']}")
+                print(f"Categoría con más gasto: {rep['top_category']} (${rep['top_category_amount']})")
+                print(f"Días sin gasto (entre min y max): {rep['days_without_expense_count']}")
 
             elif op == "11":
                 _require_user()
-                total = get_total_expense()
                 curr = input("Moneda destino (USD/EUR/COP): ").upper()
-                print(f"💱 {curr}: {convert_amount(total, curr)}")
+                print(f"💱 {curr}: {get_total_in_currency(curr)} (tasa de cada fecha)")
+                print(f"   Con la tasa actual: {convert_amount(get_total_expense(), curr)}")
 
             elif op == "12":
                 _require_user()
                 print("\n💼 === PRESUPUESTO ===")
-                sub = input("[1] Establecer  [2] Ver estado: ")
+                sub = input("[1] Establecer  [2] Ver estado  [3] Límite por categoría: ")
                 if sub == "1":
                     val = float(input("Nuevo presupuesto mensual: "))
                     validate_amount(val)
                     from src.budget import set_monthly_budget
                     data = set_monthly_budget(val)
                     print(f"✅ Presupuesto: ${data['budget']} (desde {data['last_updated']})")
+                elif sub == "3":
+                    cat = input("Categoría: ").strip()
+                    val = float(input("Límite mensual: "))
+                    validate_amount(val)
+                    month = input("Mes (YYYY-MM, vacío = todos): ").strip() or None
+                    from src.budget import set_category_budget
+                    set_category_budget(cat, val, month)
+                    print(f"✅ Límite de {cat}: ${val}")
                 print(check_budget_status())
 
             elif op == "13":
@@ -186,8 +197,24 @@ def menu():
 
             elif op == "17":
                 # backup no requiere sesión, pero es útil tener el contexto
-                z = create_backup()
-                print(f"🧰 Backup creado: {z}")
+                sub = input("[1] ZIP completo  [2] Incremental  [3] Restaurar: ")
+                if sub == "3":
+                    when = input("Restaurar hasta (YYYY-MM-DD [HH:MM:SS], vacío = último): ") or None
+                    who = input("Usuario (vacío = todos): ").strip() or None
+                    r = restore_backup(at=when, user=who)
+                    print(f"♻️ Restaurado desde {r['backup']} ({r['created_at']}): {len(r['restored'])} archivos, "
+                          f"{r['bytes']} bytes verificados")
+                    for name in r["removed"]:
+                        print(f"   🗑️ {name} (posterior al respaldo)")
+                elif sub == "2":
+                    m = create_incremental_backup()
+                    stats = load_manifest(m)["stats"]
+                    print(f"🧰 Backup incremental: {m} ({stats['changed']}/{stats['files']} archivos cambiados, "
+                          f"{stats['bytes_written']} bytes nuevos)")
+                else:
+                    r = write_zip_backup()
+                    print(f"🧰 Backup creado: {r['path']} ({r['files']} archivos, {r['bytes_in']} → {r['bytes_out']} bytes, "
+                          f"{r['throughput_mb_s']} MB/s)")
 
             elif op == "18":
                 msg = start_api_server()
@@ -215,6 +242,23 @@ def menu():
                 print("✅ Sesión cerrada.")
 
             elif op == "23":
+                _require_user()
+                sub = input("[1] Reconstruir agregados  [2] Compactar journal  [3] Análisis de todos los usuarios: ")
+                if sub == "1":
+                    agg = rebuild_aggregates()
+                    print(f"🔧 Agregados reconstruidos: {agg['count']} gastos, total ${agg['total']}")
+                elif sub == "2":
+                    print(f"🔧 Journal compactado: {compact_journal()} gastos vivos")
+                elif sub == "3":
+                    summary = run_batch()
+                    totals = summary["totals"]
+                    print(f"📦 {totals['users']} usuarios, {totals['count']} gastos, total ${totals['total']}")
+                    if totals["over_budget"]:
+                        print(f"🚨 Sobre el presupuesto: {', '.join(totals['over_budget'])}")
+                    print(f"Resumen guardado en {SUMMARY_FILE}")
+
+            elif op == "24":
+                recover()  # deja el arreglo JSON completo para otras herramientas
                 print("👋 Saliendo...")
                 break
 
@@ -226,4 +270,6 @@ def menu():
             print(f"⚠️ Error: {e}")
 
 if __name__ == "__main__":
+    logger.LOG_MODE = "async"  # el menú no espera al disco para registrar acciones
+    recover()  # consolida las operaciones que un corte dejó en el WAL
     menu()
@@ -0,0 +1,373 @@
+import json
+import os
+import threading
+from datetime import date
+from pathlib import Path
+from src import storage, vectorized
+from src.analytics import QuantileSketch, StatsAccumulator
+from src.currency import BASE_CURRENCY, rates_version, to_base_factor
+from src.dates import day_ordinal
+
+# Agregados persistidos por usuario en <usuario>_expenses.agg.json, junto al archivo de gastos.
+# Cada grupo guarda [suma, cantidad] ("by_month_category" por mes y luego categoría), "stats"
+# un StatsAccumulator y "quantiles" sketches de montos del usuario, por categoría y por mes.
+# Los montos se llevan a BASE_CURRENCY con un factor por moneda; "by_currency" conserva las
+# sumas en la moneda original y "rates" la versión de tasas usada. "source" es la clave del
+# archivo de datos con la que coinciden, de modo que un cambio externo provoca una reconstrucción.
+#
+# Las escrituras no reescriben el sidecar: el cambio se aplica en memoria y se agrega una
+# línea a <usuario>_expenses.agg.log con el gasto anterior, el nuevo y las claves de la
+# fuente antes y después. Al leer el sidecar desde disco se reaplican las líneas que
+# encadenan con su "source"; cada AGG_CHECKPOINT_LINES líneas el sidecar se reescribe y el
+# log se vacía.
+AGG_CHECKPOINT_LINES = 500
+
+# Sin sidecar previo, los registros de la fuente se estiman por su tamaño en bytes para
+# decidir si la reconstrucción usa el motor vectorizado (a la baja: mejor estimar de más).
+APPROX_RECORD_BYTES = 100
+
+_lock = threading.RLock()
+_memory = {}  # ruta del sidecar -> agregados
+_log_lines = {}  # ruta del sidecar -> líneas en su log
+
+
+def empty():
+    return {
+        "source": None,
+        "total": 0,
+        "count": 0,
+        "by_category": {},
+        "by_day": {},
+        "by_month": {},
+        "by_month_category": {},
+        "by_currency": {},
+        "rates": None,
+        "stats": StatsAccumulator(),
+        "quantiles": {"all": QuantileSketch(), "by_category": {}, "by_month": {}},
+    }
+
+
+def _bump(groups, key, amount, sign):
+    cell = groups.setdefault(key, [0, 0])
+    cell[0] += sign * amount
+    cell[1] += sign
+    if cell[1] <= 0:
+        del groups[key]
+
+
+def _rates_ok(agg):
+    """Los factores usados siguen vigentes (o todo está en la moneda base)."""
+    return agg["by_currency"].keys() <= {BASE_CURRENCY} or agg["rates"] == rates_version()
+
+
+def _apply_groups(agg, expense, sign, factors=None):
+    currency = expense.get("currency") or BASE_CURRENCY
+    _bump(agg["by_currency"], currency, expense.get("amount", 0), sign)
+    if currency == BASE_CURRENCY:
+        amount = expense.get("amount", 0)
+    else:
+        factor = factors.get(currency) if factors is not None else None
+        if factor is None:
+            factor = to_base_factor(currency)
+            if factors is not None:
+                factors[currency] = factor
+        amount = expense.get("amount", 0) * factor
+    day = expense.get("date", "")
+    agg["total"] += sign * amount
+    agg["count"] += sign
+    _bump(agg["by_category"], expense.get("category", ""), amount, sign)
+    _bump(agg["by_day"], day, amount, sign)
+    _bump(agg["by_month"], day[:7], amount, sign)
+    month_categories = agg["by_month_category"].setdefault(day[:7], {})
+    _bump(month_categories, expense.get("category", ""), amount, sign)
+    if not month_categories:
+        del agg["by_month_category"][day[:7]]
+    _bump_sketches(agg["quantiles"], expense.get("category", ""), day[:7], amount, sign)
+    return amount
+
+
+def _bump_sketches(quantiles, category, month, amount, sign):
+    for group, key in (("all", None), ("by_category", category), ("by_month", month)):
+        if key is None:
+            sketch = quantiles[group]
+        elif sign > 0:
+            sketch = quantiles[group].setdefault(key, QuantileSketch())
+        else:
+            sketch = quantiles[group].get(key)
+            if sketch is None:
+                continue
+        if sign > 0:
+            sketch.add(amount)
+        else:
+            sketch.remove(amount)
+            if key is not None and not sketch.count:
+                del quantiles[group][key]
+
+
+def _all_sketches(quantiles):
+    yield quantiles["all"]
+    yield from quantiles["by_category"].values()
+    yield from quantiles["by_month"].values()
+
+
+def _dump_quantiles(quantiles):
+    return {
+        "all": quantiles["all"].to_dict(),
+        "by_category": {k: v.to_dict() for k, v in quantiles["by_category"].items()},
+        "by_month": {k: v.to_dict() for k, v in quantiles["by_month"].items()},
+    }
+
+
+def _load_quantiles(data):
+    if not data:
+        return empty()["quantiles"]
+    return {
+        "all": QuantileSketch.from_dict(data["all"]),
+        "by_category": {k: QuantileSketch.from_dict(v) for k, v in data["by_category"].items()},
+        "by_month": {k: QuantileSketch.from_dict(v) for k, v in data["by_month"].items()},
+    }
+
+
+def is_stale(agg):
+    """True si algún resumen perdió precisión por bajas y conviene reconstruir."""
+    return agg["stats"].stale or any(sketch.stale for sketch in _all_sketches(agg["quantiles"]))
+
+
+def apply(agg, expense, sign=1, factors=None):
+    """Suma (sign=1) o descuenta (sign=-1) un gasto de los agregados.
+
+    factors es un caché opcional moneda -> factor para recorridos completos.
+    """
+    amount = _apply_groups(agg, expense, sign, factors)
+    if sign > 0:
+        agg["stats"].add(amount)
+    else:
+        agg["stats"].remove(amount)
+    return agg
+
+
+def replace(agg, old, new):
+    """Sustituye un gasto editado por su nueva versión."""
+    agg["stats"].replace(_apply_groups(agg, old, -1), _apply_groups(agg, new, 1))
+    return agg
+
+
+def _apply_change(agg, old, new):
+    if old is not None and new is not None:
+        replace(agg, old, new)
+    elif old is not None:
+        apply(agg, old, -1)
+    elif new is not None:
+        apply(agg, new, 1)
+
+
+def from_records(records):
+    agg = empty()
+    agg["rates"] = rates_version()
+    factors = {}
+    for exp in records:
+        apply(agg, exp, factors=factors)
+    return agg
+
+
+def _sidecar(data_file: Path) -> Path:
+    return data_file.with_suffix(".agg.json")
+
+
+def _log_file(path: Path) -> Path:
+    return path.with_suffix(".log")
+
+
+def _replay_log(path: Path, agg):
+    """Aplica las líneas del log que continúan desde el "source" del sidecar."""
+    count = 0
+    log = _log_file(path)
+    if log.exists():
+        with open(log, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # línea truncada: la cadena se corta y habrá reconstrucción
+                count += 1
+                if entry["before"] == agg["source"]:
+                    _apply_change(agg, entry["old"], entry["new"])
+                    agg["rates"] = entry["rates"]
+                    agg["source"] = entry["after"]
+    _log_lines[path] = count
+
+
+def _read(path: Path):
+    if path in _memory:
+        return _memory[path]
+    if path.exists():
+        try:
+            agg = json.loads(path.read_text(encoding="utf-8"))
+        except json.JSONDecodeError:
+            return None
+        if not empty().keys() <= agg.keys():
+            return None  # formato anterior: se reconstruye
+        agg["stats"] = StatsAccumulator.from_dict(agg.get("stats", {}))
+        agg["quantiles"] = _load_quantiles(agg.get("quantiles"))
+        _replay_log(path, agg)
+        _memory[path] = agg
+        return agg
+    return None
+
+
+def _write(path: Path, agg):
+    tmp = path.with_suffix(".tmp")
+    data = dict(agg, stats=agg["stats"].to_dict(), quantiles=_dump_quantiles(agg["quantiles"]))
+    tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+    _memory[path] = agg
+    _log_file(path).unlink(missing_ok=True)
+    _log_lines[path] = 0
+
+
+def _append_log(path: Path, agg, entry):
+    if _log_lines.get(path, 0) + 1 >= AGG_CHECKPOINT_LINES:
+        _write(path, agg)
+        return
+    with open(_log_file(path), "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    _log_lines[path] = _log_lines.get(path, 0) + 1
+
+
+def _discard(path: Path):
+    _memory.pop(path, None)
+    _log_lines.pop(path, None)
+    _log_file(path).unlink(missing_ok=True)
+    if path.exists():
+        path.unlink()
+
+
+def _on_write(event: storage.WriteEvent):
+    path = _sidecar(event.data_file)
+    with _lock:
+        agg = _read(path)
+        if agg is None:
+            return
+        if event.op == "save" or agg["source"] != _as_key(event.before) or not _rates_ok(agg):
+            # Reemplazo completo o agregados desfasados: se reconstruyen al leerlos
+            _discard(path)
+            return
+        agg["rates"] = rates_version()
+        _apply_change(agg, event.old, event.new)
+        before, agg["source"] = agg["source"], _as_key(event.after)
+        _append_log(path, agg, {
+            "before": before, "after": agg["source"], "rates": agg["rates"], "old": event.old, "new": event.new,
+        })
+
+
+def _as_key(key):
+    return list(key) if key is not None else None
+
+
+storage.subscribe(_on_write)
+
+
+def _expected_rows(data_file):
+    """Registros que se esperan en la fuente: los del sidecar (aunque esté desfasado) o por tamaño."""
+    agg = _read(_sidecar(data_file))
+    if agg is not None:
+        return agg["count"]
+    key = storage.source_key(data_file)
+    return key[1] // APPROX_RECORD_BYTES if key else 0
+
+
+def _from_source(data_file):
+    # La tabla solo se carga si el camino vectorizado va a correr; si no, se recorre en streaming
+    if vectorized.worthwhile(_expected_rows(data_file)):
+        table = storage.load_table(data_file)
+        if vectorized.worthwhile(len(table)):
+            agg = vectorized.aggregate(table)
+            if agg is not None:
+                return agg
+    return from_records(storage.iter_expenses(data_file))
+
+
+def rebuild_aggregates(data_file: Path | None = None):
+    """Recalcula desde cero los agregados del usuario actual o de data_file (recuperación)."""
+    data_file = data_file or storage.current_data_file()
+    with _lock:
+        key = storage.source_key(data_file)
+        agg = _from_source(data_file)
+        agg["source"] = _as_key(key)
+        if key is not None:
+            _write(_sidecar(data_file), agg)
+    return agg
+
+
+def load_aggregates(data_file: Path | None = None):
+    """Agregados del usuario actual (o de data_file); se reconstruyen si no coinciden con los datos."""
+    data_file = data_file or storage.current_data_file()
+    with _lock:
+        agg = _read(_sidecar(data_file))
+        if (
+            agg is not None
+            and agg["source"] == _as_key(storage.source_key(data_file))
+            and not is_stale(agg)
+            and _rates_ok(agg)
+        ):
+            return agg
+    return rebuild_aggregates(data_file)
+
+
+def _iso_week(day):
+    ordinal = day_ordinal(day)
+    if not ordinal:
+        return ""
+    year, week, _ = date.fromordinal(ordinal).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+_BUCKET_KEYS = {
+    "day": lambda day: day,
+    "week": _iso_week,
+    "month": lambda month: month,
+    "year": lambda month: month[:4],
+}
+
+
+def query_buckets(bucket="month", category=None, start=None, end=None, agg=None):
+    """Suma y cantidad por periodo ('day', 'week', 'month' o 'year'), en orden.
+
+    start/end acotan las claves de periodo (inclusive, p. ej. '2024-01'). El filtro por
+    categoría (sin distinguir mayúsculas) solo existe para mes y año. El coste depende de
+    la cantidad de grupos, no de gastos.
+    """
+    if bucket not in _BUCKET_KEYS:
+        raise ValueError(f"Periodo no soportado: {bucket}")
+    agg = agg if agg is not None else load_aggregates()
+    if bucket in ("day", "week"):
+        if category is not None:
+            raise ValueError("El filtro por categoría solo admite periodos de mes o año.")
+        source = agg["by_day"].items()
+    elif category is None:
+        source = agg["by_month"].items()
+    else:
+        wanted = category.lower()
+        source = (
+            (month, cell)
+            for month, categories in agg["by_month_category"].items()
+            for name, cell in categories.items()
+            if name.lower() == wanted
+        )
+    key_of = _BUCKET_KEYS[bucket]
+    buckets = {}
+    for key, (total, count) in source:
+        key = key_of(key)
+        if (start is not None and key < start) or (end is not None and key > end):
+            continue
+        cell = buckets.setdefault(key, [0, 0])
+        cell[0] += total
+        cell[1] += count
+    return dict(sorted(buckets.items()))
+
+
+def category_totals(month=None, agg=None):
+    """Suma por categoría de todo el historial o de un mes 'YYYY-MM'."""
+    agg = agg if agg is not None else load_aggregates()
+    groups = agg["by_category"] if month is None else agg["by_month_category"].get(month, {})
+    return {category: cell[0] for category, cell in groups.items()}
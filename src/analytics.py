@@ -1,16 +1,235 @@
-import statistics
-from src.storage import load_data
+import math
+
+
+class StatsAccumulator:
+    """Acumulador combinable de count/sum/min/max/M2 (Welford) para montos.
+
+    Se alimenta gasto a gasto, admite retirar valores y combinar acumuladores de
+    distintas particiones o usuarios sin guardar los montos.
+    """
+
+    __slots__ = ("count", "total", "min", "max", "mean", "m2", "stale")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.stale = False  # True si se retiró el mínimo o el máximo
+
+    def add(self, amount):
+        self.count += 1
+        self.total += amount
+        if not self.stale:
+            self.min = amount if self.min is None or amount < self.min else self.min
+            self.max = amount if self.max is None or amount > self.max else self.max
+        delta = amount - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (amount - self.mean)
+
+    def remove(self, amount):
+        if self.count <= 1:
+            self.__init__()
+            return
+        previous = (self.mean * self.count - amount) / (self.count - 1)
+        self.m2 = max(self.m2 - (amount - previous) * (amount - self.mean), 0.0)
+        self.mean = previous
+        self.count -= 1
+        self.total -= amount
+        if amount == self.min or amount == self.max:
+            # Sin los montos no se conoce el siguiente extremo: hay que recalcular
+            self.stale = True
+
+    def replace(self, old, new):
+        """Cambia un monto por otro; solo queda desactualizado si el extremo retirado no se repone."""
+        if self.count <= 1:
+            self.__init__()
+            self.add(new)
+            return
+        lost_min = old == self.min and new > old
+        lost_max = old == self.max and new < old
+        stale = self.stale
+        self.remove(old)
+        self.stale = stale or lost_min or lost_max
+        self.add(new)
+
+    def merge(self, other):
+        if not other.count:
+            return self
+        if not self.count:
+            self.count, self.total, self.mean, self.m2 = other.count, other.total, other.mean, other.m2
+            self.min, self.max, self.stale = other.min, other.max, other.stale
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.total += other.total
+        self.min = min(self.min, other.min) if None not in (self.min, other.min) else None
+        self.max = max(self.max, other.max) if None not in (self.max, other.max) else None
+        self.stale = self.stale or other.stale
+        return self
+
+    def result(self):
+        if not self.count:
+            return {"min": 0, "max": 0, "avg": 0, "std_dev": 0}
+        return {
+            "min": self.min,
+            "max": self.max,
+            "avg": round(self.mean, 2),
+            "std_dev": round(math.sqrt(self.m2 / self.count), 2),
+        }
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        acc = cls()
+        for name in cls.__slots__:
+            if name in data:
+                setattr(acc, name, data[name])
+        return acc
+
+    @classmethod
+    def from_amounts(cls, amounts):
+        acc = cls()
+        for amount in amounts:
+            acc.add(amount)
+        return acc
+
+
+class QuantileSketch:
+    """Sketch KLL de cuantiles combinable y de memoria acotada (~3k montos).
+
+    Cada nivel h guarda montos con peso 2**h; cuando un nivel se llena se ordena y
+    se promueve uno de cada dos elementos al nivel siguiente. El error de rango es
+    del orden de 1/k. Las bajas se descuentan exactamente mientras el monto siga en
+    el nivel 0; si no, se cuentan en removed y el sketch queda aproximado.
+    """
+
+    __slots__ = ("k", "count", "removed", "flip", "levels")
+
+    MAX_REMOVED_RATIO = 0.1  # por encima de esto conviene reconstruir
+
+    def __init__(self, k=128):
+        self.k = k
+        self.count = 0
+        self.removed = 0
+        self.flip = 0
+        self.levels = [[]]
+
+    def _capacity(self, h):
+        return max(2, int(self.k * (2 / 3) ** (len(self.levels) - 1 - h)))
+
+    def _compress(self):
+        while sum(len(items) for items in self.levels) > sum(map(self._capacity, range(len(self.levels)))):
+            h = next(h for h, items in enumerate(self.levels) if len(items) >= self._capacity(h))
+            if h + 1 == len(self.levels):
+                self.levels.append([])
+            items = sorted(self.levels[h])
+            keep = items.pop() if len(items) % 2 else None
+            self.flip ^= 1
+            self.levels[h + 1].extend(items[self.flip::2])
+            self.levels[h] = [] if keep is None else [keep]
+
+    def add(self, amount):
+        self.count += 1
+        self.levels[0].append(amount)
+        if len(self.levels[0]) >= self._capacity(0):
+            self._compress()
+
+    def remove(self, amount):
+        self.count -= 1
+        if not self.count:
+            self.__init__(self.k)
+        elif amount in self.levels[0]:
+            self.levels[0].remove(amount)
+        else:
+            self.removed += 1
+
+    @property
+    def stale(self):
+        return self.removed > self.MAX_REMOVED_RATIO * self.count
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for h, items in enumerate(other.levels):
+            self.levels[h].extend(items)
+        self.count += other.count
+        self.removed += other.removed
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        weighted = sorted((x, 1 << h) for h, items in enumerate(self.levels) for x in items)
+        if not weighted:
+            return 0
+        target = q * sum(w for _, w in weighted)
+        seen = 0
+        for x, w in weighted:
+            seen += w
+            if seen >= target:
+                return x
+        return weighted[-1][0]
+
+    def result(self):
+        return {"median": self.quantile(0.5), "p90": self.quantile(0.9), "p99": self.quantile(0.99)}
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data.get("k", 128))
+        for name in cls.__slots__:
+            if name in data:
+                setattr(sketch, name, data[name])
+        return sketch
+
+    @classmethod
+    def from_amounts(cls, amounts):
+        sketch = cls()
+        for amount in amounts:
+            sketch.add(amount)
+        return sketch
+
+    @classmethod
+    def from_sorted(cls, amounts, k=128):
+        """Construye el sketch de una vez a partir de montos ya ordenados."""
+        sketch = cls(k)
+        n = len(amounts)
+        sketch.count = n
+        h = 0
+        while n >> h > k:
+            h += 1
+        step = 1 << h
+        taken = n // step * step
+        sketch.levels = [list(amounts[taken:])] + [[] for _ in range(h)]
+        if h:
+            sketch.levels[h] = list(amounts[step - 1:taken:step])
+        sketch._compress()
+        return sketch
+
 
 def get_basic_statistics():
     """Devuelve datos estadísticos de los montos de gastos."""
-    expenses = load_data()
-    if not expenses:
-        return {"min": 0, "max": 0, "avg": 0, "std_dev": 0}
-    amounts = [exp["amount"] for exp in expenses]
-    stats = {
-        "min": min(amounts),
-        "max": max(amounts),
-        "avg": round(statistics.mean(amounts), 2),
-        "std_dev": round(statistics.pstdev(amounts), 2),
-    }
-    return stats
+    from src.report import build_report
+    return build_report()["stats"]
+
+
+def get_amount_quantiles(category=None, month=None):
+    """Mediana, p90 y p99 aproximados del usuario, de una categoría o de un mes ('YYYY-MM')."""
+    from src.aggregates import load_aggregates
+    quantiles = load_aggregates()["quantiles"]
+    if category is not None:
+        sketch = quantiles["by_category"].get(category)
+    elif month is not None:
+        sketch = quantiles["by_month"].get(month)
+    else:
+        sketch = quantiles["all"]
+    return (sketch or QuantileSketch()).result()
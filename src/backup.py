@@ -1,6 +1,17 @@
-import shutil
-from pathlib import Path
+import glob
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
 from datetime import datetime
+from src import sqlite_store
 
 BACKUPS_DIR = Path("backups")
 DATA_DIR = Path("data")
@@ -12,25 +23,424 @@ INCLUDE_ROOT = [
     Path("app.log"),
 ]
 
-def create_backup():
+# Archivos de data/ que se respaldan: arreglos JSON (y sidecars), journal, WAL, contador de
+# ids (.meta) y SQLite. Las bases SQLite trabajan en modo WAL: en vez de copiar el .db (al
+# que le faltarían las filas que siguen en el -wal) se respalda una copia hecha con la API
+# de backup de SQLite.
+DATA_PATTERNS = ("*.json", "*.jsonl", "*.wal", "*.meta", "*.db")
+
+# Respaldos incrementales: cada archivo se parte en bloques de CHUNK_SIZE bytes que se
+# guardan comprimidos en BACKUPS_DIR/objects/ con su sha256 como nombre, y cada respaldo
+# es solo un manifiesto en BACKUPS_DIR/manifests/ con la lista de bloques de cada archivo.
+# Un bloque que ya existe no se vuelve a escribir, y un archivo con el mismo tamaño y
+# mtime (y los de su -wal, si es SQLite) que en el manifiesto anterior ni siquiera se lee.
+CHUNK_SIZE = 256 * 1024
+
+
+def _backup_sources():
+    """(nombre dentro del respaldo, ruta) de cada archivo a respaldar."""
+    sources = [(p.name, p) for p in INCLUDE_ROOT if p.exists()]
+    if DATA_DIR.exists():
+        seen = set()
+        for pattern in DATA_PATTERNS:
+            for path in sorted(DATA_DIR.glob(pattern)):
+                if path.is_file() and path.name not in seen:
+                    seen.add(path.name)
+                    sources.append((f"data/{path.name}", path))
+    return sources
+
+
+def _readable(path: Path, workdir) -> Path:
+    """Ruta de la que leer el contenido a respaldar (una copia consistente si es SQLite)."""
+    if path.suffix != ".db":
+        return path
+    copy = Path(workdir) / path.name
+    copy.unlink(missing_ok=True)
+    sqlite_store.snapshot(path, copy)
+    return copy
+
+
+def _stamp(path: Path):
+    """Tamaños y mtimes que deciden si un archivo cambió desde el respaldo anterior."""
+    files = [path]
+    if path.suffix == ".db":
+        files.append(path.with_name(path.name + "-wal"))
+    stamp = []
+    for f in files:
+        try:
+            st = f.stat()
+        except FileNotFoundError:
+            continue
+        stamp += [f.name, st.st_size, st.st_mtime_ns]
+    return stamp
+
+
+# El ZIP se escribe en streaming: cada archivo se lee una vez y se comprime (deflate crudo)
+# en un hilo del pool; el hilo principal escribe las entradas en orden a medida que llegan,
+# sin carpeta intermedia. Los archivos de más de ZIP_STREAM_LIMIT bytes los comprime
+# zipfile por bloques para no tenerlos enteros en memoria.
+ZIP_LEVEL = 6
+ZIP_STREAM_LIMIT = 64 * 1024 * 1024
+
+
+def _deflate_file(name, path: Path):
+    """Lee y comprime un archivo; devuelve su ZipInfo (con CRC y tamaños) y los datos."""
+    info = zipfile.ZipInfo.from_file(path, name)
+    info.compress_type = zipfile.ZIP_DEFLATED
+    compressor = zlib.compressobj(ZIP_LEVEL, zlib.DEFLATED, -15)
+    data = path.read_bytes()
+    packed = compressor.compress(data) + compressor.flush()
+    info.file_size = len(data)
+    info.compress_size = len(packed)
+    info.CRC = zlib.crc32(data)
+    return info, packed
+
+
+def _write_entry(zf: zipfile.ZipFile, info: zipfile.ZipInfo, packed: bytes):
+    # Lo mismo que hace ZipFile.write, pero con los datos ya comprimidos
+    info.header_offset = zf.fp.tell()
+    zf.fp.write(info.FileHeader())
+    zf.fp.write(packed)
+    zf.filelist.append(info)
+    zf.NameToInfo[info.filename] = info
+    zf.start_dir = zf.fp.tell()
+
+
+def write_zip_backup(max_workers=None, progress=None):
+    """Crea el ZIP de respaldo y devuelve un reporte con ruta, tamaños y velocidad.
+
+    progress(hechos, total, nombre) se llama tras escribir cada archivo.
+    """
     BACKUPS_DIR.mkdir(exist_ok=True)
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    target_dir = BACKUPS_DIR / f"backup_{ts}"
-    target_dir.mkdir(parents=True, exist_ok=True)
+    zip_path = BACKUPS_DIR / f"backup_{ts}.zip"
+    tmp = zip_path.with_name(zip_path.name + ".tmp")
+    sources = _backup_sources()
+    max_workers = max_workers or min(8, os.cpu_count() or 1)
+    started = time.perf_counter()
+    bytes_in = 0
 
-    # Copia archivos raíz seleccionados
-    for p in INCLUDE_ROOT:
-        if p.exists():
-            shutil.copy2(p, target_dir / p.name)
+    with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED, compresslevel=ZIP_LEVEL) as zf, \
+            ThreadPoolExecutor(max_workers=max_workers) as pool, \
+            tempfile.TemporaryDirectory() as workdir:
+        pending = deque()
+        queue = iter(sources)
+
+        def submit_next():
+            item = next(queue, None)
+            if item is not None:
+                name, path = item
+                path = _readable(path, workdir)
+                large = path.stat().st_size > ZIP_STREAM_LIMIT
+                pending.append((name, path, None if large else pool.submit(_deflate_file, name, path)))
+
+        # Ventana acotada de archivos en vuelo: la memoria no crece con el número de usuarios
+        for _ in range(max_workers * 2):
+            submit_next()
+        done = 0
+        while pending:
+            name, path, future = pending.popleft()
+            submit_next()
+            if future is None:
+                zf.write(path, name)
+                size = zf.getinfo(name).file_size
+            else:
+                info, packed = future.result()
+                _write_entry(zf, info, packed)
+                size = info.file_size
+            bytes_in += size
+            done += 1
+            if progress:
+                progress(done, len(sources), name)
+    os.replace(tmp, zip_path)
+
+    seconds = time.perf_counter() - started
+    return {
+        "path": str(zip_path),
+        "files": len(sources),
+        "bytes_in": bytes_in,
+        "bytes_out": zip_path.stat().st_size,
+        "seconds": round(seconds, 3),
+        "throughput_mb_s": round(bytes_in / 1e6 / seconds, 2) if seconds else 0,
+    }
+
+
+def create_backup():
+    """Crea el ZIP de respaldo y devuelve su ruta."""
+    return write_zip_backup()["path"]
+
+
+# ---------- Respaldos incrementales ----------
+
+def _objects_dir() -> Path:
+    return BACKUPS_DIR / "objects"
+
+
+def _manifests_dir() -> Path:
+    return BACKUPS_DIR / "manifests"
+
+
+def _object_path(digest: str) -> Path:
+    return _objects_dir() / digest[:2] / digest[2:]
+
+
+def _store_chunk(chunk: bytes):
+    """Guarda un bloque si no existe; devuelve (sha256, bytes escritos)."""
+    digest = hashlib.sha256(chunk).hexdigest()
+    path = _object_path(digest)
+    if path.exists():
+        return digest, 0
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = zlib.compress(chunk)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    return digest, len(data)
+
+
+def list_manifests():
+    """Manifiestos de respaldos incrementales, del más antiguo al más reciente."""
+    folder = _manifests_dir()
+    if not folder.exists():
+        return []
+    return sorted(folder.glob("manifest_*.json"))
+
+
+def load_manifest(path: Path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def create_incremental_backup():
+    """Respaldo deduplicado: escribe solo los bloques nuevos y un manifiesto.
+
+    Devuelve la ruta del manifiesto; sus "stats" dicen cuántos archivos cambiaron y
+    cuántos bytes nuevos se escribieron en el almacén de objetos.
+    """
+    manifests = list_manifests()
+    previous = load_manifest(manifests[-1])["files"] if manifests else {}
+    files = {}
+    stats = {"files": 0, "changed": 0, "chunks_written": 0, "bytes_read": 0, "bytes_written": 0}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, path in _backup_sources():
+            stamp = _stamp(path)
+            stats["files"] += 1
+            old = previous.get(name)
+            if old and old.get("stamp") == stamp:
+                files[name] = old  # sin cambios: no se lee el archivo
+                continue
+            stats["changed"] += 1
+            whole = hashlib.sha256()
+            chunks = []
+            size = 0
+            with open(_readable(path, workdir), "rb") as f:
+                while True:
+                    chunk = f.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    whole.update(chunk)
+                    size += len(chunk)
+                    digest, written = _store_chunk(chunk)
+                    chunks.append(digest)
+                    stats["bytes_read"] += len(chunk)
+                    if written:
+                        stats["chunks_written"] += 1
+                        stats["bytes_written"] += written
+            files[name] = {
+                "size": size,
+                "stamp": stamp,
+                "sha256": whole.hexdigest(),
+                "chunks": chunks,
+            }
+
+    now = datetime.now()
+    manifest = {"created_at": now.strftime("%Y-%m-%d %H:%M:%S"), "files": files, "stats": stats}
+    folder = _manifests_dir()
+    folder.mkdir(parents=True, exist_ok=True)
+    path = folder / f"manifest_{now.strftime('%Y%m%d_%H%M%S_%f')}.json"
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, indent=4), encoding="utf-8")
+    os.replace(tmp, path)
+    return str(path)
+
+
+def _iter_backup_chunks(manifest, name):
+    """Bloques de un archivo de un manifiesto, verificados a medida que se leen."""
+    entry = manifest["files"][name]
+    whole = hashlib.sha256()
+    for digest in entry["chunks"]:
+        try:
+            chunk = zlib.decompress(_object_path(digest).read_bytes())
+        except (OSError, zlib.error) as e:
+            raise ValueError(f"Bloque dañado en el respaldo: {digest}") from e
+        if hashlib.sha256(chunk).hexdigest() != digest:
+            raise ValueError(f"Bloque dañado en el respaldo: {digest}")
+        whole.update(chunk)
+        yield chunk
+    if whole.hexdigest() != entry["sha256"]:
+        raise ValueError(f"El archivo {name} no coincide con su checksum.")
+
+
+def read_backup_file(manifest, name):
+    """Contenido de un archivo de un manifiesto, verificado contra su sha256."""
+    return b"".join(_iter_backup_chunks(manifest, name))
+
+
+# ---------- Restauración ----------
+
+_USER_MEMBER = re.compile(r"data/(.+)_expenses\.")
+
+
+def _parse_when(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+        try:
+            parsed = datetime.strptime(value.strip(), fmt)
+        except ValueError:
+            continue
+        # Solo la fecha: vale cualquier respaldo de ese día
+        return parsed if fmt != "%Y-%m-%d" else parsed.replace(hour=23, minute=59, second=59)
+    raise ValueError("Fecha inválida. Use YYYY-MM-DD o YYYY-MM-DD HH:MM:SS.")
+
+
+def list_backups():
+    """(fecha, ruta) de cada respaldo, ZIP o incremental, del más antiguo al más reciente."""
+    found = []
+    candidates = [(p, "backup_", "%Y%m%d_%H%M%S") for p in BACKUPS_DIR.glob("backup_*.zip")]
+    candidates += [(p, "manifest_", "%Y%m%d_%H%M%S_%f") for p in list_manifests()]
+    for path, prefix, fmt in candidates:
+        try:
+            found.append((datetime.strptime(path.stem[len(prefix):], fmt), path))
+        except ValueError:
+            continue  # nombre ajeno a los respaldos
+    return sorted(found)
+
+
+def find_backup(at=None):
+    """Respaldo más reciente creado hasta la fecha indicada (o el último)."""
+    at = _parse_when(at)
+    usable = [item for item in list_backups() if at is None or item[0] <= at]
+    if not usable:
+        raise ValueError("No hay respaldos hasta esa fecha.")
+    return usable[-1]
+
+
+def _inside(base: Path, name: str) -> Path:
+    dest = base / name
+    resolved, root = dest.resolve(), base.resolve()
+    if PurePosixPath(name).is_absolute() or resolved == root or not resolved.is_relative_to(root):
+        raise ValueError(f"Ruta no permitida en el respaldo: {name}")
+    return dest
+
+
+def _destination(name, target_dir):
+    """Ruta donde se restaura un miembro; rechaza nombres que salgan de su directorio."""
+    if target_dir is not None:
+        return _inside(Path(target_dir), name)
+    if name.startswith("data/"):
+        return _inside(DATA_DIR, name[len("data/"):])
+    for path in INCLUDE_ROOT:
+        if path.name == name:
+            return path
+    raise ValueError(f"Ruta no permitida en el respaldo: {name}")
+
+
+def _stage(chunks, dest: Path):
+    """Escribe los bloques en un temporal junto al destino; devuelve (temporal, bytes)."""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(dest.name + ".restore")
+    size = 0
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                size += len(chunk)
+    except Exception:
+        tmp.unlink(missing_ok=True)
+        raise
+    return tmp, size
+
+
+def restore_backup(at=None, user=None, target_dir=None):
+    """Restaura un respaldo (el último hasta 'at') completo o solo los archivos de user.
+
+    Solo se leen los miembros pedidos: del ZIP a través de su directorio central y del
+    respaldo incremental a través de su manifiesto. Cada archivo se verifica mientras se
+    copia (CRC-32 del ZIP o sha256 del manifiesto) a un temporal, y los temporales
+    reemplazan a los actuales solo si todos resultaron válidos. Al restaurar en su sitio,
+    los archivos de ese usuario que no estaban en el respaldo (p. ej. un WAL posterior) y
+    el -wal/-shm de las bases SQLite se eliminan para que no se apliquen sobre lo restaurado.
+    Un miembro cuyo nombre saldría de su directorio (absoluto o con "..") hace fallar la
+    restauración sin tocar ningún archivo.
+    """
+    created, source = find_backup(at)
+    staged = []
+    try:
+        if source.suffix == ".zip":
+            with zipfile.ZipFile(source) as zf:
+                names = _select_members(zf.namelist(), user)
+                for name in names:
+                    with zf.open(name) as src:
+                        chunks = iter(lambda: src.read(CHUNK_SIZE), b"")
+                        staged.append((name, *_stage(chunks, _destination(name, target_dir))))
+        else:
+            manifest = load_manifest(source)
+            names = _select_members(manifest["files"], user)
+            for name in names:
+                staged.append((name, *_stage(_iter_backup_chunks(manifest, name), _destination(name, target_dir))))
+    except (zipfile.BadZipFile, zlib.error) as e:
+        _discard_staged(staged)
+        raise ValueError(f"Respaldo dañado ({source.name}): {e}") from e
+    except Exception:
+        _discard_staged(staged)
+        raise
+
+    if any(name.endswith(".db") for name, _, _ in staged):
+        # Las conexiones abiertas seguirían viendo el inodo viejo y su -wal
+        sqlite_store.close_all()
+    for name, tmp, _ in staged:
+        dest = _destination(name, target_dir)
+        if dest.suffix == ".db":
+            for extra in ("-wal", "-shm"):
+                dest.with_name(dest.name + extra).unlink(missing_ok=True)
+        os.replace(tmp, dest)
+    removed = _remove_newer_files(names) if target_dir is None else []
+    return {
+        "backup": str(source),
+        "created_at": created.strftime("%Y-%m-%d %H:%M:%S"),
+        "restored": names,
+        "removed": removed,
+        "bytes": sum(size for _, _, size in staged),
+    }
+
+
+def _select_members(names, user):
+    if user is None:
+        return sorted(names)
+    wanted = sorted(n for n in names if n.startswith(f"data/{user}_expenses."))
+    if not wanted:
+        raise ValueError(f"El respaldo no tiene archivos del usuario {user}.")
+    return wanted
+
+
+def _discard_staged(staged):
+    for _, tmp, _ in staged:
+        tmp.unlink(missing_ok=True)
 
-    # Copia data/*.json
-    if DATA_DIR.exists():
-        (target_dir / "data").mkdir(exist_ok=True)
-        for jf in DATA_DIR.glob("*.json"):
-            shutil.copy2(jf, target_dir / "data" / jf.name)
 
-    # Comprimir a ZIP
-    zip_path = BACKUPS_DIR / f"backup_{ts}"
-    shutil.make_archive(str(zip_path), "zip", target_dir)
+def _remove_newer_files(names):
+    """Borra los archivos de los usuarios restaurados que no venían en el respaldo.
 
-    return f"{zip_path}.zip"
+    Incluye los derivados que no se respaldan, como el log de agregados (.agg.log).
+    """
+    restored = set(names)
+    users = {m.group(1) for m in map(_USER_MEMBER.match, names) if m}
+    removed = []
+    for user in sorted(users):
+        for path in sorted(DATA_DIR.glob(f"{glob.escape(user)}_expenses.*")):
+            name = f"data/{path.name}"
+            if path.is_file() and name not in restored:
+                path.unlink()
+                removed.append(name)
+    return removed
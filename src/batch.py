@@ -0,0 +1,92 @@
+import json
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from src import users
+from src.aggregates import load_aggregates
+from src.analytics import QuantileSketch, StatsAccumulator
+from src.budget import get_budget_limits
+from src.report import report_from_aggregates
+
+# Análisis por lotes de todos los usuarios de DATA_DIR. Cada usuario se procesa en un
+# proceso aparte con rutas explícitas (sin session.json) y los resultados se combinan
+# en SUMMARY_FILE. Los procesos se crean con "spawn": el CLI tiene hilos (el logger
+# asíncrono) y un fork podría heredar locks tomados.
+
+SUMMARY_FILE = Path("batch_summary.json")
+
+_USER_FILE = re.compile(r"(.+)_expenses\.(json|jsonl|db)$")
+
+
+def discover_users(data_dir: Path | None = None):
+    """Usuarios con archivo de gastos en data_dir (cualquiera de los backends)."""
+    data_dir = data_dir or users.DATA_DIR
+    if not data_dir.exists():
+        return []
+    found = {m.group(1) for m in map(_USER_FILE.match, os.listdir(data_dir)) if m}
+    return sorted(found)
+
+
+def _budget_status(budget, spent):
+    if budget <= 0:
+        return {"status": "Sin presupuesto", "budget": 0, "spent": spent, "remaining": 0}
+    return {
+        "status": "OK" if spent <= budget else "Superado",
+        "budget": budget,
+        "spent": spent,
+        "remaining": max(budget - spent, 0),
+    }
+
+
+def user_report(username, data_file, budget, month):
+    """Reporte de un usuario a partir de su archivo; no depende de la sesión actual."""
+    agg = load_aggregates(Path(data_file))
+    report = report_from_aggregates(agg)
+    return {
+        "user": username,
+        "report": report,
+        "monthly_totals": {m: cell[0] for m, cell in sorted(agg["by_month"].items())},
+        "budget": _budget_status(budget, agg["by_month"].get(month, [0])[0]),
+        # Resúmenes combinables para el total de todos los usuarios
+        "_stats": agg["stats"].to_dict(),
+        "_quantiles": agg["quantiles"]["all"].to_dict(),
+    }
+
+
+def run_batch(max_workers=None, month=None, summary_file: Path | None = None, data_dir: Path | None = None):
+    """Genera el resumen de todos los usuarios en paralelo y lo guarda en summary_file."""
+    data_dir = data_dir or users.DATA_DIR
+    month = month or datetime.now().strftime("%Y-%m")
+    budget = get_budget_limits(month)[0]
+    names = discover_users(data_dir)
+    jobs = [(name, str(data_dir / f"{name}_expenses.json"), budget, month) for name in names]
+
+    stats, quantiles = StatsAccumulator(), QuantileSketch()
+    per_user = {}
+    if jobs:
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            for result in pool.map(user_report, *zip(*jobs)):
+                stats.merge(StatsAccumulator.from_dict(result.pop("_stats")))
+                quantiles.merge(QuantileSketch.from_dict(result.pop("_quantiles")))
+                per_user[result.pop("user")] = result
+
+    summary = {
+        "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "month": month,
+        "users": per_user,
+        "totals": {
+            "users": len(per_user),
+            "count": stats.count,
+            "total": stats.total,
+            "over_budget": sorted(u for u, r in per_user.items() if r["budget"]["status"] == "Superado"),
+            "stats": dict(stats.result(), **quantiles.result()),
+        },
+    }
+    summary_file = summary_file or SUMMARY_FILE
+    tmp = summary_file.with_suffix(".tmp")
+    tmp.write_text(json.dumps(summary, ensure_ascii=False, indent=4), encoding="utf-8")
+    os.replace(tmp, summary_file)
+    return summary
@@ -1,17 +1,37 @@
 import json
 from datetime import datetime
 from pathlib import Path
-from src.storage import load_data
+from src.aggregates import category_totals, query_buckets
 
 BUDGET_FILE = Path("budget.json")
 
-def set_monthly_budget(amount):
-    """Establece un presupuesto mensual general."""
-    data = {"budget": amount, "last_updated": datetime.now().strftime("%Y-%m-%d")}
+# budget.json guarda el presupuesto mensual general en "budget", límites por categoría en
+# "categories" y excepciones para un mes concreto en "months" ({"YYYY-MM": {"budget": ..,
+# "categories": {..}}}). El gasto sale de los contadores por mes y categoría de aggregates,
+# que add/edit/delete actualizan por delta.
+
+def _save_budget(data):
+    data["last_updated"] = datetime.now().strftime("%Y-%m-%d")
     with open(BUDGET_FILE, "w", encoding="utf-8") as f:
         json.dump(data, f, indent=4)
     return data
 
+def set_monthly_budget(amount, month=None):
+    """Establece un presupuesto mensual general (o solo para el mes YYYY-MM indicado)."""
+    data = get_monthly_budget()
+    if month is None:
+        data["budget"] = amount
+    else:
+        data.setdefault("months", {}).setdefault(month, {})["budget"] = amount
+    return _save_budget(data)
+
+def set_category_budget(category, amount, month=None):
+    """Establece el límite mensual de una categoría (o solo para el mes indicado)."""
+    data = get_monthly_budget()
+    target = data if month is None else data.setdefault("months", {}).setdefault(month, {})
+    target.setdefault("categories", {})[category] = amount
+    return _save_budget(data)
+
 def get_monthly_budget():
     """Obtiene el presupuesto mensual actual."""
     if BUDGET_FILE.exists():
@@ -20,24 +40,57 @@ def get_monthly_budget():
     return {"budget": 0, "last_updated": None}
 
 def get_monthly_spent(month=None):
-    """Calcula cuánto se ha gastado en el mes actual o indicado (YYYY-MM)."""
-    expenses = load_data()
-    if not expenses:
-        return 0
+    """Calcula cuánto se ha gastado en el mes actual o indicado (YYYY-MM, o YYYY para el año)."""
     if month is None:
         month = datetime.now().strftime("%Y-%m")
-    total = sum(exp["amount"] for exp in expenses if exp["date"].startswith(month))
-    return total
+    bucket = "year" if len(month) == 4 else "month"
+    return query_buckets(bucket, start=month, end=month).get(month, [0])[0]
+
+def get_budget_limits(month):
+    """Presupuesto general y límites por categoría vigentes en un mes."""
+    data = get_monthly_budget()
+    override = data.get("months", {}).get(month, {})
+    limits = dict(data.get("categories", {}), **override.get("categories", {}))
+    return override.get("budget", data.get("budget", 0)), limits
+
+def get_category_status(month=None):
+    """Estado de cada categoría con límite en el mes: O(categorías), sin recorrer gastos."""
+    if month is None:
+        month = datetime.now().strftime("%Y-%m")
+    _, limits = get_budget_limits(month)
+    spent_by_key = {}
+    for category, spent in category_totals(month).items():
+        key = category.lower()
+        spent_by_key[key] = spent_by_key.get(key, 0) + spent
+    status = []
+    for category, limit in limits.items():
+        spent = spent_by_key.get(category.lower(), 0)
+        status.append({
+            "category": category,
+            "budget": limit,
+            "spent": spent,
+            "remaining": max(limit - spent, 0),
+            "status": "OK" if spent <= limit else "Superado",
+        })
+    return status
 
 def check_budget_status():
     """Verifica si se ha superado el presupuesto."""
-    budget_info = get_monthly_budget()
-    budget = budget_info["budget"]
-    if budget == 0:
+    month = datetime.now().strftime("%Y-%m")
+    budget, limits = get_budget_limits(month)
+    if budget == 0 and not limits:
         return "⚠️ No hay presupuesto establecido."
-    spent = get_monthly_spent()
-    if spent > budget:
-        return f"🚨 Presupuesto superado: ${spent} / ${budget}"
-    else:
-        remaining = budget - spent
-        return f"✅ Presupuesto OK. Gastado ${spent}, disponible ${remaining}"
+    lines = []
+    if budget:
+        spent = get_monthly_spent(month)
+        if spent > budget:
+            lines.append(f"🚨 Presupuesto superado: ${spent} / ${budget}")
+        else:
+            remaining = budget - spent
+            lines.append(f"✅ Presupuesto OK. Gastado ${spent}, disponible ${remaining}")
+    for item in get_category_status(month):
+        if item["status"] == "Superado":
+            lines.append(f"🚨 {item['category']}: ${item['spent']} / ${item['budget']}")
+        else:
+            lines.append(f"✅ {item['category']}: gastado ${item['spent']}, disponible ${item['remaining']}")
+    return "\n".join(lines)
@@ -1,5 +1,4 @@
-from collections import defaultdict
-from src.storage import load_data
+from src.aggregates import category_totals, load_aggregates, query_buckets
 
 def _bar(value, max_value, width=40):
     if max_value <= 0:
@@ -7,28 +6,21 @@ def _bar(value, max_value, width=40):
     length = int((value / max_value) * width)
     return "█" * max(length, 1)
 
-def chart_by_category():
-    expenses = load_data()
-    if not expenses:
+def chart_by_category(month=None):
+    totals = category_totals(month, agg=load_aggregates())
+    if not totals:
         print("No hay datos para graficar.")
         return
-    totals = defaultdict(float)
-    for e in expenses:
-        totals[e["category"]] += e["amount"]
     max_val = max(totals.values())
     print("\n📊 Gastos por categoría:")
     for cat, val in sorted(totals.items(), key=lambda x: x[1], reverse=True):
         print(f"{cat:15} {val:10.2f}  {_bar(val, max_val)}")
 
 def chart_by_month():
-    expenses = load_data()
-    if not expenses:
+    totals = {month: cell[0] for month, cell in query_buckets("month", agg=load_aggregates()).items()}
+    if not totals:
         print("No hay datos para graficar.")
         return
-    totals = defaultdict(float)
-    for e in expenses:
-        month = e["date"][:7]  # YYYY-MM
-        totals[month] += e["amount"]
     max_val = max(totals.values())
     print("\n📆 Gastos por mes:")
     for month, val in sorted(totals.items()):
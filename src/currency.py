@@ -1,5 +1,17 @@
-# Conversor simple de divisas sin conexión (tasas fijas aproximadas)
+# Conversor de divisas sin conexión
 # COP = peso colombiano, USD = dólar, EUR = euro
+#
+# Las tasas históricas se leen de RATES_FILE (CSV con columnas date,currency,rate, donde
+# rate es el valor de 1 COP en esa moneda desde esa fecha). Para una fecha se usa la
+# última tasa vigente; las monedas sin historial usan EXCHANGE_RATES.
+import csv
+from bisect import bisect_right
+from functools import lru_cache
+from pathlib import Path
+from src.dates import day_ordinal
+
+RATES_FILE = Path("rates.csv")
+BASE_CURRENCY = "COP"  # moneda en la que se guardan los agregados
 
 EXCHANGE_RATES = {
     "COP": 1.0,
@@ -7,9 +19,106 @@ EXCHANGE_RATES = {
     "EUR": 0.00023,  # 1 COP = 0.00023 EUR
 }
 
-def convert_amount(amount_cop, target_currency="COP"):
-    """Convierte un monto desde COP a la moneda indicada."""
+_history = {"key": None, "rates": {}}  # moneda -> (ordinales ordenados, tasas)
+
+
+def _file_key():
+    try:
+        stat = RATES_FILE.stat()
+    except FileNotFoundError:
+        return (str(RATES_FILE), None)
+    return (str(RATES_FILE), stat.st_mtime_ns, stat.st_size)
+
+
+def _load_history():
+    """Tabla de tasas por moneda; se relee solo si el CSV cambió."""
+    key = _file_key()
+    if _history["key"] != key:
+        rows = {}
+        if key[1] is not None:
+            with open(RATES_FILE, "r", encoding="utf-8", newline="") as f:
+                for row in csv.DictReader(f):
+                    day = day_ordinal(row.get("date"))
+                    if day:
+                        rows.setdefault(row["currency"].strip().upper(), []).append((day, float(row["rate"])))
+        rates = {}
+        for currency, points in rows.items():
+            points.sort()
+            rates[currency] = ([d for d, _ in points], [r for _, r in points])
+        _history["key"], _history["rates"] = key, rates
+    return _history["key"], _history["rates"]
+
+
+@lru_cache(maxsize=4096)
+def _rate_at(currency, ordinal, version):
+    # version forma parte de la clave para que un CSV nuevo no devuelva tasas viejas
+    _, rates = _load_history()
+    series = rates.get(currency)
+    if series is None:
+        return EXCHANGE_RATES[currency]
+    days, values = series
+    if not ordinal:
+        return values[-1]
+    return values[max(bisect_right(days, ordinal) - 1, 0)]
+
+
+def _check_currency(target_currency):
     target_currency = target_currency.upper()
-    if target_currency not in EXCHANGE_RATES:
+    _, rates = _load_history()
+    if target_currency not in EXCHANGE_RATES and target_currency not in rates:
         raise ValueError("Moneda no soportada. Use COP, USD o EUR.")
-    return round(amount_cop * EXCHANGE_RATES[target_currency], 2)
+    return target_currency
+
+
+def normalize_currency(code):
+    """Código de moneda en mayúsculas; ValueError si no hay tasa para ella."""
+    return _check_currency(code or BASE_CURRENCY)
+
+
+def rates_version():
+    """Identifica la versión de la tabla de tasas (cambia si se edita el CSV)."""
+    return list(_load_history()[0])
+
+
+def to_base_factor(currency, date=None):
+    """Factor para pasar un monto en currency a BASE_CURRENCY."""
+    currency = (currency or BASE_CURRENCY).upper()
+    if currency == BASE_CURRENCY:
+        return 1
+    return 1 / get_rate(currency, date)
+
+
+def get_rate(target_currency, date=None):
+    """Tasa COP -> moneda vigente en la fecha 'YYYY-MM-DD' (la más reciente si no hay fecha)."""
+    target_currency = _check_currency(target_currency)
+    version, _ = _load_history()
+    return _rate_at(target_currency, day_ordinal(date), version)
+
+
+def convert_amount(amount_cop, target_currency="COP", date=None):
+    """Convierte un monto desde COP a la moneda indicada (con la tasa de la fecha, si se da)."""
+    return round(amount_cop * get_rate(target_currency, date), 2)
+
+
+def convert_many(amounts, dates, target_currency="COP", source_currency=BASE_CURRENCY):
+    """Convierte columnas de montos en source_currency con la tasa de la fecha de cada uno.
+
+    dates admite textos 'YYYY-MM-DD' u ordinales de día (como ExpenseTable.days). La
+    moneda se valida y la tabla se carga una vez; cada fecha distinta se busca una sola
+    vez, así que el coste por registro es una consulta a un diccionario.
+    """
+    target_currency = _check_currency(target_currency)
+    source_currency = _check_currency(source_currency)
+    version, _ = _load_history()
+    by_day = {}
+    converted = []
+    for amount, date in zip(amounts, dates):
+        day = date if isinstance(date, int) else day_ordinal(date)
+        rate = by_day.get(day)
+        if rate is None:
+            rate = _rate_at(target_currency, day, version)
+            if source_currency != BASE_CURRENCY:
+                rate /= _rate_at(source_currency, day, version)
+            by_day[day] = rate
+        converted.append(round(amount * rate, 2))
+    return converted
@@ -0,0 +1,50 @@
+from datetime import date
+from functools import lru_cache
+
+# Utilidades de fechas compartidas: los días se manejan como ordinales enteros
+# (date.toordinal) y las fechas 'YYYY-MM-DD' se convierten una sola vez gracias a la caché.
+
+
+@lru_cache(maxsize=8192)
+def _parse(text):
+    if len(text) != 10 or text[4] != "-" or text[7] != "-":
+        return 0
+    year, month, day = text[:4], text[5:7], text[8:]
+    if not (year.isdigit() and month.isdigit() and day.isdigit()):
+        return 0
+    try:
+        return date(int(year), int(month), int(day)).toordinal()
+    except ValueError:
+        return 0
+
+
+def day_ordinal(date_str) -> int:
+    """Convierte 'YYYY-MM-DD' en el ordinal del día (0 si falta o es inválida)."""
+    return _parse(str(date_str)[:10]) if date_str else 0
+
+
+def to_iso(ordinal) -> str:
+    return date.fromordinal(ordinal).isoformat() if ordinal else ""
+
+
+def month_bounds(month_str):
+    """Devuelve el rango [inicio, fin) en ordinales para un mes 'YYYY-MM'."""
+    year, month = (int(part) for part in month_str.split("-"))
+    start = date(year, month, 1)
+    end = date(year + month // 12, month % 12 + 1, 1)
+    return start.toordinal(), end.toordinal()
+
+
+def gap_ranges(ordinals):
+    """Rangos [inicio, fin] (inclusive) de días sin registros entre el primero y el último.
+
+    Se ordenan los días distintos y se miran las diferencias entre vecinos, así que el
+    coste depende de los días con gasto y no de la longitud del periodo.
+    """
+    days = sorted(set(ordinals) - {0})
+    return [(prev + 1, cur - 1) for prev, cur in zip(days, days[1:]) if cur - prev > 1]
+
+
+def gap_days(ranges):
+    """Cantidad total de días contenidos en los rangos de gap_ranges()."""
+    return sum(end - start + 1 for start, end in ranges)
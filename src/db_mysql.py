@@ -7,21 +7,45 @@ import mysql.connector
 from mysql.connector import Error
 
 
+_schema_checked = False
+
+
 def get_connection():
     """Crea y devuelve una conexión MySQL/MariaDB (ajusta user/password si usas credenciales)."""
-    return mysql.connector.connect(
+    conn = mysql.connector.connect(
         host="localhost",
         user="root",  # cambia si tienes otro usuario
         password="",  # pon tu contraseña si la tienes
         database="expense_tracker",
     )
+    if not _schema_checked:
+        ensure_schema(conn)
+    return conn
+
+
+def ensure_schema(conn):
+    """Agrega la columna currency a tablas creadas con el esquema anterior (una vez por proceso)."""
+    global _schema_checked
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT COUNT(*) FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'expenses' AND COLUMN_NAME = 'currency'
+        """
+    )
+    row = cursor.fetchone()
+    if not row or not row[0]:
+        cursor.execute("ALTER TABLE expenses ADD COLUMN currency CHAR(3) NOT NULL DEFAULT 'COP'")
+        conn.commit()
+    cursor.close()
+    _schema_checked = True
 
 
 def get_all_expenses() -> List[Dict[str, Any]]:
     conn = get_connection()
     cursor = conn.cursor(dictionary=True)
     cursor.execute(
-        "SELECT id, date, category, amount, description FROM expenses ORDER BY date DESC, id DESC"
+        "SELECT id, date, category, amount, description, currency FROM expenses ORDER BY date DESC, id DESC"
     )
     rows = [_normalize_row(r) for r in cursor.fetchall()]
     cursor.close()
@@ -33,7 +57,7 @@ def get_expense_by_id(expense_id: int) -> Optional[Dict[str, Any]]:
     conn = get_connection()
     cursor = conn.cursor(dictionary=True)
     cursor.execute(
-        "SELECT id, date, category, amount, description FROM expenses WHERE id = %s",
+        "SELECT id, date, category, amount, description, currency FROM expenses WHERE id = %s",
         (expense_id,),
     )
     raw = cursor.fetchone()
@@ -43,15 +67,41 @@ def get_expense_by_id(expense_id: int) -> Optional[Dict[str, Any]]:
     return row if row else None
 
 
-def insert_expense(date_: str, category: str, amount: float, description: Optional[str]) -> int:
+def get_last_expense_date() -> Optional[str]:
+    conn = get_connection()
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("SELECT MAX(date) AS date FROM expenses")
+    raw = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    return _normalize_row(raw)["date"] if raw else None
+
+
+
+def get_month_spent_by_currency(start: str, end: str) -> Dict[str, float]:
+    """Suma de gastos por moneda con fecha en [start, end) ('YYYY-MM-DD')."""
+    conn = get_connection()
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute(
+        "SELECT currency, SUM(amount) AS total FROM expenses WHERE date >= %s AND date < %s GROUP BY currency",
+        (start, end),
+    )
+    rows = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    return {row["currency"] or "COP": float(row["total"] or 0) for row in rows}
+
+def insert_expense(
+    date_: str, category: str, amount: float, description: Optional[str], currency: str = "COP"
+) -> int:
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
         """
-        INSERT INTO expenses (date, category, amount, description)
-        VALUES (%s, %s, %s, %s)
+        INSERT INTO expenses (date, category, amount, description, currency)
+        VALUES (%s, %s, %s, %s, %s)
         """,
-        (date_, category, amount, description),
+        (date_, category, amount, description, currency),
     )
     conn.commit()
     new_id = cursor.lastrowid
@@ -61,17 +111,22 @@ def insert_expense(date_: str, category: str, amount: float, description: Option
 
 
 def update_expense(
-    expense_id: int, date_: str, category: str, amount: float, description: Optional[str]
+    expense_id: int,
+    date_: str,
+    category: str,
+    amount: float,
+    description: Optional[str],
+    currency: str = "COP",
 ) -> bool:
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
         """
         UPDATE expenses
-        SET date = %s, category = %s, amount = %s, description = %s
+        SET date = %s, category = %s, amount = %s, description = %s, currency = %s
         WHERE id = %s
         """,
-        (date_, category, amount, description, expense_id),
+        (date_, category, amount, description, currency, expense_id),
     )
     conn.commit()
     updated = cursor.rowcount > 0
@@ -1,35 +1,173 @@
-﻿import logging
-import os
+﻿import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
 
 LOG_FILE = "app.log"
 
+# Modo "sync" escribe en el hilo que registra; "async" encola el registro y un hilo de fondo
+# lo escribe por lotes (al juntar LOG_BATCH_SIZE registros o pasados LOG_FLUSH_INTERVAL
+# segundos), así add_expense y compañía no esperan al disco.
+LOG_MODE = "sync"
+LOG_FORMAT = "text"  # "json" escribe una línea JSON por registro
+LOG_MAX_BYTES = 0  # rotación por tamaño (0 = sin rotar)
+LOG_ROTATE_WHEN = None  # rotación por tiempo, p. ej. "midnight" (ver TimedRotatingFileHandler)
+LOG_BACKUP_COUNT = 5
+LOG_BATCH_SIZE = 100
+LOG_FLUSH_INTERVAL = 0.5
+
+_DATEFMT = "%Y-%m-%d %H:%M:%S"
+
 _logger = logging.getLogger("expense_tracker")
 _logger.setLevel(logging.INFO)
 
+_state = {"key": None, "writer": None}
+_config_lock = threading.Lock()
+
+
+class _JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro; incluye action/details cuando vienen de log_action."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, _DATEFMT),
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        for field in ("action", "details"):
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _BatchWriter(threading.Thread):
+    """Hilo que vacía la cola de registros y los escribe por lotes en el handler real."""
+
+    def __init__(self, handler):
+        super().__init__(name="log-writer", daemon=True)
+        self.handler = handler
+        self.queue = queue.SimpleQueue()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            batch, markers = [], []
+            deadline = time.monotonic() + LOG_FLUSH_INTERVAL
+            while True:
+                if item is None or isinstance(item, threading.Event):
+                    markers.append(item)
+                    break  # flush o cierre: escribir ya lo acumulado
+                batch.append(item)
+                remaining = deadline - time.monotonic()
+                if len(batch) >= LOG_BATCH_SIZE or remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            self._write(batch)
+            for marker in markers:
+                if marker is None:
+                    self.handler.close()
+                    return
+                marker.set()
+
+    def _write(self, batch):
+        # Se escribe en el buffer del stream y se vacía una vez por lote; la posición del
+        # stream ya incluye lo escrito, así que la rotación por tamaño la ve
+        handler = self.handler
+        rotating = isinstance(handler, logging.handlers.BaseRotatingHandler)
+        for record in batch:
+            try:
+                if rotating and handler.shouldRollover(record):
+                    handler.doRollover()
+                handler.stream.write(handler.format(record) + handler.terminator)
+            except Exception:
+                handler.handleError(record)
+        if batch and handler.stream is not None:
+            handler.stream.flush()
+
+    def flush(self, timeout=None):
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def stop(self):
+        self.queue.put(None)
+        self.join()
+
+
+def _build_handler():
+    if LOG_ROTATE_WHEN:
+        handler = logging.handlers.TimedRotatingFileHandler(
+            LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+    elif LOG_MAX_BYTES:
+        handler = logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+    else:
+        handler = logging.FileHandler(LOG_FILE, encoding="utf-8")
+    if LOG_FORMAT == "json":
+        handler.setFormatter(_JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(fmt="%(asctime)s [%(levelname)s] %(message)s", datefmt=_DATEFMT))
+    return handler
+
+
+def _reset_handlers():
+    writer = _state["writer"]
+    if writer is not None:
+        writer.stop()
+        _state["writer"] = None
+    for h in list(_logger.handlers):
+        _logger.removeHandler(h)
+        h.close()
+    _state["key"] = None
+
 
 def _ensure_handler():
     """Configura el handler para que use el LOG_FILE actual (soporta monkeypatch en tests)."""
-    expected_path = os.path.abspath(LOG_FILE)
-    needs_handler = True
-    for h in list(_logger.handlers):
-        if getattr(h, "baseFilename", None) == expected_path:
-            needs_handler = False
+    key = (LOG_FILE, LOG_MODE, LOG_FORMAT, LOG_MAX_BYTES, LOG_ROTATE_WHEN, LOG_BACKUP_COUNT)
+    if _state["key"] == key:
+        return  # camino rápido: una comparación de tupla por registro
+    with _config_lock:
+        if _state["key"] == key:
+            return
+        _reset_handlers()
+        handler = _build_handler()
+        if LOG_MODE == "async":
+            writer = _BatchWriter(handler)
+            writer.start()
+            _state["writer"] = writer
+            _logger.addHandler(logging.handlers.QueueHandler(writer.queue))
         else:
-            _logger.removeHandler(h)
-    if needs_handler:
-        handler = logging.FileHandler(LOG_FILE, encoding="utf-8")
-        formatter = logging.Formatter(
-            fmt="%(asctime)s [%(levelname)s] %(message)s",
-            datefmt="%Y-%m-%d %H:%M:%S",
-        )
-        handler.setFormatter(formatter)
-        _logger.addHandler(handler)
+            _logger.addHandler(handler)
+        _state["key"] = key
+
+
+def flush_logs(timeout=5.0):
+    """Espera a que el hilo de fondo escriba lo encolado (no hace nada en modo sync)."""
+    writer = _state["writer"]
+    return writer.flush(timeout) if writer is not None else True
+
+
+def shutdown_logs():
+    """Escribe lo pendiente y cierra los handlers."""
+    with _config_lock:
+        _reset_handlers()
+
+
+atexit.register(shutdown_logs)
 
 
 def log_action(action, details=""):
     """Registra una accion en el log."""
     _ensure_handler()
-    _logger.info(f"{action}: {details}")
+    _logger.info(f"{action}: {details}", extra={"action": action, "details": details})
 
 
 def log_error(error_message):
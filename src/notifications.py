@@ -1,18 +1,174 @@
-from datetime import datetime, timedelta
-from src.storage import load_data
-from src.budget import check_budget_status
+import threading
+from collections import deque
+from datetime import datetime
+from src import budget, storage
+from src.aggregates import category_totals, load_aggregates
+from src.budget import check_budget_status, get_budget_limits, get_monthly_spent
+from src.currency import to_base_factor
+from src.logger import log_error
+
+# Motor de alertas dirigido por eventos: se suscribe a las escrituras de storage, guarda en
+# memoria la fecha del último gasto y evalúa reglas solo sobre el gasto que cambió. Las
+# alertas generadas esperan en una cola hasta que alguien las lee.
+
+MAX_PENDING = 100
+
+
+def _last_day_from_aggregates():
+    days = [day for day in load_aggregates()["by_day"] if day]
+    return max(days) if days else None
+
+
+def _base_amount(expense):
+    """Monto del gasto en BASE_CURRENCY, la moneda de los agregados y presupuestos."""
+    if not expense:
+        return 0
+    return expense.get("amount", 0) * to_base_factor(expense.get("currency"))
+
+
+def budget_crossed_rule(event, engine):
+    """Avisa cuando un gasto del mes hace superar el presupuesto general."""
+    new = event.new
+    month = datetime.now().strftime("%Y-%m")
+    if new is None or not new.get("date", "").startswith(month):
+        return None
+    limit, _ = engine.thresholds(month)
+    if not limit:
+        return None
+    spent = get_monthly_spent(month)
+    delta = _base_amount(new) - _base_amount(event.old)
+    if spent > limit >= spent - delta:
+        return f"🚨 Presupuesto superado: ${spent} / ${limit}"
+    return None
+
+
+def category_over_budget_rule(event, engine):
+    """Avisa cuando una categoría cruza su límite del mes con este gasto."""
+    new = event.new
+    month = datetime.now().strftime("%Y-%m")
+    if new is None or not new.get("date", "").startswith(month):
+        return None
+    _, limits = engine.thresholds(month)
+    wanted = new.get("category", "").lower()
+    limit = next((amount for name, amount in limits.items() if name.lower() == wanted), None)
+    if limit is None:
+        return None
+    spent = sum(total for name, total in category_totals(month).items() if name.lower() == wanted)
+    delta = _base_amount(new) - _base_amount(event.old)
+    if spent > limit >= spent - delta:
+        return f"🚨 {new.get('category')} superó su límite: ${spent} / ${limit}"
+    return None
+
+
+def spending_spike_rule(factor=3.0, min_count=5):
+    """Regla que avisa de un gasto mucho mayor que el promedio del usuario."""
+    def rule(event, engine):
+        if event.new is None:
+            return None
+        stats = load_aggregates()["stats"]
+        amount = _base_amount(event.new)
+        if stats.count >= min_count and amount > factor * stats.mean:
+            return f"📈 Gasto inusual: ${round(amount, 2)} en {event.new.get('category')} (promedio ${round(stats.mean, 2)})"
+        return None
+    return rule
+
+
+class AlertEngine:
+    """Mantiene el estado de alertas y evalúa reglas por cada escritura.
+
+    Las reglas son funciones (evento, motor) -> texto o None; se agregan con add_rule.
+    last_date_loader calcula la fecha del último gasto cuando el estado no sirve
+    (arranque, otro usuario, borrado del último gasto o reemplazo completo).
+    """
+
+    def __init__(self, rules=None, last_date_loader=_last_day_from_aggregates, data_file_getter=None):
+        self.rules = list(rules or [])
+        self.pending = deque(maxlen=MAX_PENDING)
+        self._last_date_loader = last_date_loader
+        self._data_file_getter = data_file_getter
+        self._data_file = None
+        self._last_date = None
+        self._dirty = True
+        self._thresholds = (None, None)
+        self._lock = threading.Lock()
+
+    def add_rule(self, rule):
+        self.rules.append(rule)
+        return rule
+
+    def reset(self):
+        with self._lock:
+            self._dirty = True
+            self.pending.clear()
+
+    def thresholds(self, month):
+        """Límites de presupuesto del mes; se releen solo si budget.json cambió."""
+        try:
+            stamp = budget.BUDGET_FILE.stat().st_mtime_ns
+        except FileNotFoundError:
+            stamp = None
+        key = (month, str(budget.BUDGET_FILE), stamp)
+        if self._thresholds[0] != key:
+            self._thresholds = (key, get_budget_limits(month))
+        return self._thresholds[1]
+
+    def _current_file(self):
+        return self._data_file_getter() if self._data_file_getter else None
+
+    def observe(self, event):
+        """Actualiza el estado con un storage.WriteEvent (u objeto con op, old y new)."""
+        data_file = getattr(event, "data_file", None)
+        with self._lock:
+            if data_file != self._data_file or event.op in ("save", "compact"):
+                self._dirty = True
+            elif not self._dirty:
+                old_day = (event.old or {}).get("date") or None
+                new_day = (event.new or {}).get("date") or None
+                if old_day is not None and old_day == self._last_date and (new_day or "") < old_day:
+                    self._dirty = True  # se movió o borró el último gasto
+                elif new_day is not None and (self._last_date is None or new_day > self._last_date):
+                    self._last_date = new_day
+        if event.op in ("save", "compact"):
+            return
+        for rule in self.rules:
+            try:
+                alert = rule(event, self)
+            except Exception as e:  # una regla rota no debe afectar la escritura
+                log_error(f"Regla de alerta {getattr(rule, '__name__', rule)}: {e}")
+                continue
+            if alert:
+                self.pending.append(alert)
+
+    def last_expense_date(self):
+        current = self._current_file()
+        with self._lock:
+            if self._dirty or current != self._data_file:
+                self._last_date = self._last_date_loader()
+                self._data_file = current
+                self._dirty = False
+            return self._last_date
+
+    def drain(self):
+        """Devuelve y vacía las alertas pendientes."""
+        with self._lock:
+            alerts = list(self.pending)
+            self.pending.clear()
+        return alerts
+
+
+engine = AlertEngine(
+    rules=[budget_crossed_rule, category_over_budget_rule, spending_spike_rule()],
+    data_file_getter=storage.current_data_file,
+)
+storage.subscribe(engine.observe)
+
 
 def get_last_expense_date():
     """Devuelve la fecha del último gasto registrado."""
-    expenses = load_data()
-    if not expenses:
-        return None
-    last = max(exp["date"] for exp in expenses)
-    return last
+    return engine.last_expense_date()
 
-def check_inactivity_alert(days=3):
-    """Alerta si no se han registrado gastos en los últimos N días."""
-    last_date = get_last_expense_date()
+
+def inactivity_message(last_date, days=3):
     if not last_date:
         return "⚠️ No hay gastos registrados."
     last_dt = datetime.strptime(last_date, "%Y-%m-%d")
@@ -22,9 +178,16 @@ def check_inactivity_alert(days=3):
     else:
         return "✅ Actividad reciente registrada."
 
+
+def check_inactivity_alert(days=3):
+    """Alerta si no se han registrado gastos en los últimos N días."""
+    return inactivity_message(get_last_expense_date(), days)
+
+
 def system_alerts():
-    """Combina alertas de presupuesto e inactividad."""
+    """Combina alertas de presupuesto e inactividad con las pendientes del motor."""
     alerts = []
     alerts.append(check_budget_status())
     alerts.append(check_inactivity_alert())
+    alerts.extend(engine.drain())
     return alerts
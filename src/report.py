@@ -1,43 +1,61 @@
-from datetime import datetime, timedelta
-from src.storage import load_data
+from src.aggregates import load_aggregates, from_records
+from src.currency import to_base_factor
+from src.dates import day_ordinal, gap_days, gap_ranges, to_iso
+
+def build_report(expenses=None):
+    """Calcula todas las métricas de reportes y estadísticas en un solo recorrido.
+
+    Sin argumentos se usan los agregados persistidos del usuario (el recorrido es
+    por grupos, no por gastos); con una lista se agregan esos gastos una vez.
+    """
+    return report_from_aggregates(load_aggregates() if expenses is None else from_records(expenses))
+
+def report_from_aggregates(agg):
+    """Métricas de reporte a partir de unos agregados ya cargados."""
+    if not agg["count"]:
+        return {
+            "total": 0,
+            "count": 0,
+            "daily_avg": 0,
+            "monthly_avg": 0,
+            "top_category": None,
+            "top_category_amount": 0,
+            "days_without_expense": [],
+            "days_without_expense_count": 0,
+            "by_currency": {},
+            "stats": dict(agg["stats"].result(), **agg["quantiles"]["all"].result()),
+        }
+    # Cada moneda se convierte una vez sobre su suma, no gasto a gasto
+    total = sum(cell[0] * to_base_factor(code) for code, cell in agg["by_currency"].items())
+    by_category = agg["by_category"]
+    top_category = max(by_category, key=lambda cat: by_category[cat][0])
+    gaps = gap_ranges(day_ordinal(day) for day in agg["by_day"])
+    return {
+        "total": total,
+        "count": agg["count"],
+        "daily_avg": round(total / len(agg["by_day"]), 2),
+        "monthly_avg": round(total / len(agg["by_month"]), 2),
+        "top_category": top_category,
+        "top_category_amount": by_category[top_category][0],
+        "days_without_expense": [(to_iso(start), to_iso(end)) for start, end in gaps],
+        "days_without_expense_count": gap_days(gaps),
+        "by_currency": {code: cell[0] for code, cell in agg["by_currency"].items()},
+        "stats": dict(agg["stats"].result(), **agg["quantiles"]["all"].result()),
+    }
 
 def get_average_daily_expense():
     """Calcula el gasto promedio diario."""
-    expenses = load_data()
-    if not expenses:
-        return 0
-    dates = {exp["date"] for exp in expenses}
-    total = sum(exp["amount"] for exp in expenses)
-    return round(total / len(dates), 2)
+    return build_report()["daily_avg"]
 
 def get_average_monthly_expense():
     """Calcula el gasto promedio mensual."""
-    expenses = load_data()
-    if not expenses:
-        return 0
-    months = {exp["date"][:7] for exp in expenses}
-    total = sum(exp["amount"] for exp in expenses)
-    return round(total / len(months), 2)
+    return build_report()["monthly_avg"]
 
 def get_most_expensive_category():
     """Devuelve la categoría con mayor gasto acumulado."""
-    expenses = load_data()
-    if not expenses:
-        return None, 0
-    totals = {}
-    for e in expenses:
-        cat = e["category"]
-        totals[cat] = totals.get(cat, 0) + e["amount"]
-    top_cat = max(totals, key=totals.get)
-    return top_cat, totals[top_cat]
+    report = build_report()
+    return report["top_category"], report["top_category_amount"]
 
 def get_days_without_expense():
-    """Detecta días sin gasto entre la fecha mínima y máxima."""
-    expenses = load_data()
-    if not expenses:
-        return []
-    # Convertir fechas a objetos datetime
-    dates = sorted({datetime.strptime(exp["date"], "%Y-%m-%d") for exp in expenses})
-    start, end = dates[0], dates[-1]
-
-    # Generar todas las fechas entre in
+    """Rangos (inicio, fin) de días sin gasto entre la fecha mínima y máxima."""
+    return build_report()["days_without_expense"]
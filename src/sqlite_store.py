@@ -0,0 +1,164 @@
+import json
+import sqlite3
+import threading
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS expenses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    description TEXT,
+    category TEXT,
+    amount REAL NOT NULL DEFAULT 0,
+    date TEXT,
+    currency TEXT NOT NULL DEFAULT 'COP'
+);
+CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses (date);
+"""
+
+_COLUMNS = "id, description, category, amount, date, currency"
+
+_lock = threading.RLock()
+_connections = {}
+
+
+def _row_values(expense):
+    return (
+        expense.get("description", ""),
+        expense.get("category", ""),
+        expense.get("amount", 0),
+        expense.get("date", ""),
+        expense.get("currency") or "COP",
+    )
+
+
+def _to_record(row):
+    return {
+        "id": row[0], "description": row[1], "category": row[2], "amount": row[3], "date": row[4],
+        "currency": row[5],
+    }
+
+
+def _migrate(conn):
+    """Agrega columnas nuevas a bases creadas con un esquema anterior."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(expenses)")}
+    if "currency" not in columns:
+        conn.execute("ALTER TABLE expenses ADD COLUMN currency TEXT NOT NULL DEFAULT 'COP'")
+    # Los totales por categoría salen de los agregados: el índice (y la columna category_key,
+    # que queda sin uso en bases anteriores) solo encarecían las escrituras
+    conn.execute("DROP INDEX IF EXISTS idx_expenses_category")
+
+
+def connect(db_file: Path, legacy_json: Path | None = None):
+    """Abre (una sola vez por archivo) la base SQLite en modo WAL."""
+    with _lock:
+        conn = _connections.get(db_file)
+        if conn is not None:
+            return conn
+        is_new = not db_file.exists()
+        conn = sqlite3.connect(db_file, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _migrate(conn)
+        if is_new and legacy_json is not None and legacy_json.exists():
+            # Migra el archivo JSON existente la primera vez
+            try:
+                legacy = json.loads(legacy_json.read_text(encoding="utf-8") or "[]")
+            except json.JSONDecodeError:
+                legacy = []
+            _insert_many(conn, legacy)
+        conn.commit()
+        _connections[db_file] = conn
+        return conn
+
+
+def snapshot(db_file: Path, dest: Path):
+    """Copia consistente de la base en dest, incluidas las páginas que siguen en el -wal."""
+    source = sqlite3.connect(db_file)
+    try:
+        target = sqlite3.connect(dest)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+    finally:
+        source.close()
+
+
+def close_all():
+    with _lock:
+        for conn in _connections.values():
+            conn.close()
+        _connections.clear()
+
+
+def _insert_many(conn, expenses):
+    conn.executemany(
+        "INSERT INTO expenses (id, description, category, amount, date, currency) VALUES (?, ?, ?, ?, ?, ?)",
+        [(e.get("id"),) + _row_values(e) for e in expenses],
+    )
+
+
+def load(conn):
+    with _lock:
+        rows = conn.execute(f"SELECT {_COLUMNS} FROM expenses ORDER BY id").fetchall()
+    return [_to_record(r) for r in rows]
+
+
+def iter_rows(conn):
+    """Recorre los gastos sin materializarlos todos (cursor perezoso)."""
+    cursor = conn.execute(f"SELECT {_COLUMNS} FROM expenses ORDER BY id")
+    for row in cursor:
+        yield _to_record(row)
+
+
+def get(conn, expense_id):
+    with _lock:
+        row = conn.execute(f"SELECT {_COLUMNS} FROM expenses WHERE id = ?", (expense_id,)).fetchone()
+    return _to_record(row) if row else None
+
+
+def save(conn, expenses):
+    with _lock, conn:
+        conn.execute("DELETE FROM expenses")
+        _insert_many(conn, expenses)
+
+
+def append(conn, expense):
+    """Inserta un gasto y devuelve su id (AUTOINCREMENT: nunca se reutiliza)."""
+    with _lock, conn:
+        cursor = conn.execute(
+            "INSERT INTO expenses (description, category, amount, date, currency) VALUES (?, ?, ?, ?, ?)",
+            _row_values(expense),
+        )
+    return cursor.lastrowid
+
+
+def replace(conn, expense_id, expense):
+    with _lock, conn:
+        cursor = conn.execute(
+            """
+            UPDATE expenses
+            SET description = ?, category = ?, amount = ?, date = ?, currency = ?
+            WHERE id = ?
+            """,
+            _row_values(expense) + (expense_id,),
+        )
+    return cursor.rowcount > 0
+
+
+def delete(conn, expense_id):
+    with _lock, conn:
+        cursor = conn.execute("DELETE FROM expenses WHERE id = ?", (expense_id,))
+    return cursor.rowcount > 0
+
+
+def select_between(conn, start: str, end: str):
+    """Gastos con fecha en [start, end) usando el índice por fecha."""
+    with _lock:
+        rows = conn.execute(
+            f"SELECT {_COLUMNS} FROM expenses WHERE date >= ? AND date < ? ORDER BY date, id",
+            (start, end),
+        ).fetchall()
+    return [_to_record(r) for r in rows]
+
@@ -1,17 +1,279 @@
 import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
 from pathlib import Path
+from typing import NamedTuple
+from src import sqlite_store
+from src.table import ExpenseTable
 from src.users import get_current_user, get_expenses_file_for_user
 
 DEFAULT_FILE = Path("expenses.json")
 
+# "json": un arreglo JSON que se reescribe completo en cada cambio.
+# "journal": un registro por línea (JSONL) con escrituras O(1) y compactación en segundo plano.
+# "sqlite": base SQLite (WAL) con índices por fecha y categoría.
+STORAGE_BACKEND = os.environ.get("EXPENSES_BACKEND", "json")
+
+# Con JSON_WAL (activo por defecto; EXPENSES_WAL=0 lo apaga) el backend "json" no reescribe el
+# arreglo en cada alta, edición o borrado: la operación se agrega a <datos>.wal y las escrituras
+# seguidas comparten un mismo fsync (group commit). Cada WAL_CHECKPOINT_LINES operaciones el
+# arreglo se reescribe (temporal + rename) y el WAL se vacía. Al cargar, un WAL pendiente se
+# reaplica aunque el modo esté apagado; recover() lo consolida en el arreglo.
+JSON_WAL = os.environ.get("EXPENSES_WAL", "1") == "1"
+WAL_CHECKPOINT_LINES = 1000
+WAL_GROUP_COMMIT_WINDOW = 0.0  # segundos que el líder espera a más escrituras antes del fsync
+
+# La compactación se dispara cuando el journal supera COMPACT_MIN_LINES líneas
+# y tiene más de COMPACT_RATIO líneas por cada registro vivo.
+COMPACT_MIN_LINES = 1000
+COMPACT_RATIO = 2.0
+
+# Tamaño de lectura de iter_expenses() sobre el arreglo JSON.
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Instantáneas ya parseadas por archivo, validadas con (mtime_ns, tamaño).
+CACHE_MAX_FILES = 32
+
+_write_lock = threading.RLock()
+_journal_stats = {}  # ruta -> [líneas, registros vivos]
+_cache_lock = threading.Lock()
+_cache = OrderedDict()  # ruta -> _Snapshot
+_listeners = []
+_wal_logs = {}  # ruta del WAL -> _WalLog
+
+
+class WriteEvent(NamedTuple):
+    """Cambio ya persistido. En "save" (reemplazo completo) old y new son None."""
+
+    op: str  # "add" | "set" | "del" | "save" | "compact"
+    data_file: Path
+    old: dict | None
+    new: dict | None
+    before: tuple | None  # clave (mtime_ns, tamaño...) de la fuente antes de escribir
+    after: tuple | None
+
+
 def _get_data_file() -> Path:
     user = get_current_user()
     if user:
         return get_expenses_file_for_user(user)
     return DEFAULT_FILE
 
-def load_data():
-    data_file = _get_data_file()
+
+def _journal_file(data_file: Path) -> Path:
+    return data_file.with_suffix(".jsonl")
+
+
+def _wal_file(data_file: Path) -> Path:
+    return data_file.with_suffix(".wal")
+
+
+def _meta_file(data_file: Path) -> Path:
+    return data_file.with_suffix(".meta")
+
+
+def _sqlite_file(data_file: Path) -> Path:
+    return data_file.with_suffix(".db")
+
+
+def _sqlite_conn(data_file: Path):
+    db_file = _sqlite_file(data_file)
+    if not db_file.exists() and _wal_pending(data_file):
+        # La migración inicial lee el arreglo JSON: primero se consolida su WAL
+        recover(data_file)
+    return sqlite_store.connect(db_file, legacy_json=data_file)
+
+
+def current_data_file() -> Path:
+    """Archivo de gastos del usuario actual (o el archivo por defecto)."""
+    return _get_data_file()
+
+
+def subscribe(listener):
+    """Registra listener(WriteEvent), llamado tras cada escritura confirmada."""
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def _emit(event: WriteEvent):
+    for listener in list(_listeners):
+        listener(event)
+
+
+# ---------- Instantáneas en memoria ----------
+
+class _Snapshot:
+    """Gastos parseados de un archivo y sus índices derivados (id -> posición, tabla).
+
+    Un borrado deja un hueco (None) en su fila en lugar de desplazar las siguientes: el
+    índice por id y la tabla solo cambian en esa fila. Los huecos se compactan la próxima
+    vez que se pide la lista completa (expenses), que de todos modos es O(n).
+    """
+
+    __slots__ = ("key", "rows", "next_id", "table", "dead", "_positions")
+
+    def __init__(self, key, expenses, next_id=1):
+        self.key = key
+        self.rows = expenses
+        self.next_id = next_id
+        self.table = None
+        self.dead = 0
+        self._positions = None
+        for exp in expenses:
+            if exp.get("id") is None:
+                # Registros anteriores a los ids: se numeran al cargarlos
+                exp["id"] = self.next_id
+            self.next_id = max(self.next_id, exp["id"] + 1)
+
+    @property
+    def expenses(self):
+        if self.dead:
+            self._compact()
+        return self.rows
+
+    def _compact(self):
+        keep = [i for i, exp in enumerate(self.rows) if exp is not None]
+        # En sitio: quien ya tenga la lista (load_data) la ve sin huecos
+        self.rows[:] = [self.rows[i] for i in keep]
+        if self.table is not None:
+            self.table.compact(keep)
+        self._positions = None
+        self.dead = 0
+
+    def position(self, expense_id):
+        if self._positions is None:
+            self._positions = {exp["id"]: i for i, exp in enumerate(self.rows) if exp is not None}
+        return self._positions.get(expense_id)
+
+    def columns(self) -> ExpenseTable:
+        """Tabla columnar alineada con rows (se construye al primer uso)."""
+        if self.table is None:
+            self.table = ExpenseTable.from_records(self.expenses)
+        return self.table
+
+    def add(self, record):
+        if self._positions is not None:
+            self._positions[record["id"]] = len(self.rows)
+        self.rows.append(record)
+        if self.table is not None:
+            self.table.append(record)
+        self.next_id = max(self.next_id, record["id"] + 1)
+
+    def set(self, position, record):
+        self.rows[position] = record
+        if self.table is not None:
+            self.table.set(position, record)
+
+    def remove(self, position):
+        removed = self.rows[position]
+        self.rows[position] = None
+        self.dead += 1
+        if self._positions is not None:
+            del self._positions[removed["id"]]
+        if self.table is not None:
+            self.table.remove(position)
+        return removed
+
+
+def _source_file(data_file: Path) -> Path:
+    """Archivo del que realmente se leen los datos según el backend."""
+    if STORAGE_BACKEND == "journal":
+        journal = _journal_file(data_file)
+        if journal.exists():
+            return journal
+    elif STORAGE_BACKEND == "sqlite":
+        return _sqlite_file(data_file)
+    return data_file
+
+
+def _stat_key(path: Path):
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    key = (st.st_mtime_ns, st.st_size)
+    if path.suffix == ".db":
+        # En modo WAL las escrituras llegan primero al archivo -wal
+        wal = _stat_key(path.with_name(path.name + "-wal"))
+        key += wal or ()
+    elif path.suffix == ".json":
+        # Las operaciones aún no consolidadas viven en el WAL
+        wal = _stat_key(_wal_file(path))
+        key += wal or ()
+    return key
+
+
+def source_key(data_file: Path | None = None):
+    """Clave de validez (mtime_ns, tamaño...) del archivo de datos, o None si no existe."""
+    return _stat_key(_source_file(data_file or _get_data_file()))
+
+
+def _cache_get(path: Path, key):
+    with _cache_lock:
+        snapshot = _cache.get(path)
+        if snapshot is None or snapshot.key != key:
+            return None
+        _cache.move_to_end(path)
+        return snapshot
+
+
+def _cache_put(path: Path, snapshot):
+    if snapshot.key is None:
+        return
+    with _cache_lock:
+        _cache[path] = snapshot
+        _cache.move_to_end(path)
+        while len(_cache) > CACHE_MAX_FILES:
+            _cache.popitem(last=False)
+
+
+def _load_snapshot(data_file: Path) -> _Snapshot:
+    if STORAGE_BACKEND == "sqlite":
+        _sqlite_conn(data_file)
+    source = _source_file(data_file)
+    key = _stat_key(source)
+    cached = _cache_get(source, key)
+    if cached is not None:
+        return cached
+    if key is None:
+        return _Snapshot(None, [])
+    if STORAGE_BACKEND == "journal":
+        snapshot = _journal_load(data_file)
+        snapshot.key = key
+    elif STORAGE_BACKEND == "sqlite":
+        snapshot = _Snapshot(key, sqlite_store.load(_sqlite_conn(data_file)))
+    else:
+        snapshot = _json_state(data_file)
+        snapshot.key = key
+    _cache_put(source, snapshot)
+    return snapshot
+
+
+def as_table(expenses) -> ExpenseTable:
+    """Vista columnar de una lista de gastos, reutilizada si la lista está en caché."""
+    with _cache_lock:
+        for snapshot in _cache.values():
+            if snapshot.rows is expenses:
+                return snapshot.columns()
+    return ExpenseTable.from_records(expenses)
+
+
+def invalidate_cache(data_file: Path | None = None):
+    """Descarta la instantánea de un archivo (o todas si no se indica)."""
+    with _cache_lock:
+        if data_file is None:
+            _cache.clear()
+        else:
+            for path in (data_file, _journal_file(data_file), _sqlite_file(data_file)):
+                _cache.pop(path, None)
+
+
+# ---------- Backend JSON ----------
+
+def _json_load(data_file: Path):
     if data_file.exists():
         with open(data_file, "r", encoding="utf-8") as f:
             try:
@@ -21,7 +283,546 @@ def load_data():
             return data
     return []
 
+
+def _fsync_dir(directory: Path):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return  # p. ej. Windows no permite abrir directorios
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _json_save(data_file: Path, expenses):
+    # Temporal + fsync + rename: un corte deja el arreglo anterior o el nuevo, nunca uno truncado
+    tmp = data_file.with_name(data_file.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(expenses, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, data_file)
+    _fsync_dir(data_file.parent)
+
+
+def _read_next_id(data_file: Path) -> int:
+    """Contador de ids guardado junto al arreglo JSON (1 si no hay)."""
+    try:
+        return int(json.loads(_meta_file(data_file).read_text(encoding="utf-8"))["next_id"])
+    except (FileNotFoundError, json.JSONDecodeError, KeyError, TypeError, ValueError):
+        return 1
+
+
+def _json_store(data_file: Path, snapshot: _Snapshot):
+    """Guarda el arreglo y, si hace falta, el contador de ids en <datos>.meta.
+
+    El arreglo solo permite deducir max(id) + 1: tras borrar el id más alto ese id se
+    volvería a asignar al recargar. En ese caso el contador se persiste antes que el
+    arreglo (un contador adelantado es inofensivo, uno atrasado no).
+    """
+    highest = max((exp["id"] for exp in snapshot.expenses), default=0)
+    if snapshot.next_id > highest + 1 and snapshot.next_id > _read_next_id(data_file):
+        _json_save(_meta_file(data_file), {"next_id": snapshot.next_id})
+    _json_save(data_file, snapshot.expenses)
+
+
+def _json_state(data_file: Path) -> _Snapshot:
+    """Arreglo JSON con las operaciones pendientes del WAL ya aplicadas."""
+    expenses = _json_load(data_file)
+    next_id = _read_next_id(data_file)
+    if not _wal_pending(data_file):
+        return _Snapshot(None, expenses, next_id)
+    with open(_wal_file(data_file), "r", encoding="utf-8") as f:
+        snapshot, _ = _replay(f, expenses, next_id)
+    return snapshot
+
+
+# ---------- WAL del backend JSON ----------
+
+class _WalLog:
+    """Archivo de operaciones de un arreglo JSON con fsync agrupado.
+
+    append() escribe la línea (sin fsync) y devuelve su número de secuencia; commit()
+    espera a que esté en disco. El primero que llega a commit hace de líder: un solo
+    fsync cubre todas las líneas escritas hasta ese momento, y quienes llegan mientras
+    tanto esperan a que termine en vez de sincronizar cada uno.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.file = None
+        self.lines = 0
+        self.written = 0
+        self.synced = 0
+        self.syncing = False
+        self.cond = threading.Condition()
+
+    def _open(self):
+        if self.file is not None:
+            self.file.close()
+        self.file = open(self.path, "a+b")
+        self.file.seek(0)
+        content = self.file.read()
+        self.lines = content.count(b"\n")
+        if content and not content.endswith(b"\n"):
+            # Cierra una línea truncada para no corromper la siguiente
+            self.file.write(b"\n")
+            self.lines += 1
+
+    def _ensure_open(self):
+        # Si el archivo se borró o reemplazó desde fuera se vuelve a abrir por ruta
+        if self.file is None or os.fstat(self.file.fileno()).st_nlink == 0:
+            self._open()
+
+    def append(self, entry):
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        with self.cond:
+            self._ensure_open()
+            self.file.write(line)
+            self.file.flush()
+            self.lines += 1
+            self.written += 1
+            return self.written
+
+    def commit(self, seq):
+        with self.cond:
+            while self.synced < seq:
+                if not self.syncing:
+                    self.syncing = True
+                    break
+                self.cond.wait()
+            else:
+                return
+        target = None
+        try:
+            if WAL_GROUP_COMMIT_WINDOW:
+                time.sleep(WAL_GROUP_COMMIT_WINDOW)
+            with self.cond:
+                written, fd = self.written, self.file.fileno()
+            os.fsync(fd)
+            target = written
+        finally:
+            with self.cond:
+                self.syncing = False
+                if target is not None:
+                    self.synced = max(self.synced, target)
+                self.cond.notify_all()
+
+    def truncate(self):
+        """Vacía el log tras un checkpoint; todo lo anterior ya está en el arreglo."""
+        with self.cond:
+            while self.syncing:
+                self.cond.wait()
+            self._ensure_open()
+            # Sin fsync: si el vaciado se pierde, reaplicar operaciones por id es inofensivo
+            self.file.truncate(0)
+            self.lines = 0
+            self.synced = self.written
+            self.cond.notify_all()
+
+
+def _wal_log(data_file: Path) -> _WalLog:
+    wal = _wal_file(data_file)
+    log = _wal_logs.get(wal)
+    if log is None:
+        log = _wal_logs[wal] = _WalLog(wal)
+    return log
+
+
+def _wal_pending(data_file: Path) -> bool:
+    try:
+        return _wal_file(data_file).stat().st_size > 0
+    except FileNotFoundError:
+        return False
+
+
+def _wal_checkpoint(data_file: Path, snapshot: _Snapshot):
+    """Escribe el arreglo completo y vacía el WAL (llamar con _write_lock)."""
+    _json_store(data_file, snapshot)
+    if _wal_pending(data_file):
+        _wal_log(data_file).truncate()
+
+
+def recover(data_file: Path | None = None):
+    """Recuperación al arrancar: consolida en el arreglo JSON las operaciones del WAL.
+
+    Devuelve cuántas operaciones se reaplicaron.
+    """
+    data_file = data_file or _get_data_file()
+    with _write_lock:
+        if not _wal_pending(data_file):
+            return 0
+        before = _stat_key(data_file)
+        with open(_wal_file(data_file), "r", encoding="utf-8") as f:
+            snapshot, count = _replay(f, _json_load(data_file), _read_next_id(data_file))
+        _wal_checkpoint(data_file, snapshot)
+        invalidate_cache(data_file)
+        snapshot.key = _stat_key(data_file)
+        _cache_put(data_file, snapshot)
+        # Mismo contenido ya visible antes (la carga reaplica el WAL): solo cambia la clave
+        _emit(WriteEvent("compact", data_file, None, None, before, snapshot.key))
+    return count
+
+
+def _iter_json_array(data_file: Path):
+    """Decodifica un arreglo JSON elemento a elemento leyendo por bloques."""
+    decoder = json.JSONDecoder()
+    with open(data_file, "r", encoding="utf-8") as f:
+        buf = ""
+        pos = 0
+        started = False
+        eof = False
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos == len(buf):
+                if eof:
+                    return
+                buf, pos = f.read(STREAM_CHUNK_SIZE), 0
+                eof = not buf
+                continue
+            if not started:
+                if buf[pos] != "[":
+                    return
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                item, end = None, None
+            if end is None or (end == len(buf) and not eof):
+                # Elemento incompleto: se agrega el siguiente bloque y se reintenta
+                if eof:
+                    return
+                chunk = f.read(STREAM_CHUNK_SIZE)
+                eof = not chunk
+                buf, pos = buf[pos:] + chunk, 0
+                continue
+            yield item
+            pos = end
+
+
+def _wal_changes(data_file: Path):
+    """Estado final de cada id tocado por el WAL: el registro, o None si se borró."""
+    changes = {}
+    with open(_wal_file(data_file), "r", encoding="utf-8") as f:
+        for entry in _entries(f):
+            op = entry.get("op")
+            if op == "add" and entry["record"].get("id") is not None:
+                changes[entry["record"]["id"]] = entry["record"]
+            elif op == "set":
+                changes[entry["id"]] = dict(entry["record"], id=entry["id"])
+            elif op == "del":
+                changes[entry["id"]] = None
+    return changes
+
+
+def _iter_json_state(data_file: Path):
+    """Recorre el arreglo JSON con el WAL aplicado sin materializar el arreglo.
+
+    Solo se tienen en memoria los registros tocados por el WAL (a lo sumo
+    WAL_CHECKPOINT_LINES): sustituyen al original al pasar por su posición y los
+    nuevos salen al final, en el mismo orden que da _replay.
+    """
+    changes = _wal_changes(data_file) if _wal_pending(data_file) else {}
+    if data_file.exists():
+        # Misma numeración que _Snapshot para los registros anteriores a los ids
+        next_id = _read_next_id(data_file)
+        for exp in _iter_json_array(data_file):
+            if exp.get("id") is None:
+                exp["id"] = next_id
+            next_id = max(next_id, exp["id"] + 1)
+            if exp["id"] in changes:
+                exp = changes.pop(exp["id"])
+                if exp is None:
+                    continue
+            yield exp
+    for exp in changes.values():
+        if exp is not None:
+            yield exp
+
+
+# ---------- Backend journal (JSONL) ----------
+
+def _entries(lines):
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            # Una última línea truncada (p. ej. por un corte) se descarta
+            continue
+
+
+def _replay(lines, base=(), next_id=1):
+    """Reconstruye los gastos aplicando las operaciones del journal (o del WAL sobre base).
+
+    Devuelve la instantánea y el número de líneas válidas leídas. Las operaciones van por
+    id, así que reaplicar sobre base un log ya consolidado no cambia el resultado.
+    """
+    seed = _Snapshot(None, list(base), next_id)
+    records = {exp["id"]: exp for exp in seed.expenses}
+    next_id = seed.next_id
+    count = 0
+    for entry in _entries(lines):
+        count += 1
+        op = entry.get("op")
+        expense_id = entry.get("id")
+        if op == "add":
+            record = entry["record"]
+            if record.get("id") is None:
+                record["id"] = next_id
+            records[record["id"]] = record
+            next_id = max(next_id, record["id"] + 1)
+        elif op == "set":
+            records[expense_id] = dict(entry["record"], id=expense_id)
+        elif op == "del" and expense_id is not None:
+            records.pop(expense_id, None)
+            next_id = max(next_id, expense_id + 1)
+        elif op == "meta":
+            next_id = max(next_id, entry.get("next_id", 1))
+    return _Snapshot(None, list(records.values()), next_id), count
+
+
+def _journal_load(data_file: Path) -> _Snapshot:
+    journal = _journal_file(data_file)
+    if not journal.exists():
+        # Primer uso del journal: se parte del archivo JSON existente
+        return _json_state(data_file)
+    with open(journal, "r", encoding="utf-8") as f:
+        snapshot, count = _replay(f)
+    _journal_stats[journal] = [count, len(snapshot.expenses)]
+    return snapshot
+
+
+def _write_snapshot(journal: Path, snapshot: _Snapshot):
+    """Reescribe el journal con el contador de ids y una línea "add" por registro vivo."""
+    tmp = journal.with_suffix(".jsonl.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"op": "meta", "next_id": snapshot.next_id}) + "\n")
+        for exp in snapshot.expenses:
+            f.write(json.dumps({"op": "add", "record": exp}, ensure_ascii=False) + "\n")
+    os.replace(tmp, journal)
+    _journal_stats[journal] = [len(snapshot.expenses) + 1, len(snapshot.expenses)]
+
+
+def _journal_append(data_file: Path, entry, live_delta):
+    """Agrega una operación al journal; devuelve True si conviene compactar."""
+    journal = _journal_file(data_file)
+    if not journal.exists():
+        _write_snapshot(journal, _json_state(data_file))
+    with open(journal, "a+b") as f:
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                # Cierra una línea truncada para no corromper la nueva
+                line = "\n" + line
+        f.write(line.encode("utf-8"))
+    stats = _journal_stats.get(journal)
+    if stats is None:
+        return False
+    stats[0] += 1
+    stats[1] += live_delta
+    return stats[0] >= COMPACT_MIN_LINES and stats[0] > COMPACT_RATIO * max(stats[1], 1)
+
+
+def compact_journal(data_file: Path | None = None):
+    """Reduce el journal a una instantánea de los registros vivos."""
+    data_file = data_file or _get_data_file()
+    journal = _journal_file(data_file)
+    with _write_lock:
+        if not journal.exists():
+            return 0
+        before = _stat_key(journal)
+        with open(journal, "r", encoding="utf-8") as f:
+            snapshot, _ = _replay(f)
+        _write_snapshot(journal, snapshot)
+        snapshot.key = _stat_key(journal)
+        _cache_put(journal, snapshot)
+        # Mismo contenido en otro archivo: los derivados solo deben actualizar su clave
+        _emit(WriteEvent("compact", data_file, None, None, before, snapshot.key))
+    return len(snapshot.expenses)
+
+
+# ---------- API pública ----------
+
+def load_data(data_file: Path | None = None):
+    """Devuelve los gastos del usuario actual (o de data_file).
+
+    La lista se comparte con la caché mientras el archivo no cambie: no debe
+    modificarse en sitio (las escrituras pasan por save_data y *_record).
+    """
+    return _load_snapshot(data_file or _get_data_file()).expenses
+
+
+def iter_expenses(data_file: Path | None = None):
+    """Recorre los gastos del usuario actual (o de data_file) sin cargar el documento completo.
+
+    Si la instantánea ya está en caché se recorre esa lista; el journal necesita
+    reconstruirse completo para aplicar sus tombstones. En JSON las operaciones
+    pendientes del WAL se aplican al vuelo.
+    """
+    data_file = data_file or _get_data_file()
+    source = _source_file(data_file)
+    cached = _cache_get(source, _stat_key(source))
+    if cached is not None:
+        yield from cached.expenses
+    elif STORAGE_BACKEND == "journal":
+        yield from load_data(data_file)
+    elif STORAGE_BACKEND == "sqlite":
+        yield from sqlite_store.iter_rows(_sqlite_conn(data_file))
+    else:
+        yield from _iter_json_state(data_file)
+
+
+def load_table(data_file: Path | None = None) -> ExpenseTable:
+    """Carga los gastos del usuario actual (o de data_file) en formato columnar.
+
+    Con la instantánea en caché se reutiliza su tabla. Si no, JSON y SQLite se leen en
+    streaming directo a las columnas, sin conservar la lista de diccionarios.
+    """
+    data_file = data_file or _get_data_file()
+    source = _source_file(data_file)
+    cached = _cache_get(source, _stat_key(source))
+    if cached is None and STORAGE_BACKEND == "journal":
+        cached = _load_snapshot(data_file)
+    if cached is not None:
+        return cached.columns()
+    return ExpenseTable.from_records(iter_expenses(data_file))
+
+
 def save_data(expenses):
     data_file = _get_data_file()
-    with open(data_file, "w", encoding="utf-8") as f:
-        json.dump(expenses, f, indent=4)
+    with _write_lock:
+        before = source_key(data_file)
+        invalidate_cache(data_file)
+        snapshot = _Snapshot(None, [dict(exp) for exp in expenses])
+        if STORAGE_BACKEND == "journal":
+            _write_snapshot(_journal_file(data_file), snapshot)
+        elif STORAGE_BACKEND == "sqlite":
+            sqlite_store.save(_sqlite_conn(data_file), snapshot.expenses)
+        else:
+            if _wal_pending(data_file):
+                # Primero se consolida el WAL: si no, un corte entre el rename y el vaciado
+                # reaplicaría operaciones viejas sobre el arreglo nuevo
+                _wal_checkpoint(data_file, _json_state(data_file))
+            _json_store(data_file, snapshot)
+        source = _source_file(data_file)
+        snapshot.key = _stat_key(source)
+        _cache_put(source, snapshot)
+        _emit(WriteEvent("save", data_file, None, None, before, snapshot.key))
+
+
+def _write(op, expense_id=None, record=None):
+    """Aplica una operación de un solo registro en disco y en la instantánea en caché.
+
+    JSON reescribe el archivo (o agrega una línea al WAL); journal agrega una línea y SQLite
+    ejecuta una sola sentencia, así que en esos modos solo se toca el registro afectado.
+    Con WAL el evento se emite al escribir la línea y el fsync agrupado se espera después
+    de soltar el lock, para que otras escrituras puedan sumarse a él.
+    """
+    data_file = _get_data_file()
+    compact = False
+    wal_log = seq = None
+    with _write_lock:
+        snapshot = _load_snapshot(data_file)
+        before = snapshot.key
+        position = old = None
+        if op != "add":
+            position = snapshot.position(expense_id)
+            if position is None:
+                raise IndexError(f"No existe un gasto con id {expense_id}.")
+            old = snapshot.rows[position]
+        if op != "del":
+            record = dict(record, id=expense_id if op == "set" else snapshot.next_id)
+
+        if STORAGE_BACKEND == "sqlite":
+            conn = _sqlite_conn(data_file)
+            if op == "add":
+                record["id"] = sqlite_store.append(conn, record)
+            elif op == "set":
+                sqlite_store.replace(conn, expense_id, record)
+            else:
+                sqlite_store.delete(conn, expense_id)
+        elif STORAGE_BACKEND == "journal" or JSON_WAL:
+            entry = {"op": op, "record": record} if op == "add" else {"op": op, "id": expense_id}
+            if op == "set":
+                entry["record"] = record
+            if STORAGE_BACKEND == "journal":
+                compact = _journal_append(data_file, entry, {"add": 1, "set": 0, "del": -1}[op])
+            else:
+                if not data_file.exists():
+                    _json_save(data_file, [])
+                wal_log = _wal_log(data_file)
+                seq = wal_log.append(entry)
+
+        if op == "add":
+            snapshot.add(record)
+        elif op == "set":
+            snapshot.set(position, record)
+        else:
+            record = snapshot.remove(position)
+
+        if STORAGE_BACKEND == "json" and (wal_log is None or wal_log.lines >= WAL_CHECKPOINT_LINES):
+            try:
+                _wal_checkpoint(data_file, snapshot)
+            except Exception:
+                invalidate_cache(data_file)
+                raise
+        source = _source_file(data_file)
+        snapshot.key = _stat_key(source)
+        _cache_put(source, snapshot)
+        _emit(WriteEvent(op, data_file, old, None if op == "del" else record, before, snapshot.key))
+    if seq is not None:
+        wal_log.commit(seq)
+    if compact:
+        threading.Thread(target=compact_journal, args=(data_file,), daemon=True).start()
+    return record
+
+
+def get_record(expense_id):
+    """Devuelve el gasto con ese id (búsqueda O(1) en el índice) o None."""
+    if STORAGE_BACKEND == "sqlite":
+        return sqlite_store.get(_sqlite_conn(_get_data_file()), expense_id)
+    snapshot = _load_snapshot(_get_data_file())
+    position = snapshot.position(expense_id)
+    return None if position is None else snapshot.rows[position]
+
+
+def append_record(expense):
+    """Agrega un gasto asignándole un id estable; devuelve el registro guardado."""
+    return _write("add", record=expense)
+
+
+def replace_record(expense_id, expense):
+    """Sustituye el gasto con ese id; devuelve el registro guardado."""
+    return _write("set", expense_id, expense)
+
+
+def delete_record(expense_id):
+    """Elimina el gasto con ese id; devuelve el eliminado.
+
+    En memoria el borrado es O(1) (hueco en la instantánea). En disco, el journal (tombstone),
+    SQLite y el JSON con WAL escriben solo la operación; el JSON sin WAL reescribe el arreglo.
+    """
+    return _write("del", expense_id)
+
+
+def select_range(start: int, end: int):
+    """Gastos con día (ordinal) en [start, end), en orden cronológico."""
+    if STORAGE_BACKEND == "sqlite":
+        return sqlite_store.select_between(
+            _sqlite_conn(_get_data_file()), date.fromordinal(start).isoformat(), date.fromordinal(end).isoformat()
+        )
+    snapshot = _load_snapshot(_get_data_file())
+    return [snapshot.rows[i] for i in snapshot.columns().indices_between(start, end)]
+
@@ -0,0 +1,120 @@
+from array import array
+from bisect import bisect_left, insort
+from src.dates import day_ordinal
+
+
+class ExpenseTable:
+    """Gastos en columnas: montos, días como ordinales, categorías y monedas internadas."""
+
+    __slots__ = (
+        "amounts", "days", "category_codes", "categories", "currency_codes", "currencies",
+        "descriptions", "_codes", "_currency_index", "_date_index", "_removed",
+    )
+
+    def __init__(self):
+        self.amounts = array("d")
+        self.days = array("i")
+        self.category_codes = array("H")
+        self.categories = []
+        self.currency_codes = array("B")
+        self.currencies = []
+        self.descriptions = []
+        self._codes = {}
+        self._currency_index = {}
+        self._date_index = None  # claves día * 2**32 + fila, ordenadas
+        self._removed = set()  # filas sacadas del índice a la espera de compact()
+
+    @classmethod
+    def from_records(cls, records):
+        table = cls()
+        for exp in records:
+            table.append(exp)
+        return table
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def _intern(self, category):
+        code = self._codes.get(category)
+        if code is None:
+            code = len(self.categories)
+            if code > 0xFFFF:
+                raise ValueError("Demasiadas categorías distintas para la tabla.")
+            self._codes[category] = code
+            self.categories.append(category)
+        return code
+
+    def _intern_currency(self, currency):
+        currency = currency or "COP"
+        code = self._currency_index.get(currency)
+        if code is None:
+            code = len(self.currencies)
+            if code > 0xFF:
+                raise ValueError("Demasiadas monedas distintas para la tabla.")
+            self._currency_index[currency] = code
+            self.currencies.append(currency)
+        return code
+
+    def append(self, expense):
+        self.amounts.append(expense.get("amount", 0))
+        self.days.append(day_ordinal(expense.get("date", "")))
+        self.category_codes.append(self._intern(expense.get("category", "")))
+        self.currency_codes.append(self._intern_currency(expense.get("currency")))
+        self.descriptions.append(expense.get("description", ""))
+        if self._date_index is not None:
+            insort(self._date_index, self.days[-1] << 32 | len(self.amounts) - 1)
+
+    def set(self, i, expense):
+        """Sobrescribe la fila i con los valores de otro gasto."""
+        day = day_ordinal(expense.get("date", ""))
+        if self._date_index is not None and day != self.days[i]:
+            # Se mueve solo la clave de esta fila: O(log n) búsquedas, sin reordenar todo
+            del self._date_index[bisect_left(self._date_index, self.days[i] << 32 | i)]
+            insort(self._date_index, day << 32 | i)
+        self.amounts[i] = expense.get("amount", 0)
+        self.days[i] = day
+        self.category_codes[i] = self._intern(expense.get("category", ""))
+        self.currency_codes[i] = self._intern_currency(expense.get("currency"))
+        self.descriptions[i] = expense.get("description", "")
+
+    def remove(self, i):
+        """Saca la fila i del índice por fecha; sus valores quedan hasta compact()."""
+        self._removed.add(i)
+        if self._date_index is not None:
+            key = self.days[i] << 32 | i
+            del self._date_index[bisect_left(self._date_index, key)]
+
+    def compact(self, keep):
+        """Conserva solo las filas keep (posiciones crecientes) y renumera el índice."""
+        self.amounts = array("d", (self.amounts[i] for i in keep))
+        self.days = array("i", (self.days[i] for i in keep))
+        self.category_codes = array("H", (self.category_codes[i] for i in keep))
+        self.currency_codes = array("B", (self.currency_codes[i] for i in keep))
+        self.descriptions = [self.descriptions[i] for i in keep]
+        if self._date_index is not None:
+            # La renumeración conserva el orden relativo: el índice sigue ordenado
+            new_row = {old: new for new, old in enumerate(keep)}
+            self._date_index = array("q", (
+                key >> 32 << 32 | new_row[key & 0xFFFFFFFF] for key in self._date_index
+            ))
+        self._removed = set()
+
+    def total(self):
+        return sum(self.amounts)
+
+    def _sorted_keys(self):
+        if self._date_index is None:
+            self._date_index = array("q", sorted(
+                d << 32 | i for i, d in enumerate(self.days) if i not in self._removed
+            ))
+        return self._date_index
+
+    def indices_between(self, start, end):
+        """Posiciones de los gastos con día en [start, end), en orden cronológico.
+
+        Búsqueda binaria sobre el índice ordenado por día: O(log n + k).
+        """
+        keys = self._sorted_keys()
+        lo = bisect_left(keys, start << 32)
+        hi = bisect_left(keys, end << 32, lo)
+        return [key & 0xFFFFFFFF for key in keys[lo:hi]]
@@ -1,21 +1,31 @@
 import csv
 from datetime import datetime
-from src.storage import load_data, save_data
+from src.storage import (
+    load_data,
+    iter_expenses,
+    append_record,
+    replace_record,
+    delete_record,
+    get_record,
+    select_range,
+    load_table,
+)
+from src.aggregates import load_aggregates
+from src.currency import BASE_CURRENCY, convert_many, normalize_currency
+from src.dates import day_ordinal, month_bounds
 
-def add_expense(description, category, amount, date=None):
-    """Agrega un gasto con fecha (por defecto la fecha actual)."""
-    expenses = load_data()
+def add_expense(description, category, amount, date=None, currency=None):
+    """Agrega un gasto con fecha (por defecto la fecha actual) y moneda (por defecto COP)."""
     if date is None:
         date = datetime.now().strftime("%Y-%m-%d")
     expense = {
         "description": description,
         "category": category,
         "amount": amount,
-        "date": date
+        "date": date,
+        "currency": normalize_currency(currency),
     }
-    expenses.append(expense)
-    save_data(expenses)
-    return expense
+    return append_record(expense)
 
 def list_expenses():
     """Devuelve la lista completa de gastos."""
@@ -23,60 +33,88 @@ def list_expenses():
 
 def get_total_expense():
     """Suma el total de todos los gastos."""
-    expenses = load_data()
-    return sum(exp["amount"] for exp in expenses)
+    return load_aggregates()["total"]
+
+def get_total_in_currency(currency):
+    """Total convertido con la tasa vigente en la fecha de cada gasto.
+
+    Los gastos se agrupan por moneda de origen y cada grupo se convierte en un solo lote.
+    """
+    table = load_table()
+    groups = {}
+    for i, code in enumerate(table.currency_codes):
+        groups.setdefault(code, []).append(i)
+    total = 0
+    for code, rows in groups.items():
+        amounts = [table.amounts[i] for i in rows]
+        days = [table.days[i] for i in rows]
+        total += sum(convert_many(amounts, days, currency, table.currencies[code]))
+    return round(total, 2)
 
 def get_expense_by_category(category):
-    """Suma el total de gastos filtrados por categoría."""
-    expenses = load_data()
-    return sum(exp["amount"] for exp in expenses if exp["category"].lower() == category.lower())
+    """Suma el total de gastos filtrados por categoría (en la moneda base)."""
+    wanted = category.lower()
+    return sum(cell[0] for name, cell in load_aggregates()["by_category"].items() if name.lower() == wanted)
+
+def edit_expense(
+    expense_id, new_description=None, new_category=None, new_amount=None, new_date=None, new_currency=None
+):
+    """Edita un gasto existente por id."""
+    current = get_record(expense_id)
+    if current is None:
+        raise IndexError(f"No existe un gasto con id {expense_id}.")
+    expense = dict(current)
+    if new_description:
+        expense["description"] = new_description
+    if new_category:
+        expense["category"] = new_category
+    if new_amount is not None:
+        expense["amount"] = new_amount
+    if new_date:
+        expense["date"] = new_date
+    if new_currency:
+        expense["currency"] = normalize_currency(new_currency)
+    return replace_record(expense_id, expense)
 
-def edit_expense(index, new_description=None, new_category=None, new_amount=None, new_date=None):
-    """Edita un gasto existente por índice."""
-    expenses = load_data()
-    if 0 <= index < len(expenses):
-        if new_description:
-            expenses[index]["description"] = new_description
-        if new_category:
-            expenses[index]["category"] = new_category
-        if new_amount is not None:
-            expenses[index]["amount"] = new_amount
-        if new_date:
-            expenses[index]["date"] = new_date
-        save_data(expenses)
-        return expenses[index]
-    else:
-        raise IndexError("Índice fuera de rango.")
+def delete_expense(expense_id):
+    """Elimina un gasto existente por id."""
+    return delete_record(expense_id)
 
-def delete_expense(index):
-    """Elimina un gasto existente por índice."""
-    expenses = load_data()
-    if 0 <= index < len(expenses):
-        removed = expenses.pop(index)
-        save_data(expenses)
-        return removed
-    else:
-        raise IndexError("Índice fuera de rango.")
+def filter_by_range(start_str, end_str):
+    """Filtra los gastos con fecha en [inicio, fin) (YYYY-MM-DD)."""
+    start, end = day_ordinal(start_str), day_ordinal(end_str)
+    if not start or not end:
+        raise ValueError("Formato de fecha invalido. Use YYYY-MM-DD.")
+    return select_range(start, end)
 
 def filter_by_date(date_str):
     """Filtra los gastos de una fecha específica (YYYY-MM-DD)."""
-    expenses = load_data()
-    return [exp for exp in expenses if exp["date"] == date_str]
+    day = day_ordinal(date_str)
+    return select_range(day, day + 1) if day else []
 
 def filter_by_month(month_str):
     """Filtra los gastos por mes (formato YYYY-MM)."""
-    expenses = load_data()
-    return [exp for exp in expenses if exp["date"].startswith(month_str)]
+    try:
+        start, end = month_bounds(month_str)
+    except ValueError:
+        return [exp for exp in load_data() if exp["date"].startswith(month_str)]
+    return select_range(start, end)
+
+def _with_currency(expense):
+    # Los gastos guardados antes de existir el campo están en la moneda base
+    return expense if "currency" in expense else dict(expense, currency=BASE_CURRENCY)
 
 def export_to_csv(filename="gastos.csv"):
     """Exporta los gastos actuales a un archivo CSV."""
-    expenses = load_data()
-    if not expenses:
+    expenses = iter_expenses()
+    first = next(expenses, None)
+    if first is None:
         raise ValueError("No hay gastos registrados para exportar.")
-    
+
     with open(filename, mode="w", newline="", encoding="utf-8") as file:
-        writer = csv.DictWriter(file, fieldnames=["description", "category", "amount", "date"])
+        writer = csv.DictWriter(file, fieldnames=["id", "description", "category", "amount", "date", "currency"])
         writer.writeheader()
-        writer.writerows(expenses)
-    
+        writer.writerow(_with_currency(first))
+        writer.writerows(map(_with_currency, expenses))
+
     return filename
@@ -1,5 +1,6 @@
 import json
 import hashlib
+import os
 from pathlib import Path
 from datetime import datetime
 
@@ -7,24 +8,75 @@ USERS_FILE = Path("users.json")
 SESSION_FILE = Path("session.json")
 DATA_DIR = Path("data")
 
+# Con muchos usuarios el registro puede repartirse en fragmentos: si USERS_SHARDS_DIR tiene
+# una ruta, cada usuario vive en <dir>/<prefijo del hash del nombre>.json y login solo lee
+# (y cachea) su fragmento. None mantiene el users.json único.
+USERS_SHARDS_DIR = None
+SHARD_PREFIX = 2  # caracteres hex del prefijo: 256 fragmentos
+
+# Caché en memoria de los JSON leídos: ruta -> (firma del archivo, contenido). Se revalida
+# con un stat (mtime, tamaño, inodo), así que otros procesos que cambien la sesión o el
+# registro se notan; las escrituras propias actualizan la caché directamente.
+_cache = {}
+
+
+def _signature(path: Path):
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
 def _load_json(path: Path, default):
-    if path.exists():
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return default
+    # El resultado es compartido con la caché: quien lo modifique debe copiarlo antes
+    signature = _signature(path)
+    if signature is None:
+        _cache.pop(str(path), None)
+        return default
+    cached = _cache.get(str(path))
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    _cache[str(path)] = (signature, data)
+    return data
 
 def _save_json(path: Path, data):
-    with open(path, "w", encoding="utf-8") as f:
+    # Temporal + rename: nunca queda un JSON a medias y el inodo nuevo cambia la firma
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
         json.dump(data, f, indent=4)
+    os.replace(tmp, path)
+    _cache[str(path)] = (_signature(path), data)
 
 def _hash_password(username: str, password: str) -> str:
     # Hash simple con “sal” del username
     combo = f"{username}:{password}".encode("utf-8")
     return hashlib.sha256(combo).hexdigest()
 
+def _registry_file(username: str) -> Path:
+    """Archivo del registro donde está (o estaría) el usuario."""
+    if USERS_SHARDS_DIR is None:
+        return USERS_FILE
+    prefix = hashlib.sha1(username.encode("utf-8")).hexdigest()[:SHARD_PREFIX]
+    return Path(USERS_SHARDS_DIR) / f"{prefix}.json"
+
+def shard_users():
+    """Reparte el users.json actual en los fragmentos de USERS_SHARDS_DIR."""
+    if USERS_SHARDS_DIR is None:
+        raise ValueError("No hay directorio de fragmentos configurado.")
+    Path(USERS_SHARDS_DIR).mkdir(parents=True, exist_ok=True)
+    shards = {}
+    for username, info in _load_json(USERS_FILE, {}).items():
+        shards.setdefault(_registry_file(username), {})[username] = info
+    for path, chunk in shards.items():
+        _save_json(path, dict(_load_json(path, {}), **chunk))
+    return len(shards)
+
 def create_user(username: str, full_name: str, password: str):
     username = username.strip()
-    users = _load_json(USERS_FILE, {})
+    registry = _registry_file(username)
+    users = dict(_load_json(registry, {}))
     if username in users:
         raise ValueError("El usuario ya existe.")
     pwd = _hash_password(username, password)
@@ -33,14 +85,15 @@ def create_user(username: str, full_name: str, password: str):
         "password_hash": pwd,
         "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     }
-    _save_json(USERS_FILE, users)
+    registry.parent.mkdir(parents=True, exist_ok=True)
+    _save_json(registry, users)
     # Prepara archivo de gastos del usuario
     DATA_DIR.mkdir(exist_ok=True)
     get_expenses_file_for_user(username).touch(exist_ok=True)
     return {"username": username, "full_name": full_name}
 
 def authenticate(username: str, password: str) -> bool:
-    users = _load_json(USERS_FILE, {})
+    users = _load_json(_registry_file(username), {})
     if username not in users:
         return False
     return users[username]["password_hash"] == _hash_password(username, password)
@@ -54,8 +107,10 @@ def login(username: str, password: str):
 def logout():
     if SESSION_FILE.exists():
         SESSION_FILE.unlink()
+    _cache.pop(str(SESSION_FILE), None)
 
 def get_current_user() -> str | None:
+    # Un stat por llamada: storage la consulta en cada lectura y escritura
     data = _load_json(SESSION_FILE, {})
     return data.get("current_user")
 
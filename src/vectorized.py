@@ -0,0 +1,159 @@
+from src.analytics import QuantileSketch, StatsAccumulator
+from src.currency import BASE_CURRENCY, rates_version, to_base_factor
+
+# Motor opcional con NumPy para volúmenes grandes. Si NumPy no está instalado
+# AVAILABLE es False y los llamadores siguen usando los recorridos en Python.
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depende del entorno
+    np = None
+
+AVAILABLE = np is not None
+MIN_ROWS = 20_000  # por debajo de esto el coste de crear los arreglos no compensa
+
+_EPOCH = 719163  # date(1970, 1, 1).toordinal(): origen de datetime64
+
+
+def worthwhile(count):
+    return AVAILABLE and count >= MIN_ROWS
+
+
+def _number(value):
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def _accumulator(amounts):
+    acc = StatsAccumulator()
+    if amounts.size:
+        acc.count = int(amounts.size)
+        acc.total = _number(amounts.sum())
+        acc.mean = float(amounts.mean())
+        acc.m2 = float(((amounts - acc.mean) ** 2).sum())
+        acc.min = _number(amounts.min())
+        acc.max = _number(amounts.max())
+    return acc
+
+
+def _sketches(keys, group_of_row, amounts):
+    """Un QuantileSketch por grupo, a partir de los montos ordenados dentro de cada grupo."""
+    order = np.lexsort((amounts, group_of_row))
+    bounds = np.cumsum(np.bincount(group_of_row, minlength=len(keys)))
+    sketches, start = {}, 0
+    for key, end in zip(keys, bounds.tolist()):
+        if end > start:
+            sketches[key] = QuantileSketch.from_sorted(amounts[order[start:end]].tolist())
+        start = end
+    return sketches
+
+
+def _to_base(amounts, currency_of_row, currencies):
+    """Convierte los montos a la moneda base con un factor por moneda (un solo producto)."""
+    if all(c == BASE_CURRENCY for c in currencies):
+        return amounts
+    factors = np.array([float(to_base_factor(c)) for c in currencies])
+    return amounts * factors[currency_of_row]
+
+
+def _groups(keys, sums, counts):
+    return {key: [_number(s), int(c)] for key, s, c in zip(keys, sums, counts) if c}
+
+
+def aggregate(table):
+    """Agregados con el mismo formato que aggregates.from_records, calculados sobre las columnas.
+
+    Devuelve None si hay fechas vacías o inválidas: su clave de grupo depende del texto
+    original, que la tabla no conserva.
+    """
+    native = np.frombuffer(table.amounts, dtype=np.double)
+    days = np.frombuffer(table.days, dtype=np.intc)
+    codes = np.frombuffer(table.category_codes, dtype=np.ushort)
+    currency_codes = np.frombuffer(table.currency_codes, dtype=np.ubyte)
+    if native.size and not days.all():
+        return None
+    amounts = _to_base(native, currency_codes, table.currencies)
+    currency_sums = np.bincount(currency_codes, weights=native, minlength=len(table.currencies))
+    currency_counts = np.bincount(currency_codes, minlength=len(table.currencies))
+
+    n_categories = len(table.categories)
+    cat_sums = np.bincount(codes, weights=amounts, minlength=n_categories)
+    cat_counts = np.bincount(codes, minlength=n_categories)
+
+    unique_days, day_of_row = np.unique(days, return_inverse=True)
+    day_sums = np.bincount(day_of_row, weights=amounts)
+    day_counts = np.bincount(day_of_row)
+    as_dates = (unique_days.astype(np.int64) - _EPOCH).astype("datetime64[D]")
+
+    unique_months, month_of_day = np.unique(as_dates.astype("datetime64[M]"), return_inverse=True)
+    month_sums = np.bincount(month_of_day, weights=day_sums)
+    month_counts = np.bincount(month_of_day, weights=day_counts)
+    month_keys = np.datetime_as_string(unique_months).tolist()
+    month_of_row = month_of_day[day_of_row]
+    cells = month_of_row.astype(np.int64) * max(n_categories, 1) + codes
+    unique_cells, cell_of_row = np.unique(cells, return_inverse=True)
+    cell_sums = np.bincount(cell_of_row, weights=amounts)
+    cell_counts = np.bincount(cell_of_row)
+    by_month_category = {}
+    for cell, total, count in zip(unique_cells.tolist(), cell_sums, cell_counts):
+        month, code = divmod(cell, max(n_categories, 1))
+        by_month_category.setdefault(month_keys[month], {})[table.categories[code]] = [_number(total), int(count)]
+
+    return {
+        "source": None,
+        "total": _number(amounts.sum()),
+        "count": int(amounts.size),
+        "by_category": _groups(table.categories, cat_sums, cat_counts),
+        "by_day": _groups(np.datetime_as_string(as_dates).tolist(), day_sums, day_counts),
+        "by_month": _groups(month_keys, month_sums, month_counts),
+        "by_month_category": by_month_category,
+        "by_currency": _groups(table.currencies, currency_sums, currency_counts),
+        "rates": rates_version(),
+        "stats": _accumulator(amounts),
+        "quantiles": {
+            "all": QuantileSketch.from_sorted(np.sort(amounts).tolist()),
+            "by_category": _sketches(table.categories, codes, amounts),
+            "by_month": _sketches(month_keys, month_of_row, amounts),
+        },
+    }
+
+
+def row_stats(rows):
+    """Equivalente vectorizado de web_api._get_stats_from_rows para filas no vacías."""
+    native = np.fromiter((r["amount"] for r in rows), dtype=np.double, count=len(rows))
+    currencies, currency_of_row = np.unique(
+        [r.get("currency") or BASE_CURRENCY for r in rows], return_inverse=True
+    )
+    amounts = _to_base(native, currency_of_row, currencies.tolist())
+    currency_sums = np.bincount(currency_of_row, weights=native)
+    dates = np.array([r.get("date") or "" for r in rows], dtype="datetime64[D]")
+    categories, first_row, category_of_row = np.unique(
+        [r["category"] for r in rows], return_index=True, return_inverse=True
+    )
+
+    total = amounts.sum()
+    unique_dates = np.unique(dates[~np.isnat(dates)])
+    unique_months = np.unique(unique_dates.astype("datetime64[M]"))
+    daily_avg = round(float(total) / unique_dates.size, 2) if unique_dates.size else _number(total)
+    monthly_avg = round(float(total) / unique_months.size, 2) if unique_months.size else _number(total)
+
+    totals_by_cat = np.bincount(category_of_row, weights=amounts)
+    # np.unique ordena las categorías; el empate se resuelve como en Python: primera aparición
+    first_seen = np.argsort(first_row)
+    top = first_seen[np.argmax(totals_by_cat[first_seen])]
+
+    gaps = 0
+    if unique_dates.size >= 2:
+        span = (unique_dates[-1] - unique_dates[0]).astype(np.int64) + 1
+        gaps = int(span) - int(unique_dates.size)
+
+    stats = dict(_accumulator(amounts).result(), **QuantileSketch.from_sorted(np.sort(amounts).tolist()).result())
+    return dict(
+        stats,
+        daily_avg=daily_avg,
+        monthly_avg=monthly_avg,
+        top_category=str(categories[top]),
+        top_category_amount=round(float(totals_by_cat[top]), 2),
+        days_without_expense=gaps,
+        total=_number(total),
+        by_currency={c: _number(v) for c, v in zip(currencies.tolist(), currency_sums)},
+    )
@@ -0,0 +1,138 @@
+import pytest
+from src import aggregates, storage, tracker
+
+
+@pytest.fixture(autouse=True)
+def data_file(tmp_path, monkeypatch):
+    path = tmp_path / "expenses.json"
+    monkeypatch.setattr(storage, "_get_data_file", lambda: path)
+    return path
+
+
+def test_writes_update_sidecar_by_delta(data_file, monkeypatch):
+    tracker.add_expense("Pan", "Comida", 2, "2024-01-01")
+    aggregates.load_aggregates()  # crea el sidecar
+    sidecar = data_file.with_suffix(".agg.json")
+    assert sidecar.exists()
+
+    # A partir de aquí ninguna lectura debe recorrer los gastos
+    monkeypatch.setattr(aggregates, "from_records", lambda records: pytest.fail("recorrido completo"))
+    bus = tracker.add_expense("Bus", "Transporte", 5, "2024-02-01")
+    tracker.edit_expense(bus["id"], new_amount=7)
+    leche = tracker.add_expense("Leche", "Comida", 3, "2024-02-03")
+    tracker.delete_expense(leche["id"])
+
+    agg = aggregates.load_aggregates()
+    assert agg["total"] == 9 and agg["count"] == 2
+    assert agg["by_category"] == {"Comida": [2, 1], "Transporte": [7, 1]}
+    assert agg["by_month"] == {"2024-01": [2, 1], "2024-02": [7, 1]}
+    assert "2024-02-03" not in agg["by_day"]
+    assert tracker.get_total_expense() == 9
+
+
+
+def test_writes_append_to_log_instead_of_rewriting_sidecar(data_file, monkeypatch):
+    tracker.add_expense("Pan", "Comida", 2, "2024-01-01")
+    aggregates.load_aggregates()
+    sidecar = data_file.with_suffix(".agg.json")
+    log = data_file.with_suffix(".agg.log")
+    content = sidecar.read_text(encoding="utf-8")
+
+    bus = tracker.add_expense("Bus", "Transporte", 5, "2024-02-01")
+    tracker.edit_expense(bus["id"], new_amount=7)
+    tracker.add_expense("Cine", "Ocio", 4, "2024-02-03")
+    assert sidecar.read_text(encoding="utf-8") == content
+    assert len(log.read_text(encoding="utf-8").splitlines()) == 3
+
+    # Otro proceso (memoria vacía) reaplica el log sin recorrer los gastos
+    aggregates._memory.clear()
+    monkeypatch.setattr(aggregates, "from_records", lambda records: pytest.fail("recorrido completo"))
+    agg = aggregates.load_aggregates()
+    assert agg["total"] == 13 and agg["count"] == 3
+    assert agg["by_category"] == {"Comida": [2, 1], "Transporte": [7, 1], "Ocio": [4, 1]}
+
+    monkeypatch.setattr(aggregates, "AGG_CHECKPOINT_LINES", 4)
+    tracker.add_expense("Te", "Comida", 1, "2024-02-04")
+    assert not log.exists()
+    aggregates._memory.clear()
+    assert aggregates.load_aggregates()["total"] == 14
+
+def test_external_change_triggers_rebuild(data_file):
+    tracker.add_expense("Pan", "Comida", 2, "2024-01-01")
+    assert aggregates.load_aggregates()["total"] == 2
+    # Otra herramienta edita el arreglo ya consolidado (sin operaciones pendientes en el WAL)
+    storage.recover()
+    data_file.write_text('[{"description": "X", "category": "Otro", "amount": 40, "date": "2024-03-01"}]', encoding="utf-8")
+    assert aggregates.load_aggregates()["by_category"] == {"Otro": [40, 1]}
+    # Un sidecar borrado o corrupto también se recupera
+    data_file.with_suffix(".agg.json").write_text("{", encoding="utf-8")
+    aggregates._memory.clear()
+    assert aggregates.rebuild_aggregates()["total"] == 40
+
+
+def test_removing_an_extreme_rebuilds_stats(data_file):
+    tracker.add_expense("Pan", "Comida", 2, "2024-01-01")
+    cine = tracker.add_expense("Cine", "Ocio", 30, "2024-01-02")
+    tracker.add_expense("Bus", "Transporte", 5, "2024-01-03")
+    assert aggregates.load_aggregates()["stats"].result()["max"] == 30
+    tracker.delete_expense(cine["id"])
+    stats = aggregates.load_aggregates()["stats"]
+    assert not stats.stale
+    assert stats.result() == {"min": 2, "max": 5, "avg": 3.5, "std_dev": 1.5}
+
+
+def test_quantiles_per_category_and_month(data_file):
+    from src import analytics
+    for amount in (10, 20, 30):
+        tracker.add_expense("Cena", "Comida", amount, "2024-01-05")
+    bus = tracker.add_expense("Bus", "Transporte", 3, "2024-02-01")
+    assert analytics.get_amount_quantiles(category="Comida") == {"median": 20, "p90": 30, "p99": 30}
+    assert analytics.get_amount_quantiles(month="2024-02")["median"] == 3
+    assert analytics.get_basic_statistics()["median"] == 10
+    tracker.delete_expense(bus["id"])
+    assert "2024-02" not in aggregates.load_aggregates()["quantiles"]["by_month"]
+    assert analytics.get_amount_quantiles(month="2024-02") == {"median": 0, "p90": 0, "p99": 0}
+
+
+def test_query_buckets_by_period_and_category(data_file):
+    tracker.add_expense("Pan", "Comida", 2, "2024-01-01")
+    tracker.add_expense("Cena", "comida", 8, "2024-01-07")
+    tracker.add_expense("Bus", "Transporte", 5, "2024-02-01")
+    tracker.add_expense("Regalo", "Ocio", 40, "2025-03-10")
+
+    assert aggregates.query_buckets("month") == {"2024-01": [10, 2], "2024-02": [5, 1], "2025-03": [40, 1]}
+    assert aggregates.query_buckets("year") == {"2024": [15, 3], "2025": [40, 1]}
+    assert aggregates.query_buckets("week", start="2024-W01", end="2024-W05") == {"2024-W01": [10, 2], "2024-W05": [5, 1]}
+    assert aggregates.query_buckets("day", start="2024-02-01", end="2024-12-31") == {"2024-02-01": [5, 1]}
+    assert aggregates.query_buckets("month", category="COMIDA") == {"2024-01": [10, 2]}
+    assert aggregates.category_totals("2024-01") == {"Comida": 2, "comida": 8}
+    with pytest.raises(ValueError):
+        aggregates.query_buckets("week", category="Comida")
+    with pytest.raises(ValueError):
+        aggregates.query_buckets("quarter")
+
+
+def test_old_sidecar_format_is_rebuilt(data_file):
+    tracker.add_expense("Pan", "Comida", 2, "2024-01-01")
+    data_file.with_suffix(".agg.json").write_text('{"source": null, "total": 99}', encoding="utf-8")
+    aggregates._memory.clear()
+    assert aggregates.load_aggregates()["by_month_category"] == {"2024-01": {"Comida": [2, 1]}}
+
+
+def test_mixed_currencies_convert_per_group(data_file, tmp_path, monkeypatch):
+    from src import currency, report
+    monkeypatch.setattr(currency, "RATES_FILE", tmp_path / "rates.csv")
+    tracker.add_expense("Pan", "Comida", 10000, "2024-01-01")
+    tracker.add_expense("Hotel", "Viaje", 5, "2024-01-02", currency="usd")
+    tracker.add_expense("Taxi", "Viaje", 5, "2024-01-03", currency="USD")
+    agg = aggregates.load_aggregates()
+    assert agg["by_currency"] == {"COP": [10000, 1], "USD": [10, 2]}
+    assert agg["by_category"]["Viaje"][0] == pytest.approx(40000)
+    rep = report.build_report()
+    assert rep["total"] == pytest.approx(50000) and rep["by_currency"] == {"COP": 10000, "USD": 10}
+
+    # Nuevas tasas: los agregados convertidos dejan de servir y se reconstruyen
+    (tmp_path / "rates.csv").write_text("date,currency,rate\n2020-01-01,USD,0.0005\n", encoding="utf-8")
+    assert aggregates.load_aggregates()["total"] == pytest.approx(30000)
+    with pytest.raises(ValueError):
+        tracker.add_expense("X", "Y", 1, "2024-01-04", currency="JPY")
@@ -1,10 +1,70 @@
-from src import analytics
+from src import aggregates, analytics, report
 
 def test_basic_statistics(monkeypatch):
     mock_data = [{"amount": 10}, {"amount": 20}, {"amount": 30}]
-    monkeypatch.setattr(analytics, "load_data", lambda: mock_data)
+    monkeypatch.setattr(report, "load_aggregates", lambda: aggregates.from_records(mock_data))
     stats = analytics.get_basic_statistics()
     assert stats["min"] == 10
     assert stats["max"] == 30
     assert "avg" in stats
     assert "std_dev" in stats
+
+
+def test_stats_accumulator_matches_statistics_and_merges():
+    import statistics
+    amounts = [12.5, 3, 40, 7.25, 19, 3, 88]
+    acc = analytics.StatsAccumulator.from_amounts(amounts)
+    assert acc.result() == {
+        "min": 3,
+        "max": 88,
+        "avg": round(statistics.mean(amounts), 2),
+        "std_dev": round(statistics.pstdev(amounts), 2),
+    }
+
+    left = analytics.StatsAccumulator.from_amounts(amounts[:3])
+    right = analytics.StatsAccumulator.from_amounts(amounts[3:])
+    assert left.merge(right).result() == acc.result()
+
+    restored = analytics.StatsAccumulator.from_dict(acc.to_dict())
+    restored.remove(40)
+    rest = [a for a in amounts if a != 40]
+    assert restored.result()["std_dev"] == round(statistics.pstdev(rest), 2)
+    assert not restored.stale
+    restored.remove(88)
+    assert restored.stale  # se retiró el máximo
+
+
+def test_stats_accumulator_replace_keeps_extremes_when_possible():
+    acc = analytics.StatsAccumulator.from_amounts([1, 5, 9])
+    acc.replace(9, 12)
+    assert not acc.stale and acc.max == 12
+    acc.replace(12, 2)
+    assert acc.stale
+
+
+def test_quantile_sketch_is_bounded_and_accurate():
+    import random
+    rng = random.Random(3)
+    amounts = [rng.uniform(0, 1000) for _ in range(20000)]
+    exact = sorted(amounts)
+    sketch = analytics.QuantileSketch.from_amounts(amounts)
+    assert sum(len(level) for level in sketch.levels) < 3 * sketch.k
+    for q in (0.5, 0.9, 0.99):
+        assert abs(sketch.quantile(q) - exact[int(q * len(exact)) - 1]) < 0.03 * 1000
+
+    left = analytics.QuantileSketch.from_amounts(amounts[:7000])
+    right = analytics.QuantileSketch.from_dict(analytics.QuantileSketch.from_amounts(amounts[7000:]).to_dict())
+    merged = left.merge(right)
+    assert merged.count == 20000
+    assert abs(merged.quantile(0.5) - exact[9999]) < 0.03 * 1000
+
+
+def test_quantile_sketch_removals():
+    sketch = analytics.QuantileSketch.from_amounts([4, 8, 15, 16, 23, 42])
+    sketch.remove(42)
+    assert sketch.result() == {"median": 15, "p90": 23, "p99": 23}
+    assert not sketch.stale
+    big = analytics.QuantileSketch.from_amounts(range(1000))
+    for value in range(200):
+        big.remove(value)  # ya compactados: solo se cuentan
+    assert big.stale and big.count == 800
@@ -1,3 +1,4 @@
+import pytest
 from pathlib import Path
 from src import backup
 
@@ -9,3 +10,217 @@ def test_create_backup(tmp_path, monkeypatch):
     zip_path = backup.create_backup()
     assert zip_path.endswith(".zip")
     assert Path(zip_path).exists()
+
+def test_incremental_backup_deduplicates(tmp_path, monkeypatch):
+    monkeypatch.setattr(backup, "BACKUPS_DIR", tmp_path / "backups")
+    monkeypatch.setattr(backup, "DATA_DIR", tmp_path / "data")
+    monkeypatch.setattr(backup, "INCLUDE_ROOT", [tmp_path / "users.json"])
+    monkeypatch.setattr(backup, "CHUNK_SIZE", 64)
+    (tmp_path / "users.json").write_text("{}", encoding="utf-8")
+    (tmp_path / "data").mkdir()
+    ana = tmp_path / "data" / "ana_expenses.json"
+    ana.write_text("x" * 300, encoding="utf-8")
+    (tmp_path / "data" / "bob_expenses.jsonl").write_text("y" * 100, encoding="utf-8")
+
+    first = backup.load_manifest(Path(backup.create_incremental_backup()))
+    assert sorted(first["files"]) == ["data/ana_expenses.json", "data/bob_expenses.jsonl", "users.json"]
+    assert first["stats"]["changed"] == 3
+    assert first["stats"]["chunks_written"] == 5  # los 4 bloques iguales de "x" se guardan una vez
+
+    # Solo cambia ana: bob y users.json no se leen, y los bloques iniciales se reutilizan
+    ana.write_text("x" * 300 + "nuevo", encoding="utf-8")
+    second = backup.load_manifest(Path(backup.create_incremental_backup()))
+    assert second["stats"]["changed"] == 1
+    assert second["stats"]["bytes_read"] == 305
+    assert second["stats"]["chunks_written"] == 1
+    assert second["files"]["users.json"] == first["files"]["users.json"]
+    assert backup.read_backup_file(second, "data/ana_expenses.json") == ("x" * 300 + "nuevo").encode()
+    assert backup.read_backup_file(first, "data/ana_expenses.json") == b"x" * 300
+    assert len(backup.list_manifests()) == 2
+
+def test_zip_backup_streams_without_staging_dir(tmp_path, monkeypatch):
+    import zipfile
+
+    monkeypatch.setattr(backup, "BACKUPS_DIR", tmp_path / "backups")
+    monkeypatch.setattr(backup, "DATA_DIR", tmp_path / "data")
+    monkeypatch.setattr(backup, "INCLUDE_ROOT", [tmp_path / "users.json", tmp_path / "falta.csv"])
+    monkeypatch.setattr(backup, "ZIP_STREAM_LIMIT", 5000)
+    (tmp_path / "users.json").write_text("{}", encoding="utf-8")
+    (tmp_path / "data").mkdir()
+    contents = {f"data/u{i}_expenses.json": ("[%d]" % i) * (i * 50) for i in range(20)}
+    contents["data/grande.jsonl"] = "linea\n" * 2000  # supera el límite: va por zipfile.write
+    for name, text in contents.items():
+        (tmp_path / name).write_text(text, encoding="utf-8")
+
+    seen = []
+    report = backup.write_zip_backup(max_workers=4, progress=lambda done, total, name: seen.append((done, total)))
+    assert report["files"] == 22
+    assert seen[-1] == (22, 22)
+    assert report["bytes_in"] == sum(len(t) for t in contents.values()) + 2
+    assert report["bytes_out"] < report["bytes_in"]
+    with zipfile.ZipFile(report["path"]) as zf:
+        assert zf.testzip() is None
+        assert zf.read("users.json") == b"{}"
+        for name, text in contents.items():
+            assert zf.read(name).decode("utf-8") == text
+    # Sin carpeta intermedia ni temporales
+    assert sorted(p.name for p in (tmp_path / "backups").iterdir()) == [Path(report["path"]).name]
+
+def _setup_sources(tmp_path, monkeypatch):
+    monkeypatch.setattr(backup, "BACKUPS_DIR", tmp_path / "backups")
+    monkeypatch.setattr(backup, "DATA_DIR", tmp_path / "data")
+    monkeypatch.setattr(backup, "INCLUDE_ROOT", [tmp_path / "users.json"])
+    (tmp_path / "users.json").write_text("{}", encoding="utf-8")
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "ana_expenses.json").write_text("[1]", encoding="utf-8")
+    (tmp_path / "data" / "bob_expenses.json").write_text("[2]", encoding="utf-8")
+
+def test_restore_single_user_from_zip_reads_only_its_members(tmp_path, monkeypatch):
+    import zipfile
+
+    _setup_sources(tmp_path, monkeypatch)
+    zip_path = Path(backup.create_backup())
+    zip_path.rename(zip_path.with_name("backup_20240101_120000.zip"))
+    (tmp_path / "data" / "ana_expenses.json").write_text("[1, 99]", encoding="utf-8")
+    (tmp_path / "data" / "ana_expenses.wal").write_text('{"op": "del", "id": 1}\n', encoding="utf-8")
+    (tmp_path / "data" / "bob_expenses.json").write_text("[2, 3]", encoding="utf-8")
+
+    opened = []
+    real_open = zipfile.ZipFile.open
+    monkeypatch.setattr(zipfile.ZipFile, "open", lambda zf, name, *a, **k: opened.append(name) or real_open(zf, name, *a, **k))
+    report = backup.restore_backup(user="ana")
+    assert opened == ["data/ana_expenses.json"]
+    assert report["restored"] == ["data/ana_expenses.json"]
+    assert report["removed"] == ["data/ana_expenses.wal"]
+    assert (tmp_path / "data" / "ana_expenses.json").read_text(encoding="utf-8") == "[1]"
+    assert (tmp_path / "data" / "bob_expenses.json").read_text(encoding="utf-8") == "[2, 3]"
+    assert not (tmp_path / "data" / "ana_expenses.wal").exists()
+    with pytest.raises(ValueError):
+        backup.restore_backup(user="carla")
+    with pytest.raises(ValueError):
+        backup.restore_backup(at="2023-12-31")
+
+def test_restore_rejects_corrupt_member_without_touching_files(tmp_path, monkeypatch):
+    import zipfile
+
+    _setup_sources(tmp_path, monkeypatch)
+    (tmp_path / "backups").mkdir()
+    broken = tmp_path / "backups" / "backup_20240101_120000.zip"
+    with zipfile.ZipFile(broken, "w", zipfile.ZIP_STORED) as zf:
+        zf.writestr("data/ana_expenses.json", "[111, 222]")
+    raw = broken.read_bytes()
+    broken.write_bytes(raw.replace(b"[111, 222]", b"[111, 999]"))
+
+    with pytest.raises(ValueError):
+        backup.restore_backup()
+    assert (tmp_path / "data" / "ana_expenses.json").read_text(encoding="utf-8") == "[1]"
+    assert sorted(p.name for p in (tmp_path / "data").iterdir()) == ["ana_expenses.json", "bob_expenses.json"]
+
+def test_restore_rejects_paths_outside_target(tmp_path, monkeypatch):
+    import zipfile
+
+    _setup_sources(tmp_path, monkeypatch)
+    (tmp_path / "backups").mkdir()
+    for i, name in enumerate(("data/../../evil.txt", "/tmp/evil.txt", "../evil.txt", "otro.txt")):
+        with zipfile.ZipFile(tmp_path / "backups" / f"backup_2024010{i + 1}_120000.zip", "w") as zf:
+            zf.writestr("data/ana_expenses.json", "[5]")
+            zf.writestr(name, "x")
+        with pytest.raises(ValueError):
+            backup.restore_backup()
+        if name != "otro.txt":
+            with pytest.raises(ValueError):
+                backup.restore_backup(target_dir=tmp_path / "out")
+    assert not (tmp_path.parent / "evil.txt").exists()
+    assert (tmp_path / "data" / "ana_expenses.json").read_text(encoding="utf-8") == "[1]"
+    assert sorted(p.name for p in (tmp_path / "data").iterdir()) == ["ana_expenses.json", "bob_expenses.json"]
+
+
+def test_restore_removes_stale_aggregate_log(tmp_path, monkeypatch):
+    _setup_sources(tmp_path, monkeypatch)
+    Path(backup.create_backup()).rename(tmp_path / "backups" / "backup_20240101_120000.zip")
+    (tmp_path / "data" / "ana_expenses.agg.log").write_text("{}\n", encoding="utf-8")
+    report = backup.restore_backup(user="ana")
+    assert report["removed"] == ["data/ana_expenses.agg.log"]
+    assert not (tmp_path / "data" / "ana_expenses.agg.log").exists()
+
+
+def test_restore_to_timestamp_from_incremental_backups(tmp_path, monkeypatch):
+    _setup_sources(tmp_path, monkeypatch)
+    manifests = tmp_path / "backups" / "manifests"
+    Path(backup.create_incremental_backup()).rename(manifests / "manifest_20240101_100000_000000.json")
+    (tmp_path / "data" / "ana_expenses.json").write_text("[1, 2]", encoding="utf-8")
+    Path(backup.create_incremental_backup()).rename(manifests / "manifest_20240102_100000_000000.json")
+    (tmp_path / "data" / "ana_expenses.json").write_text("[1, 2, 3]", encoding="utf-8")
+
+    report = backup.restore_backup(at="2024-01-01", target_dir=tmp_path / "out")
+    assert report["created_at"] == "2024-01-01 10:00:00"
+    assert (tmp_path / "out" / "data" / "ana_expenses.json").read_text(encoding="utf-8") == "[1]"
+    assert (tmp_path / "data" / "ana_expenses.json").read_text(encoding="utf-8") == "[1, 2, 3]"
+
+    report = backup.restore_backup(at="2024-01-05 00:00:00")
+    assert sorted(report["restored"]) == ["data/ana_expenses.json", "data/bob_expenses.json", "users.json"]
+    assert (tmp_path / "data" / "ana_expenses.json").read_text(encoding="utf-8") == "[1, 2]"
+
+def test_sqlite_backup_includes_rows_still_in_wal(tmp_path, monkeypatch):
+    import sqlite3
+    import zipfile
+    from src import sqlite_store, storage
+
+    monkeypatch.setattr(backup, "BACKUPS_DIR", tmp_path / "backups")
+    monkeypatch.setattr(backup, "DATA_DIR", tmp_path / "data")
+    monkeypatch.setattr(backup, "INCLUDE_ROOT", [])
+    (tmp_path / "data").mkdir()
+    data_file = tmp_path / "data" / "bob_expenses.json"
+    monkeypatch.setattr(storage, "STORAGE_BACKEND", "sqlite")
+    monkeypatch.setattr(storage, "_get_data_file", lambda: data_file)
+    for i in range(3):
+        storage.append_record({"description": f"g{i}", "category": "Comida", "amount": i, "date": "2024-01-01"})
+    assert (tmp_path / "data" / "bob_expenses.db-wal").stat().st_size > 0
+
+    def rows(raw):
+        copy = tmp_path / "copia.db"
+        copy.write_bytes(raw)
+        conn = sqlite3.connect(copy)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM expenses").fetchone()[0]
+        finally:
+            conn.close()
+            copy.unlink()
+
+    with zipfile.ZipFile(backup.write_zip_backup()["path"]) as zf:
+        assert "data/bob_expenses.db" in zf.namelist()
+        assert rows(zf.read("data/bob_expenses.db")) == 3
+
+    first = backup.load_manifest(Path(backup.create_incremental_backup()))
+    assert rows(backup.read_backup_file(first, "data/bob_expenses.db")) == 3
+    # Una fila nueva solo cambia el -wal: igual se detecta el cambio
+    storage.append_record({"description": "g3", "category": "Comida", "amount": 3, "date": "2024-01-02"})
+    second = backup.load_manifest(Path(backup.create_incremental_backup()))
+    assert second["files"]["data/bob_expenses.db"]["stamp"] != first["files"]["data/bob_expenses.db"]["stamp"]
+    assert rows(backup.read_backup_file(second, "data/bob_expenses.db")) == 4
+    sqlite_store.close_all()
+
+def test_restore_sqlite_drops_rows_added_after_backup(tmp_path, monkeypatch):
+    import sqlite3
+    from src import sqlite_store, storage
+
+    monkeypatch.setattr(backup, "BACKUPS_DIR", tmp_path / "backups")
+    monkeypatch.setattr(backup, "DATA_DIR", tmp_path / "data")
+    monkeypatch.setattr(backup, "INCLUDE_ROOT", [])
+    (tmp_path / "data").mkdir()
+    data_file = tmp_path / "data" / "bob_expenses.json"
+    monkeypatch.setattr(storage, "STORAGE_BACKEND", "sqlite")
+    monkeypatch.setattr(storage, "_get_data_file", lambda: data_file)
+    storage.append_record({"description": "antes", "category": "Comida", "amount": 1, "date": "2024-01-01"})
+    zip_path = Path(backup.create_backup())
+    zip_path.rename(zip_path.with_name("backup_20240101_120000.zip"))
+    storage.append_record({"description": "later", "category": "Comida", "amount": 2, "date": "2024-01-02"})
+
+    backup.restore_backup(user="bob")
+    assert [e["description"] for e in storage.load_data()] == ["antes"]
+    conn = sqlite3.connect(tmp_path / "data" / "bob_expenses.db")
+    try:
+        assert conn.execute("SELECT description FROM expenses").fetchall() == [("antes",)]
+    finally:
+        conn.close()
+    sqlite_store.close_all()
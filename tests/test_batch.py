@@ -0,0 +1,58 @@
+import json
+
+from src import batch, budget, storage
+
+
+def _write_user(data_dir, name, expenses):
+    path = data_dir / f"{name}_expenses.json"
+    path.write_text(json.dumps(expenses), encoding="utf-8")
+    return path
+
+
+def test_run_batch_merges_users(tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    _write_user(data_dir, "ana", [
+        {"description": "Pan", "category": "Comida", "amount": 10, "date": "2024-05-01"},
+        {"description": "Bus", "category": "Transporte", "amount": 30, "date": "2024-05-03"},
+    ])
+    _write_user(data_dir, "luis", [{"description": "Cine", "category": "Ocio", "amount": 20, "date": "2024-04-20"}])
+    (data_dir / "otro.txt").write_text("x", encoding="utf-8")
+    monkeypatch.setattr(budget, "BUDGET_FILE", tmp_path / "budget.json")
+    budget.set_monthly_budget(25)
+    # La sesión no interviene: ningún usuario está logueado
+    monkeypatch.setattr(storage, "get_current_user", lambda: None)
+
+    out = tmp_path / "summary.json"
+    summary = batch.run_batch(max_workers=2, month="2024-05", summary_file=out, data_dir=data_dir)
+
+    assert batch.discover_users(data_dir) == ["ana", "luis"]
+    assert json.loads(out.read_text(encoding="utf-8")) == json.loads(json.dumps(summary))
+    ana, luis = summary["users"]["ana"], summary["users"]["luis"]
+    assert ana["report"]["top_category"] == "Transporte"
+    assert ana["monthly_totals"] == {"2024-05": 40}
+    assert ana["budget"]["status"] == "Superado"
+    assert luis["budget"] == {"status": "OK", "budget": 25, "spent": 0, "remaining": 25}
+    totals = summary["totals"]
+    assert totals["users"] == 2 and totals["count"] == 3 and totals["total"] == 60
+    assert totals["over_budget"] == ["ana"]
+    assert totals["stats"]["min"] == 10 and totals["stats"]["max"] == 30 and totals["stats"]["median"] == 20
+
+
+def test_run_batch_uses_month_override(tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    _write_user(data_dir, "ana", [{"description": "Pan", "category": "Comida", "amount": 40, "date": "2024-05-01"}])
+    monkeypatch.setattr(budget, "BUDGET_FILE", tmp_path / "budget.json")
+    budget.set_monthly_budget(25)
+    budget.set_monthly_budget(50, month="2024-05")
+
+    summary = batch.run_batch(max_workers=1, month="2024-05", summary_file=tmp_path / "s.json", data_dir=data_dir)
+
+    assert summary["users"]["ana"]["budget"] == {"status": "OK", "budget": 50, "spent": 40, "remaining": 10}
+    assert summary["totals"]["over_budget"] == []
+
+
+def test_run_batch_without_users(tmp_path):
+    summary = batch.run_batch(summary_file=tmp_path / "s.json", data_dir=tmp_path / "nada")
+    assert summary["users"] == {} and summary["totals"]["count"] == 0
@@ -1,11 +1,45 @@
-from src import budget
+from src import budget, storage
 
 def test_set_and_check_budget(tmp_path, monkeypatch):
     monkeypatch.setattr(budget, "BUDGET_FILE", tmp_path / "budget.json")
-    monkeypatch.setattr(budget, "load_data", lambda: [
+    monkeypatch.setattr(storage, "_get_data_file", lambda: tmp_path / "expenses.json")
+    storage.save_data([
         {"amount": 100, "date": "2025-10-10"},
         {"amount": 50, "date": "2025-10-12"},
     ])
     budget.set_monthly_budget(200)
     status = budget.check_budget_status()
     assert "Presupuesto" in status
+    assert budget.get_monthly_spent("2025-10") == 150
+
+
+def test_category_budgets_follow_write_deltas(tmp_path, monkeypatch):
+    from datetime import datetime
+    from src import aggregates, tracker
+    monkeypatch.setattr(budget, "BUDGET_FILE", tmp_path / "budget.json")
+    monkeypatch.setattr(storage, "_get_data_file", lambda: tmp_path / "expenses.json")
+    month = datetime.now().strftime("%Y-%m")
+    budget.set_category_budget("Comida", 50)
+    budget.set_category_budget("Ocio", 10)
+    budget.set_category_budget("Ocio", 100, month="2024-01")
+    budget.set_monthly_budget(500)
+    assert budget.get_budget_limits("2024-01") == (500, {"Comida": 50, "Ocio": 100})
+    assert budget.get_budget_limits(month) == (500, {"Comida": 50, "Ocio": 10})
+
+    cena = tracker.add_expense("Cena", "comida", 40, f"{month}-02")
+    tracker.add_expense("Cine", "Ocio", 8, f"{month}-03")
+    tracker.add_expense("Café", "Bebidas", 1, f"{month}-04")
+    tracker.add_expense("Viaje", "Viajes", 300, f"{month}-05")
+    aggregates.load_aggregates()
+    # Desde aquí el estado sale de los contadores, sin recorrer los gastos
+    monkeypatch.setattr(aggregates, "from_records", lambda records: None)
+    tracker.edit_expense(cena["id"], new_amount=70)
+    status = {item["category"]: item for item in budget.get_category_status(month)}
+    assert status["Comida"]["spent"] == 70 and status["Comida"]["status"] == "Superado"
+    assert status["Ocio"] == {"category": "Ocio", "budget": 10, "spent": 8, "remaining": 2, "status": "OK"}
+
+    report = budget.check_budget_status()
+    assert report.splitlines()[0].startswith("✅ Presupuesto OK")
+    assert "🚨 Comida: $70 / $50" in report
+    tracker.delete_expense(cena["id"])
+    assert "✅ Comida" in budget.check_budget_status()
@@ -1,11 +1,11 @@
-from src import charts
+from src import aggregates, charts
 
 def test_chart_by_category(monkeypatch, capsys):
     mock_data = [
         {"category": "Comida", "amount": 100},
         {"category": "Transporte", "amount": 50},
     ]
-    monkeypatch.setattr(charts, "load_data", lambda: mock_data)
+    monkeypatch.setattr(charts, "load_aggregates", lambda: aggregates.from_records(mock_data))
     charts.chart_by_category()
     captured = capsys.readouterr()
     assert "Comida" in captured.out
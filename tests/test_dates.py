@@ -0,0 +1,27 @@
+from datetime import date
+
+from src.dates import day_ordinal, gap_days, gap_ranges, month_bounds, to_iso
+
+
+def test_day_ordinal_parses_and_rejects():
+    assert day_ordinal("2024-02-29") == date(2024, 2, 29).toordinal()
+    assert day_ordinal("2024-02-29T08:30") == day_ordinal("2024-02-29")
+    for bad in ("2023-02-29", "2024-1-05", "2024-+1-05", "hoy", "", None):
+        assert day_ordinal(bad) == 0
+    assert to_iso(day_ordinal("2024-03-01")) == "2024-03-01" and to_iso(0) == ""
+
+
+def test_month_bounds_crosses_year():
+    start, end = month_bounds("2024-12")
+    assert to_iso(start) == "2024-12-01" and to_iso(end) == "2025-01-01"
+
+
+def test_gap_ranges_are_run_lengths():
+    days = [day_ordinal(d) for d in ("2024-01-05", "2024-01-01", "2024-01-02", "2026-01-01", "", "2024-01-02")]
+    ranges = gap_ranges(days)
+    assert [(to_iso(a), to_iso(b)) for a, b in ranges] == [
+        ("2024-01-03", "2024-01-04"),
+        ("2024-01-06", "2025-12-31"),
+    ]
+    assert gap_days(ranges) == 2 + (date(2025, 12, 31) - date(2024, 1, 6)).days + 1
+    assert gap_ranges([]) == [] and gap_days([]) == 0
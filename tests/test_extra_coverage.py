@@ -9,13 +9,15 @@ import logging
 
 import pytest
 
-from src import analytics, api, backup, budget, charts, report, storage, tracker, users, db_mysql
+from src import aggregates, analytics, api, backup, budget, charts, report, storage, tracker, users, db_mysql
 from src import currency, notifications, logger
 
 
 def test_analytics_empty(monkeypatch):
-    monkeypatch.setattr(analytics, "load_data", lambda: [])
-    assert analytics.get_basic_statistics() == {"min": 0, "max": 0, "avg": 0, "std_dev": 0}
+    monkeypatch.setattr(report, "load_aggregates", aggregates.empty)
+    assert analytics.get_basic_statistics() == {
+        "min": 0, "max": 0, "avg": 0, "std_dev": 0, "median": 0, "p90": 0, "p99": 0
+    }
 
 
 def test_api_reuse_and_stop(monkeypatch):
@@ -61,38 +63,32 @@ def test_backup_creates_zip(tmp_path, monkeypatch):
 
 def test_budget_branches(tmp_path, monkeypatch):
     monkeypatch.setattr(budget, "BUDGET_FILE", tmp_path / "budget.json")
+    monkeypatch.setattr(storage, "_get_data_file", lambda: tmp_path / "expenses.json")
 
     # Sin presupuesto configurado y sin datos
-    monkeypatch.setattr(budget, "load_data", lambda: [])
     assert budget.get_monthly_spent("1900-01") == 0
     assert "No hay presupuesto" in budget.check_budget_status()
 
     # Presupuesto y gasto mayor
     budget.set_monthly_budget(100)
     current_month = __import__("datetime").datetime.now().strftime("%Y-%m")
-    monkeypatch.setattr(
-        budget,
-        "load_data",
-        lambda: [{"date": f"{current_month}-10", "amount": 150}],
-    )
+    storage.save_data([{"date": f"{current_month}-10", "amount": 150}])
     assert "Presupuesto superado" in budget.check_budget_status()
 
     # Presupuesto y gasto menor
     budget.set_monthly_budget(200)
-    monkeypatch.setattr(
-        budget,
-        "load_data",
-        lambda: [{"date": "2024-01-10", "amount": 50}],
-    )
+    storage.save_data([{"date": "2024-01-10", "amount": 50}])
     ok_msg = budget.check_budget_status()
     assert "Presupuesto OK" in ok_msg and "disponible" in ok_msg
+    assert budget.get_monthly_spent("2024-01") == 50
+    assert budget.get_monthly_spent("2024") == 50
 
 
 def test_charts_outputs(monkeypatch, capsys):
     # Barra vacía cuando max_value es 0
     assert charts._bar(5, 0) == ""
 
-    monkeypatch.setattr(charts, "load_data", lambda: [])
+    monkeypatch.setattr(charts, "load_aggregates", aggregates.empty)
     charts.chart_by_category()
     out_empty_cat = capsys.readouterr().out
     charts.chart_by_month()
@@ -102,11 +98,11 @@ def test_charts_outputs(monkeypatch, capsys):
 
     monkeypatch.setattr(
         charts,
-        "load_data",
-        lambda: [
+        "load_aggregates",
+        lambda: aggregates.from_records([
             {"description": "A", "category": "Comida", "amount": 10, "date": "2024-01-01"},
             {"description": "B", "category": "Transporte", "amount": 5, "date": "2024-01-02"},
-        ],
+        ]),
     )
     charts.chart_by_category()
     out1 = capsys.readouterr().out
@@ -118,7 +114,7 @@ def test_charts_outputs(monkeypatch, capsys):
 
 
 def test_report_functions(monkeypatch):
-    monkeypatch.setattr(report, "load_data", lambda: [])
+    monkeypatch.setattr(report, "load_aggregates", aggregates.empty)
     assert report.get_average_daily_expense() == 0
     assert report.get_average_monthly_expense() == 0
     assert report.get_most_expensive_category() == (None, 0)
@@ -129,12 +125,18 @@ def test_report_functions(monkeypatch):
         {"date": "2024-01-02", "amount": 20, "category": "Comida"},
         {"date": "2024-02-01", "amount": 5, "category": "Transporte"},
     ]
-    monkeypatch.setattr(report, "load_data", lambda: data)
+    monkeypatch.setattr(report, "load_aggregates", lambda: aggregates.from_records(data))
     assert report.get_average_daily_expense() == 11.67
     assert report.get_average_monthly_expense() == 17.5
     assert report.get_most_expensive_category() == ("Comida", 30)
-    # La función está incompleta pero debe procesar fechas sin lanzar excepciones
-    assert report.get_days_without_expense() is None
+    assert report.get_days_without_expense() == [("2024-01-03", "2024-01-31")]
+
+    full = report.build_report(data)
+    assert full["count"] == 3 and full["total"] == 35
+    assert full["days_without_expense_count"] == 29
+    assert full["stats"] == {
+        "min": 5, "max": 20, "avg": 11.67, "std_dev": 6.24, "median": 10, "p90": 20, "p99": 20
+    }
 
 
 def test_storage_error_handling(tmp_path, monkeypatch):
@@ -151,7 +153,7 @@ def test_storage_error_handling(tmp_path, monkeypatch):
 
     # Guardado y lectura correcta
     storage.save_data([{"a": 1}])
-    assert storage.load_data() == [{"a": 1}]
+    assert storage.load_data() == [{"a": 1, "id": 1}]
 
 
 def test_storage_for_user(tmp_path, monkeypatch):
@@ -160,46 +162,49 @@ def test_storage_for_user(tmp_path, monkeypatch):
     monkeypatch.setattr(storage, "get_expenses_file_for_user", lambda u: tmp_path / f"{u}_expenses.json")
     storage.save_data([{"x": 1}])
     assert (tmp_path / "user1_expenses.json").exists()
-    assert storage.load_data() == [{"x": 1}]
+    assert storage.load_data() == [{"x": 1, "id": 1}]
 
 
 def test_tracker_errors_and_exports(tmp_path, monkeypatch):
-    data = []
+    data = {}
 
-    def fake_load():
-        return list(data)
+    def fake_append(expense):
+        record = dict(expense, id=len(data) + 1)
+        data[record["id"]] = record
+        return record
 
-    def fake_save(new_data):
-        data.clear()
-        data.extend(new_data)
+    def fake_replace(expense_id, expense):
+        data[expense_id] = expense
+        return expense
 
-    monkeypatch.setattr(tracker, "load_data", fake_load)
-    monkeypatch.setattr(tracker, "save_data", fake_save)
+    monkeypatch.setattr(tracker, "get_record", data.get)
+    monkeypatch.setattr(tracker, "iter_expenses", lambda: iter(list(data.values())))
+    monkeypatch.setattr(tracker, "append_record", fake_append)
+    monkeypatch.setattr(tracker, "replace_record", fake_replace)
 
     with pytest.raises(IndexError):
-        tracker.edit_expense(0, new_description="X")
-    with pytest.raises(IndexError):
-        tracker.delete_expense(0)
+        tracker.edit_expense(1, new_description="X")
     with pytest.raises(ValueError):
         tracker.export_to_csv(tmp_path / "empty.csv")
 
-    tracker.add_expense("A", "Comida", 10, date="2024-01-01")
-    tracker.edit_expense(0, new_category="Transporte", new_amount=20, new_date="2024-01-02")
-    assert data[0]["category"] == "Transporte" and data[0]["amount"] == 20 and data[0]["date"] == "2024-01-02"
+    added = tracker.add_expense("A", "Comida", 10, date="2024-01-01")
+    tracker.edit_expense(added["id"], new_category="Transporte", new_amount=20, new_date="2024-01-02")
+    assert data[1]["category"] == "Transporte" and data[1]["amount"] == 20 and data[1]["date"] == "2024-01-02"
 
     csv_path = tmp_path / "out.csv"
     tracker.export_to_csv(csv_path)
     assert csv_path.exists()
 
 
-def test_tracker_filters(monkeypatch):
+def test_tracker_filters(tmp_path, monkeypatch):
     records = [
         {"description": "A", "category": "Comida", "amount": 10, "date": "2024-01-02"},
         {"description": "B", "category": "Viaje", "amount": 5, "date": "2024-02-10"},
     ]
-    monkeypatch.setattr(tracker, "load_data", lambda: records)
-    assert tracker.filter_by_date("2024-01-02") == [records[0]]
-    assert tracker.filter_by_month("2024-02") == [records[1]]
+    monkeypatch.setattr(storage, "_get_data_file", lambda: tmp_path / "expenses.json")
+    storage.save_data(records)
+    assert tracker.filter_by_date("2024-01-02") == [dict(records[0], id=1)]
+    assert tracker.filter_by_month("2024-02") == [dict(records[1], id=2)]
 
 
 def test_users_flows(tmp_path, monkeypatch):
@@ -228,26 +233,22 @@ def test_currency_conversion_and_errors():
 
 
 def test_notifications_paths(monkeypatch):
+    def use(records):
+        monkeypatch.setattr(notifications, "load_aggregates", lambda: aggregates.from_records(records))
+        notifications.engine.reset()
+
     # Sin gastos
-    monkeypatch.setattr(notifications, "load_data", lambda: [])
+    use([])
     assert "No hay gastos" in notifications.check_inactivity_alert()
 
     # Con gasto muy antiguo
     old_date = (datetime.datetime.now() - datetime.timedelta(days=10)).strftime("%Y-%m-%d")
-    monkeypatch.setattr(
-        notifications,
-        "load_data",
-        lambda: [{"date": old_date, "amount": 1, "category": "A"}],
-    )
+    use([{"date": old_date, "amount": 1, "category": "A"}])
     assert "No registras gastos" in notifications.check_inactivity_alert()
 
     # Alerts combinadas
     monkeypatch.setattr(notifications, "check_budget_status", lambda: "presupuesto")
-    monkeypatch.setattr(
-        notifications,
-        "load_data",
-        lambda: [{"date": datetime.datetime.now().strftime("%Y-%m-%d"), "amount": 1, "category": "A"}],
-    )
+    use([{"date": datetime.datetime.now().strftime("%Y-%m-%d"), "amount": 1, "category": "A"}])
     alerts = notifications.system_alerts()
     assert "presupuesto" in alerts[0]
     assert "Actividad" in alerts[1] or "registras" in alerts[1]
@@ -274,15 +275,30 @@ def test_db_mysql_monkeypatched(monkeypatch):
         {"id": 2, "date": "2024-01-02", "category": "B", "amount": Decimal("5.00"), "description": None},
     ]
 
+    executed = []
+
     class FakeCursor:
         def __init__(self, data):
             self.data = data
             self._results = []
             self.lastrowid = None
             self.rowcount = 0
+            self.queries = executed
 
         def execute(self, query, params=None):
-            if "ORDER BY" in query:
+            self.queries.append(query)
+            if "information_schema" in query:
+                self._results = [(0,)]
+            elif "MAX(date)" in query:
+                self._results = [{"date": max(str(r["date"]) for r in self.data)}] if self.data else []
+            elif "GROUP BY currency" in query:
+                totals = {}
+                for r in self.data:
+                    if params[0] <= str(r["date"]) < params[1]:
+                        code = r.get("currency")
+                        totals[code] = totals.get(code, 0) + r["amount"]
+                self._results = [{"currency": code, "total": total} for code, total in totals.items()]
+            elif "ORDER BY" in query:
                 self._results = list(self.data)
             elif "WHERE id = %s" in query and "DELETE" not in query and "UPDATE" not in query:
                 wanted = params[0]
@@ -296,14 +312,16 @@ def test_db_mysql_monkeypatched(monkeypatch):
                         "category": params[1],
                         "amount": params[2],
                         "description": params[3],
+                        "currency": params[4],
                     }
                 )
                 self.lastrowid = new_id
             elif query.strip().startswith("UPDATE"):
-                exp_id = params[4]
+                exp_id = params[-1]
                 for row in self.data:
                     if row["id"] == exp_id:
                         row.update({"date": params[0], "category": params[1], "amount": params[2], "description": params[3]})
+                        row["currency"] = params[4]
                         self.rowcount = 1
                         break
             elif query.strip().startswith("DELETE"):
@@ -337,15 +355,47 @@ def test_db_mysql_monkeypatched(monkeypatch):
 
     conn = FakeConnection(fake_rows)
     monkeypatch.setattr(db_mysql.mysql.connector, "connect", lambda **kwargs: conn)
+    monkeypatch.setattr(db_mysql, "_schema_checked", False)
 
     all_rows = db_mysql.get_all_expenses()
     assert len(all_rows) == 2 and all_rows[0]["amount"] == 10.5
 
     row = db_mysql.get_expense_by_id(1)
     assert row["id"] == 1
+    assert db_mysql.get_last_expense_date() == "2024-01-02"
+    assert db_mysql.get_month_spent_by_currency("2024-01-01", "2024-02-01") == {"COP": 15.5}
+
+    # La primera conexión agrega la columna currency si falta, y solo una vez
+    assert sum("ALTER TABLE expenses ADD COLUMN currency" in q for q in executed) == 1
 
-    new_id = db_mysql.insert_expense("2024-01-03", "C", 7.0, "z")
-    assert new_id == 3
+    new_id = db_mysql.insert_expense("2024-01-03", "C", 7.0, "z", currency="USD")
+    assert new_id == 3 and fake_rows[-1]["currency"] == "USD"
 
-    assert db_mysql.update_expense(3, "2024-01-04", "C", 9.0, "zz") is True
+    assert db_mysql.update_expense(3, "2024-01-04", "C", 9.0, "zz", "EUR") is True
+    assert fake_rows[-1]["currency"] == "EUR"
     assert db_mysql.delete_expense(2) is True
+
+
+def test_historical_rates_and_batch_conversion(tmp_path, monkeypatch):
+    rates = tmp_path / "rates.csv"
+    rates.write_text(
+        "date,currency,rate\n2024-01-01,USD,0.0002\n2023-01-01,usd,0.0001\n2025-01-01,USD,0.0004\n",
+        encoding="utf-8",
+    )
+    monkeypatch.setattr(currency, "RATES_FILE", rates)
+    assert currency.convert_amount(1000, "USD", "2024-06-30") == 0.2
+    assert currency.convert_amount(1000, "USD", "2022-05-01") == 0.1  # antes del historial: primera tasa
+    assert currency.convert_amount(1000, "usd") == 0.4  # sin fecha: la más reciente
+    assert currency.convert_amount(1000, "EUR", "2024-06-30") == 0.23  # sin historial: tasa fija
+    assert currency.convert_many([1000, 1000, 2000], ["2023-02-01", "2025-03-01", "2023-02-01"], "USD") == [0.1, 0.4, 0.2]
+
+    monkeypatch.setattr(storage, "_get_data_file", lambda: tmp_path / "expenses.json")
+    tracker.add_expense("A", "X", 1000, "2023-06-01")
+    tracker.add_expense("B", "X", 1000, "2025-06-01")
+    assert tracker.get_total_in_currency("USD") == 0.5
+
+    # Un CSV nuevo invalida la caché de tasas
+    rates.write_text("date,currency,rate\n2020-01-01,USD,0.001\n", encoding="utf-8")
+    assert currency.convert_amount(1000, "USD", "2024-06-30") == 1.0
+    with pytest.raises(ValueError):
+        currency.convert_many([1], ["2024-01-01"], "JPY")
@@ -1,3 +1,4 @@
+import json
 from pathlib import Path
 from src import logger
 
@@ -10,3 +11,36 @@ def test_log_action_and_error(tmp_path, monkeypatch):
     content = log_file.read_text(encoding="utf-8")
     assert "TEST_ACTION" in content
     assert "Error simulado" in content
+
+def test_async_mode_writes_in_batches(tmp_path, monkeypatch):
+    log_file = tmp_path / "async.log"
+    monkeypatch.setattr(logger, "LOG_FILE", log_file)
+    monkeypatch.setattr(logger, "LOG_MODE", "async")
+    monkeypatch.setattr(logger, "LOG_FLUSH_INTERVAL", 60)
+    for i in range(250):
+        logger.log_action("ASYNC", i)
+    assert logger.flush_logs() is True
+    lines = log_file.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 250
+    assert lines[-1].endswith("ASYNC: 249")
+    logger.shutdown_logs()
+
+def test_json_lines_and_size_rotation(tmp_path, monkeypatch):
+    log_file = tmp_path / "app.log"
+    monkeypatch.setattr(logger, "LOG_FILE", log_file)
+    monkeypatch.setattr(logger, "LOG_MODE", "async")
+    monkeypatch.setattr(logger, "LOG_FORMAT", "json")
+    monkeypatch.setattr(logger, "LOG_MAX_BYTES", 2000)
+    monkeypatch.setattr(logger, "LOG_BACKUP_COUNT", 3)
+    for i in range(60):
+        logger.log_action("ADD", f"gasto {i}")
+    logger.log_error("fallo")
+    logger.shutdown_logs()
+
+    rotated = sorted(tmp_path.glob("app.log.*"))
+    assert 1 <= len(rotated) <= 3
+    assert log_file.stat().st_size <= 2000
+    last = json.loads(log_file.read_text(encoding="utf-8").splitlines()[-1])
+    assert last["level"] == "ERROR" and last["message"] == "fallo"
+    first = json.loads(rotated[0].read_text(encoding="utf-8").splitlines()[0])
+    assert first["action"] == "ADD" and first["details"].startswith("gasto")
@@ -0,0 +1,154 @@
+import datetime
+
+import pytest
+
+from src import budget, currency, logger, notifications, storage, tracker
+
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_get_data_file", lambda: tmp_path / "expenses.json")
+    monkeypatch.setattr(budget, "BUDGET_FILE", tmp_path / "budget.json")
+    notifications.engine.reset()
+    yield
+    notifications.engine.reset()
+
+
+def _today(offset=0):
+    return (datetime.date.today() - datetime.timedelta(days=offset)).isoformat()
+
+
+def test_last_date_is_tracked_from_write_events(monkeypatch):
+    loads = []
+    loader = notifications.engine._last_date_loader
+    monkeypatch.setattr(notifications.engine, "_last_date_loader", lambda: loads.append(1) or loader())
+
+    tracker.add_expense("Pan", "Comida", 2, _today(10))
+    assert notifications.get_last_expense_date() == _today(10)
+    # Las altas siguientes actualizan el estado sin recalcular
+    bus = tracker.add_expense("Bus", "Transporte", 5, _today(1))
+    tracker.add_expense("Viejo", "Otro", 1, _today(30))
+    assert notifications.get_last_expense_date() == _today(1)
+    assert "Actividad reciente" in notifications.check_inactivity_alert()
+    assert len(loads) == 1
+
+    # Borrar el último gasto obliga a recalcular
+    tracker.delete_expense(bus["id"])
+    assert notifications.get_last_expense_date() == _today(10)
+    assert len(loads) == 2
+
+
+def test_rules_queue_alerts_when_thresholds_are_crossed():
+    budget.set_monthly_budget(100)
+    budget.set_category_budget("Comida", 30)
+    month_day = datetime.date.today().replace(day=1).isoformat()
+    tracker.add_expense("Pan", "Comida", 20, month_day)
+    assert notifications.engine.drain() == []
+    cena = tracker.add_expense("Cena", "comida", 15, month_day)
+    assert notifications.engine.drain() == ["🚨 comida superó su límite: $35 / $30"]
+    tracker.edit_expense(cena["id"], new_amount=90)
+    assert notifications.engine.drain() == ["🚨 Presupuesto superado: $110 / $100"]
+
+
+
+def test_rules_convert_amounts_to_base_currency(tmp_path, monkeypatch):
+    monkeypatch.setattr(currency, "RATES_FILE", tmp_path / "rates.csv")
+    budget.set_monthly_budget(100000)
+    month_day = datetime.date.today().replace(day=1).isoformat()
+    for _ in range(5):
+        tracker.add_expense("Pan", "Comida", 1000, month_day)
+    assert notifications.engine.drain() == []
+    # 2 USD = 8000 COP: es un pico aunque el monto crudo sea menor que el promedio
+    tracker.add_expense("Libro", "Otro", 2, month_day, currency="USD")
+    assert notifications.engine.drain() == ["📈 Gasto inusual: $8000.0 en Otro (promedio $2166.67)"]
+    # 50 USD = 200000 COP: cruza el presupuesto
+    tracker.add_expense("Viaje", "Otro", 50, month_day, currency="USD")
+    assert "🚨 Presupuesto superado: $213000.0 / $100000" in notifications.engine.drain()
+
+
+def test_custom_rule_and_spike_rule(tmp_path, monkeypatch):
+    monkeypatch.setattr(logger, "LOG_FILE", tmp_path / "app.log")
+    seen = []
+    engine = notifications.AlertEngine(
+        rules=[notifications.spending_spike_rule(factor=2, min_count=3)],
+        last_date_loader=lambda: None,
+    )
+    engine.add_rule(lambda event, eng: seen.append(event.op) or None)
+    engine.add_rule(lambda event, eng: 1 / 0)  # se registra y se ignora
+    storage.subscribe(engine.observe)
+    try:
+        for amount in (10, 10, 10):
+            tracker.add_expense("Café", "Bebidas", amount, "2024-01-01")
+        tracker.add_expense("TV", "Hogar", 500, "2024-01-02")
+    finally:
+        storage._listeners.remove(engine.observe)
+    assert seen == ["add"] * 4
+    assert engine.drain() == ["📈 Gasto inusual: $500 en Hogar (promedio $132.5)"]
+    assert "division by zero" in (tmp_path / "app.log").read_text(encoding="utf-8")
+
+
+def test_api_alerts_use_in_memory_last_date(monkeypatch):
+    web_api = pytest.importorskip("web_api")
+    rows = {1: {"id": 1, "date": _today(5), "category": "A", "amount": 3.0, "description": None}}
+    queries = []
+    monkeypatch.setattr(web_api.db_mysql, "get_all_expenses", lambda: list(rows.values()))
+    monkeypatch.setattr(web_api.db_mysql, "get_expense_by_id", rows.get)
+    monkeypatch.setattr(web_api.db_mysql, "get_last_expense_date", lambda: queries.append(1) or _today(5))
+    monkeypatch.setattr(web_api.db_mysql, "insert_expense", lambda **kw: rows.setdefault(2, dict(kw, id=2))["id"])
+    monkeypatch.setattr(web_api, "budget_status", lambda: {"status": "OK"})
+    monkeypatch.setattr(web_api, "_alert_engine", notifications.AlertEngine(last_date_loader=web_api.db_mysql.get_last_expense_date))
+    monkeypatch.setattr(web_api, "_month_spend", web_api._MonthSpend(lambda start, end: {}))
+    monkeypatch.setattr(web_api, "_stats_cache", {"at": None, "data": None})
+
+    first = web_api.alerts()
+    assert first["alerts"] == ["No registras gastos hace 5 dias."]
+    assert first["stats"]["max"] == 3.0
+    web_api.create_expense(web_api.ExpenseCreate(date=_today(), category="B", amount=1))
+    assert web_api.alerts()["alerts"] == ["Actividad reciente registrada."]
+    assert len(queries) == 1
+    # Las estadísticas se reutilizan hasta que vence STATE_TTL
+    assert web_api.alerts()["stats"] is first["stats"]
+    monkeypatch.setattr(web_api, "STATE_TTL", 0)
+    assert web_api.alerts()["stats"]["min"] == 1.0
+
+
+def test_api_budget_alerts_come_from_month_state(tmp_path, monkeypatch):
+    web_api = pytest.importorskip("web_api")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(currency, "RATES_FILE", tmp_path / "rates.csv")
+    (tmp_path / "budget.json").write_text('{"budget": 10000}', encoding="utf-8")
+    seeds = []
+    # La consulta inicial corre tras el primer INSERT, así que ya incluye sus 500
+    monkeypatch.setattr(web_api, "_month_spend", web_api._MonthSpend(lambda start, end: seeds.append(start) or {"COP": 9500}))
+    monkeypatch.setattr(web_api, "_alert_engine", notifications.AlertEngine(
+        rules=[web_api._budget_crossed_rule], last_date_loader=lambda: _today()))
+    monkeypatch.setattr(web_api.db_mysql, "get_all_expenses", lambda: pytest.fail("recorrido completo"))
+    monkeypatch.setattr(web_api, "_stats_cache", {"at": web_api.time.monotonic(), "data": {"max": 0}})
+    ids = iter(range(1, 10))
+    monkeypatch.setattr(web_api.db_mysql, "insert_expense", lambda **kw: next(ids))
+
+    web_api.create_expense(web_api.ExpenseCreate(date=_today(), category="Comida", amount=500))
+    assert web_api.alerts()["alerts"] == ["Actividad reciente registrada."]
+    # 1 USD = 4000 COP: el gasto del mes pasa de 9500 a 13500
+    web_api.create_expense(web_api.ExpenseCreate(date=_today(), category="Libros", amount=1, currency="USD"))
+    assert web_api.alerts()["alerts"] == [
+        "Actividad reciente registrada.",
+        "Presupuesto superado: 13500.0 / 10000",
+        "Gasto en Libros supero el presupuesto: 13500.0 / 10000",
+    ]
+    assert web_api.budget_status()["remaining"] == 0
+    assert len(seeds) == 1
+
+
+def test_api_month_spend_revalidates_after_ttl(monkeypatch):
+    web_api = pytest.importorskip("web_api")
+    spend = {"COP": 100}
+    seeds = []
+    month_spend = web_api._MonthSpend(lambda start, end: seeds.append(start) or dict(spend))
+    assert month_spend.total() == 100
+    # Otro proceso escribe en la base: dentro del TTL se sigue usando lo que hay en memoria
+    spend["COP"] = 700
+    month_spend.observe(None, {"date": _today(), "amount": 50, "currency": "COP"})
+    assert month_spend.total() == 150 and len(seeds) == 1
+    monkeypatch.setattr(web_api, "STATE_TTL", 0)
+    assert month_spend.total() == 700 and len(seeds) == 2
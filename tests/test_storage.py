@@ -1,10 +1,283 @@
-from src import storage, users
+import json
+
+from src import storage, sqlite_store, table, dates
 
 def test_save_and_load_with_user(tmp_path, monkeypatch):
-    monkeypatch.setattr(users, "get_current_user", lambda: "testuser")
-    monkeypatch.setattr(users, "get_expenses_file_for_user", lambda u: tmp_path / f"{u}_expenses.json")
+    monkeypatch.setattr(storage, "get_current_user", lambda: "testuser")
+    monkeypatch.setattr(storage, "get_expenses_file_for_user", lambda u: tmp_path / f"{u}_expenses.json")
 
     data = [{"description": "Almuerzo", "category": "Comida", "amount": 15, "date": "2025-10-16"}]
     storage.save_data(data)
     result = storage.load_data()
-    assert result == data
+    assert result == [dict(data[0], id=1)]
+    assert (tmp_path / "testuser_expenses.json").exists()
+
+
+def test_journal_backend_appends_and_replays(tmp_path, monkeypatch):
+    data_file = tmp_path / "expenses.json"
+    monkeypatch.setattr(storage, "STORAGE_BACKEND", "journal")
+    monkeypatch.setattr(storage, "_get_data_file", lambda: data_file)
+
+    a = storage.append_record({"description": "A", "amount": 1})
+    b = storage.append_record({"description": "B", "amount": 2})
+    storage.replace_record(b["id"], {"description": "B2", "amount": 3})
+    storage.delete_record(a["id"])
+
+    journal = tmp_path / "expenses.jsonl"
+    assert len(journal.read_text(encoding="utf-8").splitlines()) == 5  # meta + 4 operaciones
+    expected = [{"description": "B2", "amount": 3, "id": b["id"]}]
+    assert storage.load_data() == expected
+    storage.invalidate_cache(data_file)
+    assert storage.load_data() == expected
+
+    assert storage.compact_journal(data_file) == 1
+    assert len(journal.read_text(encoding="utf-8").splitlines()) == 2
+    storage.invalidate_cache(data_file)
+    assert storage.load_data() == expected
+    # El contador sobrevive a la compactación: el id borrado no se reutiliza
+    assert storage.append_record({"description": "C"})["id"] == b["id"] + 1
+
+
+def test_journal_starts_from_existing_json(tmp_path, monkeypatch):
+    data_file = tmp_path / "expenses.json"
+    data_file.write_text('[{"description": "Viejo", "amount": 5}]', encoding="utf-8")
+    monkeypatch.setattr(storage, "STORAGE_BACKEND", "journal")
+    monkeypatch.setattr(storage, "_get_data_file", lambda: data_file)
+
+    assert storage.load_data() == [{"description": "Viejo", "amount": 5, "id": 1}]
+    storage.append_record({"description": "Nuevo", "amount": 1})
+    # Una línea truncada al final no rompe la reconstrucción
+    with open(tmp_path / "expenses.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"op": "add", "rec')
+    assert [e["description"] for e in storage.load_data()] == ["Viejo", "Nuevo"]
+    storage.append_record({"description": "Otro", "amount": 2})
+    assert [e["description"] for e in storage.load_data()] == ["Viejo", "Nuevo", "Otro"]
+
+
+def test_load_data_cache_revalidates_by_stat(tmp_path, monkeypatch):
+    data_file = tmp_path / "expenses.json"
+    monkeypatch.setattr(storage, "_get_data_file", lambda: data_file)
+    storage.save_data([{"description": "A", "amount": 1}])
+
+    calls = []
+    original = storage._json_load
+    monkeypatch.setattr(storage, "_json_load", lambda path: calls.append(path) or original(path))
+
+    first = storage.load_data()
+    assert storage.load_data() is first
+    assert calls == []  # save_data dejó la instantánea en caché
+
+    # Un cambio externo (otro tamaño/mtime) obliga a releer
+    data_file.write_text('[{"description": "B", "amount": 2}, {"description": "C", "amount": 3}]', encoding="utf-8")
+    assert [e["description"] for e in storage.load_data()] == ["B", "C"]
+    assert len(calls) == 1
+
+
+def test_cache_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "CACHE_MAX_FILES", 2)
+    storage.invalidate_cache()
+    for name in ("a", "b", "c"):
+        path = tmp_path / f"{name}.json"
+        monkeypatch.setattr(storage, "_get_data_file", lambda path=path: path)
+        storage.save_data([{"description": name}])
+    assert list(storage._cache) == [tmp_path / "b.json", tmp_path / "c.json"]
+
+
+def test_load_table_reuses_cached_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_get_data_file", lambda: tmp_path / "expenses.json")
+    storage.save_data([{"description": "A", "category": "Comida", "amount": 4, "date": "2024-01-01"}])
+    table = storage.load_table()
+    assert storage.load_table() is table
+    assert table.total() == 4
+    # Una lista fuera de la caché produce una tabla nueva
+    assert storage.as_table([{"amount": 1}]) is not table
+
+
+def test_load_table_streams_into_columns(tmp_path, monkeypatch):
+    data_file = tmp_path / "expenses.json"
+    monkeypatch.setattr(storage, "JSON_WAL", True)
+    monkeypatch.setattr(storage, "_get_data_file", lambda: data_file)
+    storage.save_data([
+        {"description": "A", "category": "Comida", "amount": 1, "date": "2024-01-01"},
+        {"description": "B", "category": "Ocio", "amount": 2, "date": "2024-01-02"},
+    ])
+    storage.append_record({"description": "C", "category": "Ocio", "amount": 3, "date": "2024-01-03", "currency": "USD"})
+    storage.replace_record(1, {"description": "A2", "category": "Comida", "amount": 5, "date": "2024-01-05"})
+    storage.delete_record(2)
+    expected = storage.load_data()
+    storage.invalidate_cache()
+
+    # Arreglo + WAL pendiente directo a columnas: la lista de diccionarios no queda en caché
+    table = storage.load_table(data_file)
+    assert not storage._cache
+    assert list(storage.iter_expenses()) == expected
+    assert list(table.amounts) == [5, 3] and table.descriptions == ["A2", "C"]
+    assert table.currencies == ["COP", "USD"] and table.total() == 8
+
+
+def test_delete_keeps_indexes_and_compacts_lazily(tmp_path, monkeypatch):
+    data_file = tmp_path / "expenses.json"
+    monkeypatch.setattr(storage, "JSON_WAL", True)
+    monkeypatch.setattr(storage, "_get_data_file", lambda: data_file)
+    for day, name in ((3, "C"), (1, "A"), (2, "B")):
+        storage.append_record({"description": name, "amount": day, "date": f"2024-01-0{day}"})
+    start, end = dates.month_bounds("2024-01")
+    assert [e["description"] for e in storage.select_range(start, end)] == ["A", "B", "C"]
+    assert storage.get_record(1)["description"] == "C"
+    snapshot = storage._load_snapshot(data_file)
+    table, positions = snapshot.table, snapshot._positions
+
+    storage.delete_record(2)
+    # El borrado deja un hueco: ni el índice por id ni la tabla se reconstruyen
+    assert snapshot.rows[1] is None and snapshot.table is table and snapshot._positions is positions
+    assert [e["description"] for e in storage.select_range(start, end)] == ["B", "C"]
+    storage.replace_record(3, {"description": "B2", "amount": 5, "date": "2023-12-31"})
+    assert [e["description"] for e in storage.select_range(start, end)] == ["C"]
+    assert storage.get_record(1)["description"] == "C" and storage.get_record(2) is None
+
+    # La lista completa se compacta al pedirla, con la tabla alineada
+    assert [e["id"] for e in storage.load_data()] == [1, 3]
+    assert list(table.amounts) == [3, 5] and table.indices_between(start - 1, end) == [1, 0]
+
+
+def test_sqlite_backend_indexed_queries(tmp_path, monkeypatch):
+    data_file = tmp_path / "expenses.json"
+    data_file.write_text('[{"description": "Viejo", "category": "Comida", "amount": 5, "date": "2024-01-31"}]', encoding="utf-8")
+    monkeypatch.setattr(storage, "STORAGE_BACKEND", "sqlite")
+    monkeypatch.setattr(storage, "_get_data_file", lambda: data_file)
+
+    # El JSON existente se migra al crear la base
+    assert [e["description"] for e in storage.load_data()] == ["Viejo"]
+    bus = storage.append_record({"description": "Bus", "category": "Transporte", "amount": 2, "date": "2024-02-01"})
+    storage.append_record({"description": "Pan", "category": "comida", "amount": 3, "date": "2024-02-03"})
+    storage.replace_record(bus["id"], {"description": "Taxi", "category": "Transporte", "amount": 7, "date": "2024-02-01"})
+    storage.delete_record(1)
+    assert storage.get_record(bus["id"])["description"] == "Taxi"
+
+    assert [e["description"] for e in storage.load_data()] == ["Taxi", "Pan"]
+    start, end = dates.month_bounds("2024-02")
+    assert [e["description"] for e in storage.select_range(start, end)] == ["Taxi", "Pan"]
+
+    plan = sqlite_store.connect(tmp_path / "expenses.db").execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM expenses WHERE date >= '2024-02-01' AND date < '2024-03-01'"
+    ).fetchall()
+    assert "idx_expenses_date" in str(plan)
+
+
+def test_sqlite_migration_includes_pending_json_wal(tmp_path, monkeypatch):
+    data_file = tmp_path / "expenses.json"
+    monkeypatch.setattr(storage, "JSON_WAL", True)
+    monkeypatch.setattr(storage, "_get_data_file", lambda: data_file)
+    storage.append_record({"description": "A", "amount": 1, "date": "2024-01-01"})
+    monkeypatch.setattr(storage, "STORAGE_BACKEND", "sqlite")
+    assert [e["description"] for e in storage.load_data()] == ["A"]
+
+
+def test_sqlite_adds_currency_column_to_old_databases(tmp_path):
+    import sqlite3
+    db_file = tmp_path / "viejo.db"
+    conn = sqlite3.connect(db_file)
+    conn.execute(
+        "CREATE TABLE expenses (id INTEGER PRIMARY KEY AUTOINCREMENT, description TEXT, category TEXT, "
+        "category_key TEXT, amount REAL NOT NULL DEFAULT 0, date TEXT)"
+    )
+    conn.execute("CREATE INDEX idx_expenses_category ON expenses (category_key)")
+    conn.execute("INSERT INTO expenses (description, category, category_key, amount, date) VALUES ('A', 'B', 'b', 1, '2024-01-01')")
+    conn.commit()
+    conn.close()
+
+    conn = sqlite_store.connect(db_file)
+    assert sqlite_store.load(conn)[0]["currency"] == "COP"
+    indexes = {row[1] for row in conn.execute("PRAGMA index_list(expenses)")}
+    assert "idx_expenses_category" not in indexes
+    new_id = sqlite_store.append(conn, {"description": "C", "amount": 2, "date": "2024-01-02", "currency": "USD"})
+    assert sqlite_store.get(conn, new_id)["currency"] == "USD"
+    fresh = sqlite_store.connect(tmp_path / "nuevo.db")
+    assert "category_key" not in {row[1] for row in fresh.execute("PRAGMA table_info(expenses)")}
+
+
+def test_iter_expenses_streams_json_in_chunks(tmp_path, monkeypatch):
+    data_file = tmp_path / "expenses.json"
+    records = [{"description": f"Gasto {i}", "category": "Comida", "amount": i, "date": "2024-01-01"} for i in range(50)]
+    records[10]["id"] = 100
+    data_file.write_text(json.dumps(records, indent=4), encoding="utf-8")
+    monkeypatch.setattr(storage, "_get_data_file", lambda: data_file)
+    monkeypatch.setattr(storage, "STREAM_CHUNK_SIZE", 7)
+    storage.invalidate_cache(data_file)
+
+    streamed = list(storage.iter_expenses())
+    assert [e["amount"] for e in streamed] == list(range(50))
+    # Los registros sin id reciben los mismos que asigna load_data()
+    assert [e["id"] for e in streamed[9:12]] == [10, 100, 101]
+    assert streamed == storage.load_data()
+    # Documento inválido o vacío -> sin elementos
+    data_file.write_text("not json", encoding="utf-8")
+    assert list(storage.iter_expenses()) == []
+    data_file.write_text("[]", encoding="utf-8")
+    assert list(storage.iter_expenses()) == []
+
+
+def test_json_wal_replays_tail_and_recovers(tmp_path, monkeypatch):
+    data_file = tmp_path / "expenses.json"
+    wal = tmp_path / "expenses.wal"
+    monkeypatch.setattr(storage, "JSON_WAL", True)
+    monkeypatch.setattr(storage, "_get_data_file", lambda: data_file)
+
+    a = storage.append_record({"description": "A", "amount": 1})
+    b = storage.append_record({"description": "B", "amount": 2})
+    storage.replace_record(a["id"], {"description": "A2", "amount": 5})
+    storage.delete_record(b["id"])
+    # El arreglo no se reescribió: las operaciones están en el WAL
+    assert json.loads(data_file.read_text(encoding="utf-8")) == []
+    assert len(wal.read_text(encoding="utf-8").splitlines()) == 4
+
+    # Un corte a mitad de línea: la carga reaplica lo válido y descarta el resto
+    with open(wal, "a", encoding="utf-8") as f:
+        f.write('{"op": "add", "rec')
+    storage.invalidate_cache(data_file)
+    expected = [{"description": "A2", "amount": 5, "id": a["id"]}]
+    assert storage.load_data() == expected
+    assert list(storage.iter_expenses()) == expected
+
+    assert storage.recover() == 4
+    assert wal.read_text(encoding="utf-8") == ""
+    assert json.loads(data_file.read_text(encoding="utf-8")) == expected
+    assert storage.recover() == 0
+
+    # save_data consolida el WAL antes de reemplazar el arreglo
+    storage.append_record({"description": "C", "amount": 3})
+    storage.save_data([{"description": "Z", "amount": 9}])
+    storage.invalidate_cache(data_file)
+    assert storage.load_data() == [{"description": "Z", "amount": 9, "id": 1}]
+
+
+def test_json_wal_checkpoints_and_groups_fsyncs(tmp_path, monkeypatch):
+    import threading
+
+    data_file = tmp_path / "expenses.json"
+    monkeypatch.setattr(storage, "JSON_WAL", True)
+    monkeypatch.setattr(storage, "WAL_CHECKPOINT_LINES", 1000)
+    monkeypatch.setattr(storage, "WAL_GROUP_COMMIT_WINDOW", 0.01)
+    monkeypatch.setattr(storage, "_get_data_file", lambda: data_file)
+    storage.append_record({"description": "inicial", "amount": 1})
+
+    syncs = []
+    real_fsync = storage.os.fsync
+    monkeypatch.setattr(storage.os, "fsync", lambda fd: syncs.append(fd) or real_fsync(fd))
+
+    def writer(n):
+        for i in range(5):
+            storage.append_record({"description": f"{n}-{i}", "amount": i})
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(storage.load_data()) == 41
+    assert len(syncs) < 40  # varias escrituras comparten cada fsync
+
+    monkeypatch.setattr(storage, "WAL_CHECKPOINT_LINES", 3)
+    storage.append_record({"description": "checkpoint", "amount": 1})
+    assert (tmp_path / "expenses.wal").read_text(encoding="utf-8") == ""
+    assert len(json.loads(data_file.read_text(encoding="utf-8"))) == 42
@@ -0,0 +1,56 @@
+from src.dates import day_ordinal, month_bounds
+from src.table import ExpenseTable
+
+RECORDS = [
+    {"description": "Pan", "category": "Comida", "amount": 2, "date": "2024-01-31"},
+    {"description": "Bus", "category": "Transporte", "amount": 5, "date": "2024-02-01"},
+    {"description": "Leche", "category": "comida", "amount": 3, "date": "2024-02-01"},
+]
+
+
+def test_table_columns_and_interning():
+    table = ExpenseTable.from_records(RECORDS)
+    assert len(table) == 3
+    assert table.categories == ["Comida", "Transporte", "comida"]
+    assert list(table.category_codes) == [0, 1, 2]
+    assert table.days[1] == day_ordinal("2024-02-01")
+    assert table.descriptions[2] == "Leche"
+
+
+def test_table_aggregations():
+    table = ExpenseTable.from_records(RECORDS)
+    assert table.total() == 10
+    start, end = month_bounds("2024-02")
+    assert table.indices_between(start, end) == [1, 2]
+
+
+def test_day_ordinal_tolerates_missing_dates():
+    assert day_ordinal("2024-01-01") == day_ordinal("2024-01-01T10:00")
+    assert day_ordinal(None) == 0
+    table = ExpenseTable.from_records([{"amount": 4}])
+    assert table.days[0] == 0
+    assert table.total() == 4
+
+
+def test_date_index_is_kept_sorted_on_append():
+    table = ExpenseTable.from_records(RECORDS)
+    feb = month_bounds("2024-02")
+    assert table.indices_between(*feb) == [1, 2]
+    table.append({"category": "Comida", "amount": 1, "date": "2024-01-15"})
+    table.append({"category": "Comida", "amount": 1, "date": "2024-02-01"})
+    assert table.indices_between(*month_bounds("2024-01")) == [3, 0]
+    assert table.indices_between(*feb) == [1, 2, 4]
+
+
+def test_date_index_is_patched_on_set_and_remove():
+    table = ExpenseTable.from_records(RECORDS)
+    feb = month_bounds("2024-02")
+    assert table.indices_between(*feb) == [1, 2]
+    index = table._date_index
+    table.set(0, {"category": "Comida", "amount": 2, "date": "2024-02-01"})
+    table.remove(1)
+    # El índice ya construido se actualiza en sitio en vez de descartarse
+    assert table._date_index is index
+    assert table.indices_between(*feb) == [0, 2]
+    table.compact([0, 2])
+    assert len(table) == 2 and table.indices_between(*feb) == [0, 1]
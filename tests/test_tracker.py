@@ -33,8 +33,8 @@ def test_total_and_category():
 
 def test_edit_expense():
     """Debe permitir editar correctamente un gasto existente."""
-    tracker.add_expense("Helado", "Comida", 10)
-    tracker.edit_expense(0, "Pizza", "Comida", 20)
+    added = tracker.add_expense("Helado", "Comida", 10)
+    tracker.edit_expense(added["id"], "Pizza", "Comida", 20)
     data = tracker.list_expenses()
     assert data[0]["description"] == "Pizza"
     assert data[0]["amount"] == 20
@@ -42,9 +42,9 @@ def test_edit_expense():
 
 def test_delete_expense():
     """Debe eliminar correctamente un gasto del registro."""
-    tracker.add_expense("Cine", "Entretenimiento", 25)
+    cine = tracker.add_expense("Cine", "Entretenimiento", 25)
     tracker.add_expense("Bus", "Transporte", 5)
-    tracker.delete_expense(0)
+    tracker.delete_expense(cine["id"])
     data = tracker.list_expenses()
     assert len(data) == 1
     assert data[0]["description"] == "Bus"
@@ -76,3 +76,43 @@ def test_export_to_csv(tmp_path, monkeypatch):
     content = csv_path.read_text(encoding="utf-8")
     assert "Tienda" in content
     assert "Compras" in content
+
+
+def test_ids_are_stable_and_not_reused():
+    """Los ids no cambian al borrar otros gastos ni se reutilizan."""
+    first = tracker.add_expense("A", "Comida", 1)
+    second = tracker.add_expense("B", "Comida", 2)
+    assert second["id"] == first["id"] + 1
+    tracker.delete_expense(first["id"])
+    tracker.edit_expense(second["id"], new_amount=3)
+    assert tracker.list_expenses() == [dict(second, amount=3)]
+    third = tracker.add_expense("C", "Comida", 4)
+    assert third["id"] > second["id"]
+    with pytest.raises(IndexError):
+        tracker.delete_expense(first["id"])
+
+
+@pytest.mark.parametrize("wal", [False, True])
+def test_deleted_highest_id_not_reused_after_reload(monkeypatch, wal):
+    """Borrar el id más alto y recargar (como tras reiniciar) no lo vuelve a asignar."""
+    monkeypatch.setattr(storage, "JSON_WAL", wal)
+    tracker.add_expense("A", "Comida", 1)
+    second = tracker.add_expense("B", "Comida", 2)
+    tracker.delete_expense(second["id"])
+    storage.invalidate_cache()
+    assert tracker.add_expense("C", "Comida", 3)["id"] == second["id"] + 1
+    storage.recover()
+    storage.invalidate_cache()
+    assert tracker.add_expense("D", "Comida", 4)["id"] == second["id"] + 2
+
+
+def test_filter_by_range_uses_half_open_interval():
+    """El rango incluye el inicio y excluye el fin, en orden cronológico."""
+    tracker.add_expense("Feb", "Comida", 1, "2024-02-01")
+    tracker.add_expense("Ene", "Comida", 2, "2024-01-31")
+    tracker.add_expense("Mar", "Comida", 3, "2024-03-01")
+    found = tracker.filter_by_range("2024-01-31", "2024-03-01")
+    assert [e["description"] for e in found] == ["Ene", "Feb"]
+    assert [e["description"] for e in tracker.filter_by_month("2024-03")] == ["Mar"]
+    with pytest.raises(ValueError):
+        tracker.filter_by_range("2024-13-01", "2024-03-01")
@@ -1,3 +1,4 @@
+import json
 import pytest
 from pathlib import Path
 from src import users
@@ -25,3 +26,35 @@ def test_logout_clears_session():
     users.login("maria", "abc")
     users.logout()
     assert users.get_current_user() is None
+
+def test_registry_and_session_are_cached(monkeypatch):
+    users.create_user("ana", "Ana", "pw")
+    users.login("ana", "pw")
+    loads = []
+    real_load = users.json.load
+    monkeypatch.setattr(users.json, "load", lambda f: loads.append(f.name) or real_load(f))
+    for _ in range(5):
+        assert users.get_current_user() == "ana"
+        assert users.authenticate("ana", "pw") is True
+    assert loads == []
+
+    # Un cambio hecho por otro proceso se detecta por la firma del archivo
+    users.SESSION_FILE.write_text('{"current_user": "otro_usuario"}', encoding="utf-8")
+    assert users.get_current_user() == "otro_usuario"
+    assert len(loads) == 1
+
+def test_sharded_registry(tmp_path, monkeypatch):
+    users.create_user("legacy", "Legacy", "old")
+    monkeypatch.setattr(users, "USERS_SHARDS_DIR", tmp_path / "shards")
+    assert users.shard_users() == 1
+    assert users.authenticate("legacy", "old") is True
+
+    for name in ("u1", "u2", "u3"):
+        users.create_user(name, name.upper(), "pw")
+    with pytest.raises(ValueError):
+        users.create_user("u2", "U2", "pw")
+    assert users.login("u3", "pw") == "u3"
+    assert users.get_current_user() == "u3"
+    shard = users._registry_file("u1")
+    assert shard.parent == tmp_path / "shards"
+    assert "u1" in json.loads(shard.read_text(encoding="utf-8"))
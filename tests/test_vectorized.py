@@ -0,0 +1,87 @@
+import random
+
+import pytest
+
+from src import aggregates, storage, vectorized
+from src.table import ExpenseTable
+
+np = pytest.importorskip("numpy")
+
+
+def _records(n=500):
+    rng = random.Random(7)
+    categories = ["Comida", "Transporte", "Ocio", "Salud"]
+    return [
+        {
+            "description": f"g{i}",
+            "category": rng.choice(categories),
+            "amount": rng.randint(1, 400) / 4,
+            "date": f"2024-{rng.randint(1, 6):02d}-{rng.randint(1, 28):02d}",
+            "currency": rng.choice(["COP", "COP", "COP", "USD"]),
+        }
+        for i in range(n)
+    ]
+
+
+def test_aggregate_matches_python_engine():
+    records = _records()
+    expected = aggregates.from_records(records)
+    got = vectorized.aggregate(ExpenseTable.from_records(records))
+    assert got["count"] == expected["count"]
+    assert got["total"] == pytest.approx(expected["total"])
+    for month, categories in expected["by_month_category"].items():
+        for category, (total, count) in categories.items():
+            assert got["by_month_category"][month][category] == [pytest.approx(total), count]
+    for name in ("by_category", "by_day", "by_month"):
+        assert got[name].keys() == expected[name].keys()
+        for key, (total, count) in expected[name].items():
+            assert got[name][key] == [pytest.approx(total), count]
+    assert got["by_currency"] == expected["by_currency"]
+    assert got["stats"].result() == pytest.approx(expected["stats"].result())
+    assert got["quantiles"]["by_category"].keys() == expected["quantiles"]["by_category"].keys()
+    assert got["quantiles"]["by_month"]["2024-03"].count == expected["by_month"]["2024-03"][1]
+    assert got["quantiles"]["all"].result()["median"] == pytest.approx(
+        expected["quantiles"]["all"].result()["median"], abs=5
+    )
+
+
+def test_aggregate_declines_invalid_dates():
+    table = ExpenseTable.from_records([{"amount": 1, "date": ""}])
+    assert vectorized.aggregate(table) is None
+
+
+def test_rebuild_uses_vectorized_engine(tmp_path, monkeypatch):
+    path = tmp_path / "expenses.json"
+    monkeypatch.setattr(storage, "_get_data_file", lambda: path)
+    monkeypatch.setattr(vectorized, "MIN_ROWS", 1)
+    storage.save_data(_records(50))
+    monkeypatch.setattr(aggregates, "from_records", lambda records: pytest.fail("ruta en Python"))
+    assert aggregates.rebuild_aggregates()["count"] == 50
+
+
+def test_row_stats_matches_python_engine(monkeypatch):
+    web_api = pytest.importorskip("web_api")
+    rows = _records()
+    monkeypatch.setattr(vectorized, "MIN_ROWS", 10**9)
+    expected = web_api._get_stats_from_rows(rows)
+    monkeypatch.setattr(vectorized, "MIN_ROWS", 1)
+    got = web_api._get_stats_from_rows(rows)
+    assert got.pop("total") == pytest.approx(expected.pop("total"))
+    # Los cuantiles vienen de sketches construidos distinto: iguales dentro del error de rango
+    for name in ("median", "p90", "p99"):
+        assert got.pop(name) == pytest.approx(expected.pop(name), rel=0.05, abs=5)
+    assert got == expected
+
+
+def test_small_rebuild_streams_without_loading_table(tmp_path, monkeypatch):
+    path = tmp_path / "expenses.json"
+    monkeypatch.setattr(storage, "_get_data_file", lambda: path)
+    monkeypatch.setattr(vectorized, "MIN_ROWS", 40)
+    storage.save_data(_records(30))
+    storage.invalidate_cache()
+    monkeypatch.setattr(storage, "load_table", lambda data_file=None: pytest.fail("tabla cargada"))
+    # Sin sidecar se decide por el tamaño del archivo; después, por el conteo guardado
+    monkeypatch.setattr(aggregates, "APPROX_RECORD_BYTES", 10**6)
+    assert aggregates.rebuild_aggregates()["count"] == 30
+    monkeypatch.setattr(aggregates, "APPROX_RECORD_BYTES", 1)
+    assert aggregates.rebuild_aggregates()["count"] == 30
@@ -4,10 +4,14 @@ from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
-from src import db_mysql
+from src import currency, dates, db_mysql, notifications, vectorized
+from src.storage import WriteEvent
+from src.analytics import QuantileSketch
 from pathlib import Path
-from datetime import datetime
+from datetime import date, datetime
 import statistics
+import threading
+import time
 import json
 
 
@@ -34,6 +38,7 @@ class ExpenseCreate(BaseModel):
     category: str
     amount: float
     description: str | None = None
+    currency: str = "COP"
 
 
 class ExpenseRead(ExpenseCreate):
@@ -43,19 +48,35 @@ class BudgetPayload(BaseModel):
     amount: float
 
 
+_budget_cache: Dict[str, Any] = {"key": None, "data": None}
+
+# Segundos que el gasto del mes y las estadísticas de /api/alerts se sirven desde memoria
+# antes de volver a consultar la base: cubre escrituras de otros workers o instancias.
+STATE_TTL = 5.0
+
+
 def _load_budget_file() -> Dict[str, Any]:
+    # Se relee solo si budget.json cambió (mtime/tamaño); no modificar el resultado
     budget_file = Path("budget.json")
-    if budget_file.exists():
-        try:
-            return json.loads(budget_file.read_text(encoding="utf-8"))
-        except json.JSONDecodeError:
-            return {"budget": 0, "last_updated": None}
-    return {"budget": 0, "last_updated": None}
+    try:
+        st = budget_file.stat()
+        key = (st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        key = None
+    if _budget_cache["key"] != key or _budget_cache["data"] is None:
+        data = {"budget": 0, "last_updated": None}
+        if key is not None:
+            try:
+                data = json.loads(budget_file.read_text(encoding="utf-8"))
+            except json.JSONDecodeError:
+                pass
+        _budget_cache["key"], _budget_cache["data"] = key, data
+    return _budget_cache["data"]
 
 
 def _save_budget_file(amount: float) -> Dict[str, Any]:
     budget_file = Path("budget.json")
-    data = {"budget": amount, "last_updated": datetime.now().strftime("%Y-%m-%d")}
+    data = dict(_load_budget_file(), budget=amount, last_updated=datetime.now().strftime("%Y-%m-%d"))
     budget_file.write_text(json.dumps(data, indent=4), encoding="utf-8")
     return data
 
@@ -67,13 +88,28 @@ def _get_stats_from_rows(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
             "max": 0,
             "avg": 0,
             "std_dev": 0,
+            "median": 0,
+            "p90": 0,
+            "p99": 0,
             "daily_avg": 0,
             "monthly_avg": 0,
             "top_category": None,
             "top_category_amount": 0,
             "days_without_expense": 0,
+            "by_currency": {},
         }
-    amounts = [r["amount"] for r in rows]
+    if vectorized.worthwhile(len(rows)):
+        return vectorized.row_stats(rows)
+    # Un factor por moneda: los montos se llevan a la moneda base antes de agregar
+    factors: Dict[str, float] = {}
+    by_currency: Dict[str, float] = {}
+    amounts = []
+    for r in rows:
+        code = r.get("currency") or currency.BASE_CURRENCY
+        if code not in factors:
+            factors[code] = currency.to_base_factor(code)
+        by_currency[code] = by_currency.get(code, 0) + r["amount"]
+        amounts.append(r["amount"] * factors[code])
     min_v = min(amounts)
     max_v = max(amounts)
     avg_v = round(statistics.mean(amounts), 2)
@@ -85,38 +121,122 @@ def _get_stats_from_rows(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
     monthly_avg = round(sum(amounts) / len(unique_months), 2) if unique_months else sum(amounts)
 
     totals_by_cat: Dict[str, float] = {}
-    for r in rows:
+    for r, amount in zip(rows, amounts):
         cat = r["category"]
-        totals_by_cat[cat] = totals_by_cat.get(cat, 0) + r["amount"]
+        totals_by_cat[cat] = totals_by_cat.get(cat, 0) + amount
     top_cat = max(totals_by_cat, key=totals_by_cat.get) if totals_by_cat else None
     top_cat_amount = round(totals_by_cat[top_cat], 2) if top_cat else 0
 
     # dias sin gasto
-    parsed_dates = sorted(
-        {datetime.strptime(d, "%Y-%m-%d") for d in unique_dates if d},
-        key=lambda d: d,
-    )
-    gaps = 0
-    if len(parsed_dates) >= 2:
-        for i in range(1, len(parsed_dates)):
-            diff = (parsed_dates[i] - parsed_dates[i - 1]).days
-            if diff > 1:
-                gaps += diff - 1
+    gaps = dates.gap_days(dates.gap_ranges(dates.day_ordinal(d) for d in unique_dates))
 
     return {
         "min": min_v,
         "max": max_v,
         "avg": avg_v,
         "std_dev": std_v,
+        **QuantileSketch.from_amounts(amounts).result(),
         "daily_avg": daily_avg,
         "monthly_avg": monthly_avg,
         "top_category": top_cat,
         "top_category_amount": top_cat_amount,
         "days_without_expense": gaps,
         "total": sum(amounts),
+        "by_currency": by_currency,
     }
 
 
+class _MonthSpend:
+    """Gasto del mes en curso por moneda, en memoria.
+
+    Se siembra con una consulta agrupada y entre consultas lo actualiza _notify con cada
+    alta, edición o borrado de esta API. La consulta se repite al cambiar de mes y cuando
+    pasan STATE_TTL segundos, para recoger lo que escriben otros procesos.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self.month = None
+        self.loaded_at = None
+        self.by_currency: Dict[str, float] = {}
+
+    def _ensure_month(self) -> bool:
+        month = datetime.now().strftime("%Y-%m")
+        now = time.monotonic()
+        if month == self.month and now - self.loaded_at < STATE_TTL:
+            return False
+        start, end = (date.fromordinal(d).isoformat() for d in dates.month_bounds(month))
+        self.by_currency = dict(self._loader(start, end))
+        self.month, self.loaded_at = month, now
+        return True
+
+    def _in_month(self, expense) -> bool:
+        return bool(expense) and str(expense.get("date") or "").startswith(self.month)
+
+    def base_amount(self, expense) -> float:
+        """Monto del gasto en la moneda base si es del mes en curso (0 si no)."""
+        if not self._in_month(expense):
+            return 0
+        return expense["amount"] * currency.to_base_factor(expense.get("currency"))
+
+    def observe(self, old=None, new=None):
+        with self._lock:
+            if self._ensure_month():
+                return  # la consulta ya incluye esta escritura
+            for expense, sign in ((old, -1), (new, 1)):
+                if self._in_month(expense):
+                    code = expense.get("currency") or currency.BASE_CURRENCY
+                    self.by_currency[code] = self.by_currency.get(code, 0) + sign * expense["amount"]
+
+    def total(self) -> float:
+        with self._lock:
+            self._ensure_month()
+            return sum(amount * currency.to_base_factor(code) for code, amount in self.by_currency.items())
+
+
+_month_spend = _MonthSpend(db_mysql.get_month_spent_by_currency)
+_stats_cache: Dict[str, Any] = {"at": None, "data": None}
+
+
+def _cached_stats() -> Dict[str, Any]:
+    # Último resultado de /api/stats (o uno nuevo si tiene más de STATE_TTL segundos)
+    if _stats_cache["data"] is None or time.monotonic() - _stats_cache["at"] >= STATE_TTL:
+        get_stats()
+    return _stats_cache["data"]
+
+
+def _budget_crossed_rule(event, engine):
+    """Avisa cuando un gasto de esta API hace superar el presupuesto del mes."""
+    limit = _load_budget_file().get("budget", 0)
+    if limit <= 0 or event.new is None:
+        return None
+    spent = _month_spend.total()
+    delta = _month_spend.base_amount(event.new) - _month_spend.base_amount(event.old)
+    if spent > limit >= spent - delta:
+        return f"Gasto en {event.new.get('category')} supero el presupuesto: {spent} / {limit}"
+    return None
+
+
+# Estado de alertas en memoria: se alimenta de las escrituras de esta API y solo consulta
+# MAX(date) al arrancar o cuando se edita/borra el último gasto.
+_alert_engine = notifications.AlertEngine(
+    rules=[_budget_crossed_rule], last_date_loader=db_mysql.get_last_expense_date
+)
+
+
+def _currency_or_400(code: str) -> str:
+    try:
+        return currency.normalize_currency(code)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _notify(op, old=None, new=None):
+    _month_spend.observe(old, new)
+    _alert_engine.observe(WriteEvent(op, None, old, new, None, None))
+
+
 @app.get("/api/expenses", response_model=List[ExpenseRead])
 def list_expenses():
     return db_mysql.get_all_expenses()
@@ -132,34 +252,43 @@ def get_expense(expense_id: int):
 
 @app.post("/api/expenses", response_model=ExpenseRead, status_code=201)
 def create_expense(expense: ExpenseCreate):
+    expense.currency = _currency_or_400(expense.currency)
     new_id = db_mysql.insert_expense(
         date_=expense.date,
         category=expense.category,
         amount=expense.amount,
         description=expense.description,
+        currency=expense.currency,
     )
+    _notify("add", new=expense.dict())
     return ExpenseRead(id=new_id, **expense.dict())
 
 
 @app.put("/api/expenses/{expense_id}", response_model=ExpenseRead)
 def update_expense(expense_id: int, expense: ExpenseCreate):
+    expense.currency = _currency_or_400(expense.currency)
+    old = db_mysql.get_expense_by_id(expense_id)
     updated = db_mysql.update_expense(
         expense_id=expense_id,
         date_=expense.date,
         category=expense.category,
         amount=expense.amount,
         description=expense.description,
+        currency=expense.currency,
     )
     if not updated:
         raise HTTPException(status_code=404, detail="Expense not found")
+    _notify("set", old=old, new=expense.dict())
     return ExpenseRead(id=expense_id, **expense.dict())
 
 
 @app.delete("/api/expenses/{expense_id}", status_code=204)
 def delete_expense(expense_id: int):
+    old = db_mysql.get_expense_by_id(expense_id)
     deleted = db_mysql.delete_expense(expense_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Expense not found")
+    _notify("del", old=old)
     return
 
 
@@ -216,7 +345,9 @@ def delete_income(income_id: int):
 @app.get("/api/stats")
 def get_stats():
     rows = db_mysql.get_all_expenses()
-    return {"stats": _get_stats_from_rows(rows)}
+    stats = _get_stats_from_rows(rows)
+    _stats_cache["at"], _stats_cache["data"] = time.monotonic(), stats
+    return {"stats": stats}
 
 
 @app.post("/api/budget")
@@ -233,9 +364,8 @@ def budget_status():
     budget_amount = budget_data.get("budget", 0)
     if budget_amount <= 0:
         return {"status": "Sin presupuesto", "budget": 0, "spent": 0, "remaining": 0}
-    rows = db_mysql.get_all_expenses()
-    month_prefix = datetime.now().strftime("%Y-%m")
-    spent = sum(r["amount"] for r in rows if (r.get("date") or "").startswith(month_prefix))
+    spent = _month_spend.total()
+    month_prefix = _month_spend.month
     remaining = max(budget_amount - spent, 0)
     status = "OK" if spent <= budget_amount else "Superado"
     return {
@@ -249,13 +379,12 @@ def budget_status():
 
 @app.get("/api/alerts")
 def alerts():
-    rows = db_mysql.get_all_expenses()
-    stats = _get_stats_from_rows(rows)
-    # alerta inactividad
-    if rows:
-        last_date = max(r["date"] for r in rows if r.get("date"))
-        last_dt = datetime.strptime(last_date, "%Y-%m-%d")
-        diff = (datetime.now() - last_dt).days
+    # Todo sale del estado en memoria; las estadísticas son las últimas calculadas (a lo sumo
+    # STATE_TTL segundos de antigüedad), sin recorrer los gastos en cada llamada
+    # alerta inactividad (fecha del último gasto en memoria)
+    last_date = _alert_engine.last_expense_date()
+    if last_date:
+        diff = (datetime.now() - datetime.strptime(last_date, "%Y-%m-%d")).days
         inactivity = f"No registras gastos hace {diff} dias." if diff >= 3 else "Actividad reciente registrada."
     else:
         inactivity = "No hay gastos registrados."
@@ -264,4 +393,5 @@ def alerts():
     alerts = [inactivity]
     if budget_info["status"] == "Superado":
         alerts.append(f"Presupuesto superado: {budget_info['spent']} / {budget_info['budget']}")
-    return {"alerts": alerts, "stats": stats}
+    alerts.extend(_alert_engine.drain())
+    return {"alerts": alerts, "stats": _cached_stats()}